@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import yaml
+from megatron_train.extract_hydra import run_hydra
+
+
+def blend_overlay(num_entries: int, aux_size: int) -> dict:
+    data_path = []
+    for n in range(num_entries):
+        data_path += [1.0 / num_entries, f"/p/data/blend/shard_{n:06d}_text_document"]
+    return {
+        "megatron": {
+            "data_path": data_path,
+            "aux": {f"key_{n}": {"value": n, "name": f"entry_{n}"} for n in range(aux_size)},
+        }
+    }
+
+
+def time_compose(args: argparse.Namespace, config_yaml: str, mode: str) -> tuple[float, dict]:
+    times = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        cfg = run_hydra(
+            config_path=args.config_path,
+            config_name=args.config_name,
+            cmdline_opts=args.opts,
+            config_yaml=config_yaml,
+            use_cache=False,
+            config_yaml_mode=mode,
+        )
+        times.append(time.perf_counter() - start)
+    return min(times), yaml.safe_load(cfg)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the structured merge and the string override path of --config-yaml on large blends."
+    )
+    parser.add_argument("--config-path", type=str, default="./config")
+    parser.add_argument("--config-name", type=str, default="base")
+    parser.add_argument("--blend-sizes", type=str, default="10,100,1000,4000")
+    parser.add_argument("--aux-size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("opts", nargs="*", default=[])
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'merge [s]':>10} {'overrides [s]':>14} {'speedup':>8} {'same':>5}")
+    for num_entries in map(int, args.blend_sizes.split(",")):
+        config_yaml = yaml.dump(blend_overlay(num_entries, args.aux_size))
+        t_merge, cfg_merge = time_compose(args, config_yaml, "merge")
+        t_overrides, cfg_overrides = time_compose(args, config_yaml, "overrides")
+        print(
+            f"{num_entries:>8} {t_merge:>10.3f} {t_overrides:>14.3f} {t_overrides / t_merge:>8.1f}"
+            f" {str(cfg_merge['megatron'] == cfg_overrides['megatron']):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+import yaml
+from omegaconf import OmegaConf
+
+from megatron_train.blend import parse_blend
+from megatron_train.data_bench import (
+    benchmark_data_pipeline,
+    drop_page_cache,
+    required_tokens_per_s_per_node,
+    synthetic_blend,
+)
+from megatron_train.extract_hydra import run_hydra
+from megatron_train.regression import robust_stats
+from megatron_train.training_log import update_log_state
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how fast one node can read training samples of an experiment's data blend (random "
+        "seq_length+1 token windows from the memory-mapped .bin files, following the blend weights) and compare "
+        "it to the rate the config needs per node."
+    )
+    parser.add_argument("--config-path", type=str, default="./config", help="Path to config directory")
+    parser.add_argument("--config-name", type=str, default="experiments/speed_test_jupiter", help="Experiment config")
+    parser.add_argument("--config-yaml", type=str, default="", help="Additional YAML config to override")
+    parser.add_argument("--config-yaml-mode", choices=["merge", "overrides"], default="merge")
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Reader processes, e.g. GPUs per node x dataloader workers"
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds each worker reads")
+    parser.add_argument("--cold", action="store_true", help="Evict the .bin files from the page cache first")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=None,
+        help="Benchmark this many synthetic shards instead of megatron.data_path (no real data needed)",
+    )
+    parser.add_argument("--synthetic-dir", type=str, default=None, help="Directory of the synthetic shards")
+    parser.add_argument("--synthetic-tokens", type=int, default=2**24, help="Tokens per synthetic shard")
+    parser.add_argument(
+        "--token-throughput",
+        type=float,
+        default=None,
+        help="Measured training tokens/s per GPU (token_throughput of extract_training_times.py)",
+    )
+    parser.add_argument(
+        "--log-file", type=str, default=None, help="Slurm output of a run to take the iteration time from"
+    )
+    parser.add_argument(
+        "--headroom", type=float, default=2.0, help="Flag configs reading less than headroom x the required rate"
+    )
+    parser.add_argument(
+        "opts",
+        nargs="*",
+        default=[],
+        help="Additional arguments to override config (e.g. megatron=llama1.8b slurm.nodes=2)",
+    )
+    args = parser.parse_args()
+
+    config_yaml = run_hydra(
+        config_path=args.config_path,
+        config_name=args.config_name,
+        cmdline_opts=args.opts,
+        config_yaml=args.config_yaml,
+        config_yaml_mode=args.config_yaml_mode,
+    )
+    config = OmegaConf.create(yaml.safe_load(config_yaml))
+    OmegaConf.resolve(config)
+    config = OmegaConf.to_container(config)
+
+    megatron_cfg = config["megatron"]
+    seq_length = megatron_cfg["seq_length"]
+    global_batch_size = megatron_cfg.get("global_batch_size") or config["global_batch_size"]
+    nodes, gpus_per_node = config["slurm"]["nodes"], config["slurm"]["gpus_per_node"]
+
+    if args.synthetic:
+        directory = args.synthetic_dir or tempfile.mkdtemp(prefix="synthetic_blend_")
+        prefixes = synthetic_blend(directory, args.synthetic, args.synthetic_tokens)
+        weights = None
+        print(f"Synthetic blend: {len(prefixes)} shards in {directory}")
+    else:
+        prefixes, weights = parse_blend(megatron_cfg.get("data_path"))
+        if not prefixes:
+            parser.error("megatron.data_path is not set, use --synthetic")
+    if args.cold:
+        drop_page_cache(prefixes)
+
+    result = benchmark_data_pipeline(prefixes, weights, seq_length, workers=args.workers, duration=args.duration)
+    print(
+        f"{result.workers} workers read {result.samples} samples: "
+        f"{result.samples_per_s:.1f} samples/s, {result.tokens_per_s:.0f} tokens/s"
+    )
+
+    required = None
+    if args.token_throughput is not None:
+        required = args.token_throughput * gpus_per_node
+    elif args.log_file is not None:
+        itertime_ms = robust_stats(update_log_state(args.log_file).itertimes, warmup=1).median
+        if np.isnan(itertime_ms):
+            parser.error(f"No iterations in {args.log_file}")
+        required = required_tokens_per_s_per_node(global_batch_size, seq_length, itertime_ms, nodes)
+    if required is None:
+        return
+
+    ratio = result.tokens_per_s / required
+    print(f"Required: {required:.0f} tokens/s per node, storage delivers {ratio:.2f}x")
+    if ratio < 1:
+        print("INPUT-BOUND: the storage cannot keep up with the training throughput")
+        sys.exit(1)
+    elif ratio < args.headroom:
+        print(f"WARNING: less than {args.headroom}x headroom, the data pipeline may stall the training")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import asyncio
+
+from megatron_train.early_stop import add_early_stop_args, early_stop_settings
+from megatron_train.job_log import watch_speed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End a speed test once its iteration time converged: writes the steady-state statistics to the "
+        "output dir, sends the stop signal (Megatron's exit_signal_handler exits cleanly) and cancels the job if it "
+        "does not exit. Runs as a sidecar of the batch script (early_stop=speed_test)."
+    )
+    parser.add_argument("--jobid", type=str, required=True, help="Slurm job id")
+    parser.add_argument("--log", type=str, required=True, help="StdOut file of the job")
+    parser.add_argument("--output-dir", type=str, default=None, help="Directory of the statistics (default: log dir)")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls of the log")
+    add_early_stop_args(parser)
+    args = parser.parse_args()
+
+    asyncio.run(
+        watch_speed(
+            args.jobid,
+            early_stop_settings(args),
+            stdout=args.log,
+            output_dir=args.output_dir,
+            interval=args.interval,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,32 @@
 import pandas as pd
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
 import os
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal
 import numpy as np
 import yaml
 import doctest
 import re
+import sys
+import json
+from megatron_train.cache import get_cache_dir, hash_key
+from megatron_train.early_stop import read_early_stop
+from megatron_train.flops import model_flops_utilization
+from megatron_train.registry import Registry, log_status, parse_since, parse_where
+from megatron_train.regression import BaselineStore, benchmark_key, container_image, regression_report, robust_stats
+from megatron_train.startup import STARTUP_PHASES, parse_startup, startup_breakdown
+from megatron_train.training_log import LogIndex, LogState, new_log_state, update_log_state
 
 
-def apply_acc(typ: Literal["mean", "median", "max", "min"], ar: np.ndarray):
+def apply_acc(typ: Literal["mean", "median", "max", "min", "last", "sum"], ar: np.ndarray):
     if len(ar) == 0:
-        return np.array([np.nan])
-    if typ == "mean":
+        return np.nan
+    if typ == "last":
+        return ar[-1]
+    elif typ == "sum":
+        return np.sum(ar)
+    elif typ == "mean":
         return np.mean(ar)
     elif typ == "median":
         return np.median(ar)
@@ -69,6 +83,173 @@ def flatten_dict(cfg: dict, sep="."):
     return cfg_flat
 
 
+def extract_metric(state: LogState, metric: str, red_type: str) -> float:
+    """
+    Reduces a metric column of the iteration (or memory) table, metric is `column` or `column:reduction`.
+    """
+    column, _, red = metric.partition(":")
+    table = state.iterations if column in state.iterations.columns else state.memory
+    values = table.get(column)
+    values = values[~np.isnan(values)]
+    return float(apply_acc(red or red_type, values))
+
+
+def registry_update(
+    exppath: Path, logfile: Path, state: LogState, cfg: dict, res_dict: dict | None = None
+) -> dict[str, Any]:
+    """
+    Status and metrics of a run for Registry.update_run.
+    """
+    metrics = {"iterations": len(state.itertimes), "num_params": state.num_params}
+    metrics.update({column: res_dict[key] for column, key in METRIC_KEYS.items() if res_dict and key in res_dict})
+    return {
+        "output_dir": str(exppath),
+        # early-stopped speed tests end before train_iters once their iteration time converged
+        "status": "completed" if read_early_stop(exppath) else log_status(state),
+        "log_file": str(logfile),
+        "jobid": logfile.name[:-4],
+        "metrics": metrics,
+        "config": cfg,
+    }
+
+
+def process_experiment(
+    args: Namespace,
+    exppath: Path,
+    log_states: dict[str, LogState],
+    columns_dir: str | Path | None = None,
+    cfg_nested: dict | None = None,
+) -> tuple[list | None, dict[str, LogState], dict[str, Any] | None]:
+    """
+    Extracts the configured values and the iteration time of a single experiment directory.
+    Returns the record (or None), the updated log parse states and the registry update (or None).
+    Without cfg_nested (e.g. from the registry), the config file of the directory is loaded.
+    """
+    if not os.path.isdir(exppath):
+        return None, {}, None
+    if cfg_nested is None:
+        cfgfile = [cfgfile for cfgfile in os.listdir(exppath) if re.match(args.cfg_file, cfgfile)]
+
+        if not cfgfile:
+            print(f"Missing config file in {exppath}")
+            return None, {}, None
+        cfgfile = exppath / cfgfile[0]
+        with open(cfgfile) as fp:
+            cfg_nested = yaml.safe_load(fp)
+
+    cfg = flatten_dict(cfg_nested, sep=".")
+
+    res_dict = {
+        key: cfg[key] if key in cfg else cfg["megatron." + key]
+        for key in args.extract_config.split(",")
+        if key in cfg or "megatron." + key in cfg
+    }
+
+    print(os.listdir(exppath))
+
+    logfile = [logfile for logfile in os.listdir(exppath) if re.match(args.log_file, logfile)]
+    if not logfile:
+        return None, {}, None
+    logfile = exppath / logfile[0]
+    state = update_log_state(logfile, log_states.get(str(logfile)) or new_log_state(logfile, columns_dir))
+    try:
+        itertimes = np.array(state.itertimes)
+
+        if state.num_params is not None:
+            res_dict["num_params"] = state.num_params
+        else:
+            res_dict["num_params"] = float("nan")
+
+        # the benchmark suite reports runs without iterations as failures
+        if len(itertimes) == 0 and not (args.show_failed or args.baselines):
+            run = registry_update(exppath, logfile, state, cfg_nested)
+            state.drop_columns()
+            return None, {str(logfile): state}, run
+
+        res_dict["itertime"] = float(apply_acc(args.red_type, itertimes))
+        res_dict["batch_size_per_device"] = res_dict["global_batch_size"] / res_dict["slurm.total_gpus"]
+
+        res_dict["token_throughput"] = (
+            1000 * res_dict["batch_size_per_device"] * res_dict["seq_length"] / res_dict["itertime"]
+        )
+        res_dict["slurmid"] = os.path.split(logfile)[1][:-4]
+        if not args.no_flops:
+            res_dict.update(flops_columns(args, cfg_nested, res_dict))
+        if args.baselines:
+            stats = robust_stats(itertimes, warmup=args.benchmark_warmup)
+            res_dict["benchmark_key"] = benchmark_key(cfg_nested)
+            res_dict["itertime_median"] = stats.median
+            res_dict["itertime_noise"] = stats.noise
+            res_dict["itertime_count"] = stats.count
+            res_dict["image"] = container_image(cfg_nested)
+        if args.startup:
+            res_dict.update(startup_breakdown(parse_startup(logfile)))
+            res_dict["image"] = container_image(cfg_nested)
+        for metric in metric_names(args):
+            res_dict[metric] = extract_metric(state, metric, args.red_type)
+        if args.export_metrics:
+            export_metrics(state, Path(args.export_metrics) / f"{exppath.name}_{res_dict['slurmid']}.npz")
+        cols = result_columns(args)
+        print(res_dict)
+        run = registry_update(exppath, logfile, state, cfg_nested, res_dict)
+        state.drop_columns()
+        return [res_dict[col] for col in cols], {str(logfile): state}, run
+
+    except KeyError:
+        run = registry_update(exppath, logfile, state, cfg_nested)
+        state.drop_columns()
+        return None, {str(logfile): state}, run
+
+
+FLOPS_COLUMNS = ["model_tflops_per_gpu", "mfu", "hfu"]
+# registry metric columns and the record keys they are taken from
+METRIC_KEYS = {"itertime_ms": "itertime", "token_throughput": "token_throughput", **{col: col for col in FLOPS_COLUMNS}}
+BENCHMARK_COLUMNS = ["benchmark_key", "itertime_median", "itertime_noise", "itertime_count", "image"]
+
+
+def flops_columns(args: Namespace, cfg: dict, res_dict: dict) -> dict[str, float]:
+    """
+    Achieved model TFLOP/s per GPU and MFU/HFU against the peak of the cluster (slurm.peak_tflops_per_gpu).
+    """
+    peak = (cfg.get("slurm") or {}).get("peak_tflops_per_gpu") or args.peak_tflops
+    try:
+        return model_flops_utilization(
+            cfg["megatron"],
+            res_dict["itertime"],
+            res_dict["slurm.total_gpus"],
+            peak,
+            global_batch_size=res_dict["global_batch_size"],
+        )
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return {col: float("nan") for col in FLOPS_COLUMNS}
+
+
+def result_columns(args: Namespace) -> list[str]:
+    columns = (
+        args.extract_config.split(",")
+        + ["token_throughput"]
+        + ([] if args.no_flops else FLOPS_COLUMNS)
+        + metric_names(args)
+        + (BENCHMARK_COLUMNS if args.baselines else [])
+        + (STARTUP_PHASES + ["image"] if args.startup else [])
+    )
+    # image is part of the benchmark and the startup columns
+    return list(dict.fromkeys(columns))
+
+
+def metric_names(args: Namespace) -> list[str]:
+    return [metric for metric in args.extract_metrics.split(",") if metric]
+
+
+def export_metrics(state: LogState, path: Path):
+    """
+    Writes the iteration and memory columns of a run to a compressed npz file (keys iter/<column>, mem/<column>).
+    """
+    arrays = {f"iter/{key}": val for key, val in state.iterations.to_arrays().items()}
+    arrays.update({f"mem/{key}": val for key, val in state.memory.to_arrays().items()})
+    np.savez_compressed(path, **arrays)
+
+
 def main():
     parser = ArgumentParser()
     parser.add_argument("--base-dir", type=str, help="Experiments directory to get running times from")
@@ -82,10 +263,87 @@ def main():
         type=str,
         default="aux.model_name,slurmid,micro_batch_size,global_batch_size,seq_length,num_params,slurm.total_gpus",
     )
+    parser.add_argument(
+        "--log-index",
+        type=str,
+        default=None,
+        help="File storing parse offsets of the logs, such that only appended output is parsed on re-runs "
+        "(default: in the megatron_train cache dir, per base dir)",
+    )
+    parser.add_argument("--no-log-index", action="store_true", help="Always parse the full logs")
+    parser.add_argument(
+        "--registry",
+        type=str,
+        default=None,
+        help="Experiment registry (SQLite) to update with the status and metrics of the runs "
+        "(default: in the megatron_train cache dir)",
+    )
+    parser.add_argument("--no-registry", action="store_true", help="Do not update the experiment registry")
+    parser.add_argument(
+        "--from-registry",
+        action="store_true",
+        help="Select the runs from the registry (with the filters below) instead of walking --base-dir",
+    )
+    parser.add_argument("--model", type=str, default=None, help="Registry filter: aux.model_name")
+    parser.add_argument("--gpus", type=int, default=None, help="Registry filter: slurm.total_gpus")
+    parser.add_argument("--since", type=str, default=None, help="Registry filter: submitted within (7d, 12h) or since")
+    parser.add_argument("--status", type=str, default=None, help="Registry filter: status, e.g. incomplete")
+    parser.add_argument("--config-hash", type=str, default=None, help="Registry filter: config hash")
+    parser.add_argument(
+        "--where", type=str, action="append", default=[], help="Further registry filters column=value, e.g. tp=2"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes parsing experiments")
+    parser.add_argument(
+        "--extract-metrics",
+        type=str,
+        default="",
+        help="Additional iteration/memory log columns as column[:reduction], "
+        "e.g. tflops_per_gpu,lm_loss:last,grad_norm:max,nan_iterations:max,max_allocated_mb:max",
+    )
+    parser.add_argument("--export-metrics", type=str, default=None, help="Directory to write per-run metric columns")
+    parser.add_argument(
+        "--peak-tflops",
+        type=float,
+        default=None,
+        help="Peak TFLOP/s per GPU for MFU, if the run's config has no slurm.peak_tflops_per_gpu",
+    )
+    parser.add_argument("--no-flops", action="store_true", help="Do not report model TFLOP/s and MFU")
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Report the time-to-first-iteration breakdown (queue wait, staging, launch, init, setup) per job",
+    )
+    parser.add_argument(
+        "--baselines",
+        type=str,
+        default=None,
+        help="Benchmark suite mode: compare the runs to the baselines in this JSON file "
+        "(per model, cluster, GPU count and parallel layout) and exit non-zero on regressions",
+    )
+    parser.add_argument("--update-baselines", action="store_true", help="Add the runs to the baselines")
+    parser.add_argument("--regression-report", type=str, default=None, help="Write the regression report as JSON")
+    parser.add_argument(
+        "--regression-tolerance", type=float, default=0.03, help="Minimal relative slowdown counted as regression"
+    )
+    parser.add_argument(
+        "--noise-factor", type=float, default=3.0, help="Regression threshold in units of the relative noise (MAD)"
+    )
+    parser.add_argument(
+        "--benchmark-warmup", type=int, default=1, help="Logged iterations skipped for the benchmark statistics"
+    )
 
     args = parser.parse_args()
 
     base_dir = args.base_dir
+    if base_dir is None and not args.from_registry:
+        parser.error("--base-dir or --from-registry is required")
+
+    if args.no_log_index:
+        log_index = LogIndex()
+    else:
+        # the registry selection spans base dirs, it shares one index per registry
+        index_key = hash_key("registry", str(args.registry)) if args.from_registry else os.path.abspath(base_dir)
+        log_index = LogIndex(args.log_index or get_cache_dir("training_logs") / f"{hash_key(index_key)[:16]}.json")
 
     # col_names = []
 
@@ -103,68 +361,66 @@ def main():
     #     "num_gpus",
     #     "token_throughput",
     # ]
-    cols = args.extract_config.split(",") + ["token_throughput"]
-
-    print([re.match(args.exp_dir_regex, log_dir) for log_dir in os.listdir(base_dir)])
+    cols = result_columns(args)
+    if args.export_metrics:
+        os.makedirs(args.export_metrics, exist_ok=True)
 
-    for log_dir in os.listdir(base_dir):
-        if not re.match(args.exp_dir_regex, log_dir):
-            print(f"Skipped: {log_dir}")
-            continue
-        else:
-            print(f"Taking: {log_dir}")
-        exppath = Path(base_dir) / log_dir
-        if os.path.isdir(exppath):
-            cfgfile = [cfgfile for cfgfile in os.listdir(exppath) if re.match(args.cfg_file, cfgfile)]
+    # experiment directories and their configs (None: loaded from the directory)
+    experiments: list[tuple[Path, dict | None]] = []
+    if args.from_registry:
+        # only the selected runs are opened, no walk over the base dir
+        try:
+            with Registry(args.registry) as registry:
+                selected = registry.query(
+                    model_name=args.model,
+                    total_gpus=args.gpus,
+                    since=parse_since(args.since) if args.since else None,
+                    status=args.status,
+                    config_hash=args.config_hash,
+                    where=parse_where(args.where),
+                )
+                for run in selected:
+                    print(f"Taking: {run['output_dir']}")
+                    experiments.append((Path(run["output_dir"]), registry.config(run["output_dir"])))
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        print([re.match(args.exp_dir_regex, log_dir) for log_dir in os.listdir(base_dir)])
 
-            if not cfgfile:
-                print(f"Missing config file in {exppath}")
+        for log_dir in os.listdir(base_dir):
+            if not re.match(args.exp_dir_regex, log_dir):
+                print(f"Skipped: {log_dir}")
                 continue
-            cfgfile = exppath / cfgfile[0]
-            with open(cfgfile) as fp:
-                cfg = yaml.safe_load(fp)
+            else:
+                print(f"Taking: {log_dir}")
+            experiments.append((Path(base_dir) / log_dir, None))
 
-            cfg = flatten_dict(cfg, sep=".")
-
-            res_dict = {
-                key: cfg[key] if key in cfg else cfg["megatron." + key]
-                for key in args.extract_config.split(",")
-                if key in cfg or "megatron." + key in cfg
-            }
-
-            print(os.listdir(exppath))
-
-            logfile = [logfile for logfile in os.listdir(exppath) if re.match(args.log_file, logfile)]
-            if logfile:
-                logfile = exppath / logfile[0]
-                with open(logfile) as fp:
-                    log = fp.read()
-                try:
-                    itertimes = re.findall(r"elapsed time per iteration \(ms\): (\d+\.\d+)", log)
-                    itertimes = np.array([float(itertime) for itertime in itertimes])
-
-                    num_params = re.findall(r"Total number of parameters in billions: (\d+\.\d+)", log)
-
-                    if num_params:
-                        res_dict["num_params"] = num_params[0]
-                    else:
-                        res_dict["num_params"] = float("nan")
-
-                    if len(itertimes) == 0 and not args.show_failed:
-                        continue
-
-                    res_dict["itertime"] = float(apply_acc(args.red_type, itertimes))
-                    res_dict["batch_size_per_device"] = res_dict["global_batch_size"] / res_dict["slurm.total_gpus"]
-
-                    res_dict["token_throughput"] = (
-                        1000 * res_dict["batch_size_per_device"] * res_dict["seq_length"] / res_dict["itertime"]
-                    )
-                    res_dict["slurmid"] = os.path.split(logfile)[1][:-4]
-                    recs.append([res_dict[col] for col in cols])
-                    print(res_dict)
-
-                except KeyError:
-                    pass
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # each worker only needs the parse states of its own experiment directory
+        futures = [
+            pool.submit(
+                process_experiment,
+                args,
+                exppath,
+                {path: state for path, state in log_index.states.items() if Path(path).parent == exppath},
+                log_index.columns_dir,
+                cfg_nested,
+            )
+            for exppath, cfg_nested in experiments
+        ]
+        runs = []
+        for future in futures:
+            rec, log_states, run = future.result()
+            log_index.update(log_states)
+            if rec is not None:
+                recs.append(rec)
+            if run is not None:
+                runs.append(run)
+    log_index.save()
+    if not args.no_registry:
+        with Registry(args.registry) as registry:
+            for run in runs:
+                registry.update_run(**run)
 
     print(recs)
     df = pd.DataFrame(data=recs, columns=cols).sort_values(
@@ -173,6 +429,27 @@ def main():
 
     print(df)
 
+    if args.baselines:
+        report = regression_report(
+            df.to_dict("records"),
+            BaselineStore(args.baselines),
+            tolerance=args.regression_tolerance,
+            noise_factor=args.noise_factor,
+            update=args.update_baselines,
+        )
+        print(
+            pd.DataFrame(
+                report["results"],
+                columns=["key", "status", "baseline_ms", "itertime_ms", "rel_change", "threshold", "slurmid"],
+            ).to_string()
+        )
+        print("PASSED" if report["passed"] else "REGRESSION")
+        if args.regression_report:
+            with open(args.regression_report, "w") as fp:
+                json.dump(report, fp, indent=1)
+        if not report["passed"]:
+            sys.exit(1)
+
 
 if __name__ == "__main__":
     doctest.testmod(verbose=False)
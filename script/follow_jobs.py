@@ -0,0 +1,35 @@
+import argparse
+
+from megatron_train.job_log import follow
+from megatron_train.watchdog import add_watchdog_args, watchdog_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Follow the logs of several slurm jobs and show their throughput and ETA live"
+    )
+    parser.add_argument("jobids", nargs="+", help="Slurm job ids")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between polls of the log files")
+    parser.add_argument("--slurm-interval", type=float, default=15.0, help="Seconds between slurm queries")
+    parser.add_argument("--window", type=int, default=20, help="Number of logged iterations for the rolling stats")
+    parser.add_argument("--scontrol", type=str, default="scontrol", help="scontrol command")
+    parser.add_argument("--squeue", type=str, default="squeue", help="squeue command")
+    parser.add_argument(
+        "--watchdog", action="store_true", help="Diagnose and cancel running jobs that stop printing iterations"
+    )
+    add_watchdog_args(parser)
+    args = parser.parse_args()
+
+    follow(
+        args.jobids,
+        interval=args.interval,
+        slurm_interval=args.slurm_interval,
+        window=args.window,
+        scontrol_cmd=args.scontrol,
+        squeue_cmd=args.squeue,
+        watchdog=watchdog_settings(args) if args.watchdog else None,
+    )
+
+
+if __name__ == "__main__":
+    main()
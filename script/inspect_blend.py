@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+from dataclasses import asdict
+
+import yaml
+from omegaconf import OmegaConf
+
+from megatron_train.blend import IndexStatsCache, format_blend_table, inspect_blend
+from megatron_train.extract_hydra import run_hydra
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check the megatron.data_path blend of an experiment: whether each prefix exists, its documents "
+        "and tokens (from the memory-mapped .idx files) and how many epochs of its train split the run consumes."
+    )
+    parser.add_argument("--config-path", type=str, default="./config", help="Path to config directory")
+    parser.add_argument("--config-name", type=str, default="experiments/speed_test_jupiter", help="Experiment config")
+    parser.add_argument("--config-yaml", type=str, default="", help="Additional YAML config to override")
+    parser.add_argument("--config-yaml-mode", choices=["merge", "overrides"], default="merge")
+    parser.add_argument("--workers", type=int, default=None, help="Threads reading the index files")
+    parser.add_argument("--stats-cache", type=str, default=None, help="Cache file of the index statistics")
+    parser.add_argument("--json", action="store_true", help="Print the components as JSON")
+    parser.add_argument(
+        "opts",
+        nargs="*",
+        default=[],
+        help="Additional arguments to override config (e.g. megatron=llama1.8b slurm.nodes=2)",
+    )
+    args = parser.parse_args()
+
+    config_yaml = run_hydra(
+        config_path=args.config_path,
+        config_name=args.config_name,
+        cmdline_opts=args.opts,
+        config_yaml=args.config_yaml,
+        config_yaml_mode=args.config_yaml_mode,
+    )
+    config = OmegaConf.create(yaml.safe_load(config_yaml))
+    OmegaConf.resolve(config)
+    config = OmegaConf.to_container(config)
+
+    components = inspect_blend(
+        config["megatron"],
+        global_batch_size=config["global_batch_size"],
+        workers=args.workers,
+        cache=IndexStatsCache(args.stats_cache),
+    )
+    if args.json:
+        print(json.dumps([asdict(component) for component in components], indent=1))
+    else:
+        print(format_blend_table(components))
+    if not components or not all(component.stats.ok for component in components):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
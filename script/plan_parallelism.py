@@ -0,0 +1,137 @@
+import argparse
+import sys
+
+import pandas as pd
+import yaml
+from omegaconf import OmegaConf
+
+from megatron_train.extract_hydra import run_hydra
+from megatron_train.planner import Hardware, plan_layouts
+from run_megatron import get_parser as get_run_megatron_parser, run_sweep
+
+
+def parse_recompute(value: str) -> list[str | None]:
+    return [None if choice in ["none", "null"] else choice for choice in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enumerate valid TP/PP/CP/EP/micro-batch/recompute layouts for a model on a slurm cluster config, "
+        "rank them with an analytic compute + communication cost model and emit the best ones."
+    )
+    parser.add_argument("--config-path", type=str, default="./config", help="Path to config directory")
+    parser.add_argument(
+        "--config-name", type=str, default="experiments/speed_test_jupiter", help="Experiment config to plan for"
+    )
+    parser.add_argument("--config-yaml", type=str, default="", help="Additional YAML config to override")
+    parser.add_argument("--config-yaml-mode", choices=["merge", "overrides"], default="merge")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--global-batch-size", type=int, default=None, help="Fixed global batch size (default: from the config)"
+    )
+    parser.add_argument(
+        "--max-gpu-mem", type=float, default=None, help="Memory budget per GPU in GiB (default: slurm.gpu_memory_gib)"
+    )
+    parser.add_argument("--micro-batch-sizes", type=str, default="1,2,4,8")
+    parser.add_argument("--recompute", type=str, default="none,selective,full", help="Recompute granularities")
+    parser.add_argument("--max-pp", type=int, default=None)
+    parser.add_argument("--max-cp", type=int, default=8)
+    parser.add_argument("--compute-efficiency", type=float, default=0.6, help="Fraction of the peak reached by GEMMs")
+    parser.add_argument(
+        "--emit",
+        choices=["overrides", "sbatch"],
+        default="overrides",
+        help="Print hydra override sets or render speed-test sbatch scripts as one run_megatron.py sweep",
+    )
+    parser.add_argument("--run", action="store_true", help="Submit the rendered sbatch scripts (with --emit sbatch)")
+    parser.add_argument(
+        "--array", action="store_true", help="Submit the layouts as slurm array job(s) (with --emit sbatch)"
+    )
+    parser.add_argument(
+        "opts",
+        nargs="*",
+        default=[],
+        help="Additional arguments to override config (e.g. megatron=llama1.8b slurm.nodes=2)",
+    )
+    args = parser.parse_args()
+
+    config_yaml = run_hydra(
+        config_path=args.config_path,
+        config_name=args.config_name,
+        cmdline_opts=args.opts,
+        config_yaml=args.config_yaml,
+        config_yaml_mode=args.config_yaml_mode,
+    )
+    config = OmegaConf.create(yaml.safe_load(config_yaml))
+    OmegaConf.resolve(config)
+    config = OmegaConf.to_container(config)
+
+    megatron_cfg = config["megatron"]
+    world_size = config["slurm"]["total_gpus"]
+    global_batch_size = args.global_batch_size or megatron_cfg.get("global_batch_size") or config["global_batch_size"]
+    hardware = Hardware.from_slurm_config(config["slurm"], compute_efficiency=args.compute_efficiency)
+    for key in ["peak_tflops_per_gpu", "intra_node_bandwidth_gbs", "inter_node_bandwidth_gbs"]:
+        if getattr(hardware, key) is None:
+            parser.error(f"slurm.{key} is not set in the config")
+    if args.max_gpu_mem is None and hardware.gpu_memory_gib is None:
+        parser.error("Set slurm.gpu_memory_gib or --max-gpu-mem")
+
+    plans = plan_layouts(
+        megatron_cfg,
+        world_size,
+        global_batch_size,
+        hardware,
+        max_gpu_mem=args.max_gpu_mem,
+        micro_batch_sizes=[int(mbs) for mbs in args.micro_batch_sizes.split(",")],
+        recompute_choices=parse_recompute(args.recompute),
+        max_pp=args.max_pp,
+        max_cp=args.max_cp,
+    )
+    print(f"{len(plans)} layouts fit on {world_size} GPUs with global batch size {global_batch_size}")
+    if not plans:
+        sys.exit(1)
+    plans = plans[: args.top_k]
+
+    tokens_per_iteration = global_batch_size * megatron_cfg["seq_length"]
+    print(
+        pd.DataFrame(
+            [
+                {
+                    "tp": plan.layout.tp,
+                    "pp": plan.layout.pp,
+                    "cp": plan.layout.cp,
+                    "ep": plan.layout.ep,
+                    "mbs": plan.layout.micro_batch_size,
+                    "recompute": plan.layout.recompute or "none",
+                    "itertime_ms": 1000 * plan.cost.total,
+                    "compute_ms": 1000 * plan.cost.compute,
+                    "bubble_ms": 1000 * plan.cost.bubble,
+                    "comm_ms": 1000 * (plan.cost.total - plan.cost.compute - plan.cost.bubble),
+                    "tokens_per_s_per_gpu": tokens_per_iteration / plan.cost.total / world_size,
+                    "memory_gib": plan.memory_gib,
+                }
+                for plan in plans
+            ]
+        ).to_string(float_format="%.1f")
+    )
+
+    points = []
+    for n, plan in enumerate(plans):
+        overrides = plan.layout.hydra_overrides(global_batch_size)
+        if args.emit == "overrides":
+            print(" ".join(overrides))
+        else:
+            print(f"Plan {n}: {' '.join(overrides)}")
+            points.append(args.opts + overrides)
+    if points:
+        # a single sweep: one hydra initialization and schema load, distinct output directories and a manifest
+        sweep_args = ["--sweep", "--config-path", args.config_path, "--config-name", args.config_name]
+        sweep_args += ["--config-yaml", args.config_yaml, "--config-yaml-mode", args.config_yaml_mode]
+        if args.max_gpu_mem is not None:
+            sweep_args += ["--max-gpu-mem", str(args.max_gpu_mem)]
+        sweep_args += ["--run"] * args.run + ["--array"] * args.array
+        run_sweep(get_run_megatron_parser().parse_args(sweep_args + args.opts), points)
+
+
+if __name__ == "__main__":
+    main()
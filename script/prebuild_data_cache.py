@@ -0,0 +1,73 @@
+import argparse
+import logging
+
+import yaml
+from omegaconf import OmegaConf
+
+from megatron_train.data_cache import init_megatron_args, megatron_cmdline, prebuild_data_cache
+from megatron_train.extract_hydra import run_hydra
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the Megatron GPT dataset index caches (document/sample/shuffle and blending indices) of an "
+        "experiment into megatron.data_cache_path on a CPU node, before submitting the job. Needs Megatron-LM and "
+        "torch, e.g. run it in the training container with PYTHONPATH=src:Megatron-LM."
+    )
+    parser.add_argument("--config-path", type=str, default="./config", help="Path to config directory")
+    parser.add_argument("--config-name", type=str, default="experiments/speed_test_jupiter", help="Experiment config")
+    parser.add_argument("--config-yaml", type=str, default="", help="Additional YAML config to override")
+    parser.add_argument("--config-yaml-mode", choices=["merge", "overrides"], default="merge")
+    parser.add_argument(
+        "--world-size",
+        type=int,
+        default=None,
+        help="Number of GPUs of the job, determines the data parallel size (default: slurm.total_gpus)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Threads building the blend components (default: megatron.num_dataset_builder_threads)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only print the Megatron arguments")
+    parser.add_argument(
+        "opts",
+        nargs="*",
+        default=[],
+        help="Additional arguments to override config (e.g. megatron=llama1.8b slurm.nodes=2)",
+    )
+    args = parser.parse_args()
+
+    config_yaml = run_hydra(
+        config_path=args.config_path,
+        config_name=args.config_name,
+        cmdline_opts=args.opts,
+        config_yaml=args.config_yaml,
+        config_yaml_mode=args.config_yaml_mode,
+    )
+    config = OmegaConf.create(yaml.safe_load(config_yaml))
+    OmegaConf.resolve(config)
+    config = OmegaConf.to_container(config)
+
+    megatron_cfg = config["megatron"]
+    if megatron_cfg.get("mock_data"):
+        print("megatron.mock_data is set, there is nothing to cache")
+        return
+    if not megatron_cfg.get("data_cache_path"):
+        print("WARNING: megatron.data_cache_path is not set, Megatron caches next to each data prefix")
+
+    cmdline_args = megatron_cmdline(megatron_cfg)
+    world_size = args.world_size or config["slurm"]["total_gpus"]
+    print(f"World size {world_size}, Megatron arguments: {' '.join(cmdline_args)}")
+    if args.dry_run:
+        return
+
+    logging.basicConfig(level=logging.INFO)
+    megatron_args = init_megatron_args(cmdline_args, world_size)
+    result = prebuild_data_cache(megatron_args, num_workers=args.workers)
+    print(yaml.safe_dump(result, sort_keys=False))
+
+
+if __name__ == "__main__":
+    main()
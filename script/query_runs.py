@@ -0,0 +1,67 @@
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+from megatron_train.registry import Registry, parse_since, parse_where
+
+DEFAULT_COLUMNS = (
+    "jobid,model_name,cluster,total_gpus,tp,pp,cp,ep,micro_batch_size,global_batch_size,status,itertime_ms,"
+    "token_throughput,mfu,output_dir"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Query the experiment registry written by run_megatron.py (submissions) and "
+        "extract_training_times.py (status and metrics), e.g. --model llama1.8b --gpus 64 --since 7d --sort mfu"
+    )
+    parser.add_argument("--registry", type=str, default=None, help="Registry file (default: megatron_train cache)")
+    parser.add_argument("--model", type=str, default=None, help="aux.model_name")
+    parser.add_argument("--gpus", type=int, default=None, help="slurm.total_gpus")
+    parser.add_argument("--since", type=str, default=None, help="Submitted within (e.g. 7d, 12h) or since a date")
+    parser.add_argument("--status", type=str, default=None, help="submitted, started, incomplete or completed")
+    parser.add_argument("--config-hash", type=str, default=None, help="Config hash of run_megatron.py")
+    parser.add_argument(
+        "--where", type=str, action="append", default=[], help="Further column=value filters, e.g. tp=2"
+    )
+    parser.add_argument("--sort", type=str, default="submitted_at", help="Column to sort by, e.g. mfu")
+    parser.add_argument("--ascending", action="store_true")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--columns", type=str, default=DEFAULT_COLUMNS, help="Comma-separated columns to print")
+    parser.add_argument("--json", action="store_true", help="Print all columns of the runs as JSON")
+    args = parser.parse_args()
+
+    try:
+        where = parse_where(args.where)
+    except ValueError as e:
+        parser.error(f"--where: {e}")
+
+    with Registry(args.registry) as registry:
+        try:
+            runs = registry.query(
+                model_name=args.model,
+                total_gpus=args.gpus,
+                since=parse_since(args.since) if args.since else None,
+                status=args.status,
+                config_hash=args.config_hash,
+                where=where,
+                order_by=args.sort,
+                descending=not args.ascending,
+                limit=args.limit,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.json:
+        json.dump(runs, sys.stdout, indent=1)
+        print()
+        return
+    columns = [column for column in args.columns.split(",") if column]
+    with pd.option_context("display.max_rows", None, "display.width", None):
+        print(pd.DataFrame(runs, columns=columns).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import yaml
-from megatron_train.config import get_megatron_parser, get_args_and_types, get_choices_arg, get_help
+from megatron_train.config import get_megatron_schema, get_args_and_types
 import argparse
 import re
 import enum
@@ -27,7 +27,7 @@ def main():
         override.split("=")[0]: to_value(override.split("=")[1]) for override in args.override_defaults
     }
 
-    megatron_parser = get_megatron_parser()
+    megatron_parser = get_megatron_schema()
     megatron_config = get_args_and_types(
         megatron_parser, exclude_args=args.exclude_args.split(","), override_defaults=override_defaults
     )
@@ -37,20 +37,18 @@ def main():
 
     megatron_cfgyaml = yaml.dump(megatron_config)
 
-    # add comments on options
-    for key in megatron_config:
-        choices = get_choices_arg(megatron_parser, key)
-        helpstr = get_help(megatron_parser, key)
-        if choices is not None or helpstr:
-            match = re.search(key + ":" + ".*", megatron_cfgyaml, flags=re.MULTILINE)
-            if match:
-                megatron_cfgyaml = (
-                    megatron_cfgyaml[: match.end()]
-                    + "  # "
-                    + (f"choices: {choices}, " if choices else "")
-                    + f"{helpstr}"
-                    + megatron_cfgyaml[match.end() :]
-                )
+    # add comments on options, in a single pass over the top-level keys of the dumped yaml
+    index = megatron_parser.index
+    lines = megatron_cfgyaml.split("\n")
+    for n, line in enumerate(lines):
+        match = re.match(r"^(\w+):", line)
+        if match and match.group(1) in megatron_config:
+            key = match.group(1)
+            choices = index.choices.get(key)
+            helpstr = index.help.get(key)
+            if choices is not None or helpstr:
+                lines[n] = line + "  # " + (f"choices: {choices}, " if choices else "") + f"{helpstr}"
+    megatron_cfgyaml = "\n".join(lines)
 
     with open(args.base_config_file, "w") as fp:
         fp.write(megatron_cfgyaml)
@@ -1,20 +1,32 @@
 # import modelopt.torch.quantization  # noqa
-from megatron_train.config import get_cmdline_args, get_args_and_types, get_megatron_parser
+from megatron_train.config import get_cmdline_args, get_args_and_types, get_megatron_schema, set_megatron_schema
 
 
 import argparse
+import json
 import os
 import sys
 import yaml
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import make_dataclass, field, dataclass, fields, MISSING
 from omegaconf import OmegaConf
 from pathlib import Path
 from compoconf import parse_config, MissingValue, ConfigError, NonStrictDataclass, asdict
 from typing import Any, Type, get_origin
 from megatron_train.slurm import get_slurm_template, generate_slurm_script
-from megatron_train.extract_hydra import run_hydra, oc_timestring
+from megatron_train.chain import CHAIN_FILE, chain_sbatch_options, chain_script, exit_duration
+from megatron_train.early_stop import EarlyStopSettings, early_stop_script
+from megatron_train.staging import cleanup_script, replace_staged, staging_plan, staging_script
+from megatron_train.extract_hydra import run_hydra, run_hydra_many, expand_sweep_overrides, oc_timestring
 from megatron_train.run import run_with_tee
-from megatron_train.job_log import job_log
+from megatron_train.job_log import follow, job_log
+from megatron_train.flops import cfg_get
+from megatron_train.memory import GIB, estimate_memory
+from megatron_train.blend import format_blend_table, inspect_blend
+from megatron_train.registry import Registry
+from megatron_train.results import ResultsIndex, config_hash
+from megatron_train.validate import errors, format_violations, validate_config
+from megatron_train.watchdog import WatchdogSettings, watchdog_script
 import re
 
 # print(get_args_and_types(get_megatron_parser()))
@@ -41,46 +53,24 @@ MegatronConfig = make_dataclass(
             (argtype if _check_type(argtype) else (str | int)) | None if argtype is not None else (str | None),
             field(default=defval) if not isinstance(defval, list) else field(default_factory=lambda: defval),
         )
-        for arg, (argtype, defval) in get_args_and_types(get_megatron_parser()).items()
+        for arg, (argtype, defval) in get_args_and_types(get_megatron_schema()).items()
     ]
     + [("aux", dict[str, Any], field(default_factory=dict))],
 )
 
 
-def mcfg_post_init(self):
-    assert self.micro_batch_size is not None
-    # assert self.global_batch_size is not None  # may be set at higher level by gpus
-    assert self.train_iters is not None
-    assert self.lr_decay_style is not None
-    assert self.lr is not None
-    assert self.num_layers is not None
-    assert self.hidden_size is not None
-    assert self.ffn_hidden_size is not None
-    assert self.kv_channels is not None
-    assert self.num_attention_heads is not None
-    assert self.vocab_size is not None
-    assert self.max_position_embeddings is not None
-    assert self.tokenizer_type is not None
-    assert self.tokenizer_model is not None
+SBATCH_FILE = "train_megatron.sbatch"
 
-    assert not (self.use_distributed_optimizer and self.use_torch_fsdp2)
-    assert not (self.use_megatron_fsdp and self.use_torch_fsdp2)
-
-    assert self.lr_warmup_iters <= self.train_iters
-
-    assert not (self.use_megatron_fsdp and self.ckpt_format != "fsdp_dtensor")
-    assert not (self.overlap_param_gather and not (self.use_distributed_optimizer or self.use_megatron_fsdp))
-
-    assert not (self.gradient_accumulation_fusion and self.use_torch_fsdp2)
-
-    assert not (self.gradient_accumulation_fusion and self.data_parallel_sharding_strategy not in ["no_shard", "optim"])
-
-    assert not (self.num_experts > 1 and self.add_bias_linear)
-
-    assert self.group_query_attention or (self.num_query_groups == self.hidden_size // self.kv_channels)
-
-
-MegatronConfig.__post_init__ = mcfg_post_init
+# keys of the slurm config that are not sbatch options
+SLURM_NON_SBATCH_KEYS = [
+    "template",
+    "total_gpus",
+    "peak_tflops_per_gpu",
+    "gpu_memory_gib",
+    "intra_node_bandwidth_gbs",
+    "inter_node_bandwidth_gbs",
+    "_non_strict",
+]
 
 
 def quote_bash(st: str):
@@ -95,6 +85,10 @@ class SlurmConfig(NonStrictDataclass):
     partition: str = MissingValue
     total_gpus: int = MissingValue
     template: str = MissingValue
+    peak_tflops_per_gpu: float | None = None
+    gpu_memory_gib: float | None = None
+    intra_node_bandwidth_gbs: float | None = None
+    inter_node_bandwidth_gbs: float | None = None
 
     def __post_init__(self):
         if self.template is MissingValue:
@@ -116,6 +110,59 @@ class SRunConfig(NonStrictDataclass):
     opts: str = MISSING
 
 
+@dataclass(init=False)
+class StagingConfig(NonStrictDataclass):
+    enabled: bool = False
+    stage_dir: str = "/tmp/megatron_stage"
+    image: str | None = None
+    data_shards: list[str] = field(default_factory=list)
+    copy_cmd: str = "sbcast --force {src} {dst}"
+    node_cmd: str = "srun --ntasks-per-node=1"
+    checksum_cmd: str | None = "sha256sum"
+    cleanup: bool = True
+
+
+@dataclass(init=False)
+class ChainConfig(NonStrictDataclass):
+    enabled: bool = False
+    mode: str = "dependency"
+    max_segments: int = 20
+    save_minutes: float = 15
+    signal: str = "USR1"
+    signal_seconds: int = 300
+    sbatch_cmd: str = "sbatch"
+    scontrol_cmd: str = "scontrol"
+
+
+@dataclass(init=False)
+class WatchdogConfig(NonStrictDataclass):
+    enabled: bool = False
+    cmd: str = "PYTHONPATH=$RUN_DIR/src python -u $RUN_DIR/script/watch_job.py"
+    startup_grace: float = 1800
+    stall_factor: float = 10
+    min_stall: float = 600
+    tail_lines: int = 200
+    dump_cmd: str | None = None
+    scancel_cmd: str = "scancel"
+    diagnostics_dir: str | None = None
+
+
+@dataclass(init=False)
+class EarlyStopConfig(NonStrictDataclass):
+    enabled: bool = False
+    cmd: str = "PYTHONPATH=$RUN_DIR/src python -u $RUN_DIR/script/early_stop.py"
+    log_interval: int | None = 5
+    warmup: int = 4
+    min_count: int = 8
+    window: int = 40
+    rel_ci: float = 0.01
+    z: float = 1.96
+    stop_signal: str = "TERM"
+    stop_timeout: float = 300
+    scancel_cmd: str = "scancel"
+    keep_checkpoint: bool = False
+
+
 @dataclass(init=False)
 class MegatronTrainConfig(NonStrictDataclass):
     megatron: MegatronConfig = field(default_factory=MegatronConfig)
@@ -123,6 +170,10 @@ class MegatronTrainConfig(NonStrictDataclass):
     env: dict[str, str | int | float | None] = field(default_factory=dict)
     launcher: LauncherConfig = field(default=LauncherConfig)
     srun: SRunConfig = field(default=SRunConfig)
+    staging: StagingConfig = field(default_factory=StagingConfig)
+    chain: ChainConfig = field(default_factory=ChainConfig)
+    watchdog: WatchdogConfig = field(default_factory=WatchdogConfig)
+    early_stop: EarlyStopConfig = field(default_factory=EarlyStopConfig)
 
     global_batch_size: int = 1
     experiment_name: str = "debug"
@@ -132,6 +183,15 @@ class MegatronTrainConfig(NonStrictDataclass):
     nest_launcher: bool = True
 
     def __post_init__(self):
+        # staged shards replace their data_path entries
+        data_path = " ".join(map(str, self.megatron.data_path or [])).split()
+        assert all(shard in data_path for shard in self.staging.data_shards), "staging.data_shards not in data_path"
+        # chained segments resume from the checkpoint of the previous one
+        assert not self.chain.enabled or (
+            self.megatron.save and self.megatron.load == self.megatron.save and self.megatron.train_iters
+        ), "chain needs megatron.train_iters and megatron.load == megatron.save"
+        # an early stop would be taken for a segment end and resubmitted
+        assert not (self.chain.enabled and self.early_stop.enabled), "early_stop cannot be combined with chain"
         # CUDA_DEVICE_MAX_CONNECTIONS must be >= 1 with fsdp
         assert not (
             "CUDA_DEVICE_MAX_CONNECTIONS" in self.env
@@ -140,17 +200,68 @@ class MegatronTrainConfig(NonStrictDataclass):
         )
 
 
+def sbatch_options(slurm: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in slurm.items() if k not in SLURM_NON_SBATCH_KEYS}
+
+
+def format_sbatch_cmds(options: dict[str, Any]) -> str:
+    # True values are flags (e.g. --requeue)
+    return "\n".join([f"#SBATCH --{k.replace('_', '-')}" + ("" if v is True else f"={v}") for k, v in options.items()])
+
+
 def slurm_script_from_config(config: MegatronTrainConfig, cmdline_args: list[str]) -> str:
     print(config.slurm)
     slurm_template = get_slurm_template(config.slurm.template, base_dir="./slurm_template")
 
-    sbatch_cmds = "\n".join(
-        [
-            f"#SBATCH --{k.replace('_', '-')}={v}"
-            for k, v in asdict(config.slurm).items()
-            if k not in ["template", "total_gpus", "_non_strict"]
-        ]
-    )
+    options = sbatch_options(asdict(config.slurm))
+    chain, chain_after, launch_wrapper = "", "", ""
+    if config.chain.enabled:
+        options.update(chain_sbatch_options(config.chain.mode, config.chain.signal, config.chain.signal_seconds))
+        chain, chain_after = chain_script(
+            str(Path(config.output_dir) / CHAIN_FILE),
+            config.megatron.save,
+            config.megatron.train_iters,
+            config.chain.mode,
+            config.chain.max_segments,
+            config.chain.signal,
+            str(Path(config.output_dir) / SBATCH_FILE),
+            config.chain.sbatch_cmd,
+            config.chain.scontrol_cmd,
+        )
+        launch_wrapper = "chain_run "
+    watchdog, watchdog_after = "", ""
+    if config.watchdog.enabled:
+        watchdog, watchdog_after = watchdog_script(
+            config.watchdog.cmd,
+            config.slurm.output,
+            WatchdogSettings(
+                startup_grace=config.watchdog.startup_grace,
+                stall_factor=config.watchdog.stall_factor,
+                min_stall=config.watchdog.min_stall,
+                dump_cmd=config.watchdog.dump_cmd,
+                scancel_cmd=config.watchdog.scancel_cmd,
+                tail_lines=config.watchdog.tail_lines,
+                diagnostics_dir=config.watchdog.diagnostics_dir,
+            ),
+        )
+    early_stop, early_stop_after = "", ""
+    if config.early_stop.enabled:
+        early_stop, early_stop_after = early_stop_script(
+            config.early_stop.cmd,
+            config.slurm.output,
+            config.output_dir,
+            EarlyStopSettings(
+                warmup=config.early_stop.warmup,
+                min_count=config.early_stop.min_count,
+                window=config.early_stop.window,
+                rel_ci=config.early_stop.rel_ci,
+                z=config.early_stop.z,
+                stop_signal=config.early_stop.stop_signal,
+                stop_timeout=config.early_stop.stop_timeout,
+                scancel_cmd=config.early_stop.scancel_cmd,
+            ),
+        )
+    sbatch_cmds = format_sbatch_cmds(options)
 
     env_exports = "\n".join(["export " + k + "=" + str(v) for k, v in config.env.items()])
 
@@ -158,6 +269,26 @@ def slurm_script_from_config(config: MegatronTrainConfig, cmdline_args: list[str
 
     srun_opts = config.srun.opts
 
+    staging, staging_cleanup = "", ""
+    if config.staging.enabled:
+        image_file, data_files, replacements = staging_plan(
+            "$STAGE_DIR", config.staging.image, config.staging.data_shards
+        )
+        staging = staging_script(
+            config.staging.stage_dir,
+            image_file,
+            data_files,
+            config.staging.copy_cmd,
+            config.staging.node_cmd,
+            config.staging.checksum_cmd,
+            config.output_dir,
+        )
+        if config.staging.cleanup:
+            staging_cleanup = cleanup_script(config.staging.node_cmd)
+        # run from the node-local copies
+        launcher = replace_staged(launcher, replacements)
+        cmdline_args = [replace_staged(arg, replacements) for arg in cmdline_args]
+
     megatron_cmd = " ".join(["$RUN_DIR/Megatron-LM/pretrain_gpt.py"] + cmdline_args)
 
     if config.nest_launcher:
@@ -181,23 +312,366 @@ def slurm_script_from_config(config: MegatronTrainConfig, cmdline_args: list[str
             "launcher": launcher,
             "srun_opts": srun_opts,
             "megatron_cmd": megatron_cmd,
+            "staging": staging,
+            "staging_cleanup": staging_cleanup,
+            "chain": chain,
+            "chain_after": chain_after,
+            "launch_wrapper": launch_wrapper,
+            "watchdog": watchdog,
+            "watchdog_after": watchdog_after,
+            "early_stop": early_stop,
+            "early_stop_after": early_stop_after,
         },
     )
 
     return slurm_script
 
 
-def main():
-    print("RUNNING:", sys.argv)
+def resolve_config(config_yaml: str, output_dir_suffix: str = "") -> dict[str, Any]:
+    config = yaml.safe_load(config_yaml)
+    if output_dir_suffix:
+        # oc.timestring is cached per process, so all points of a sweep share the timestamp
+        config["output_dir"] = str(config["output_dir"]) + output_dir_suffix
+    config = OmegaConf.create(config)
+
+    OmegaConf.resolve(config)
+    return OmegaConf.to_container(config)
+
+
+def render_config(config: dict[str, Any]) -> tuple[MegatronTrainConfig, str]:
+    config = parse_config(MegatronTrainConfig, config)
+    if config.chain.enabled:
+        # exit with a checkpoint before the time limit, SIGTERM (forwarded signal) saves as well
+        config.megatron.exit_signal_handler = True
+        if config.megatron.exit_duration_in_mins is None:
+            config.megatron.exit_duration_in_mins = exit_duration(config.slurm.time, config.chain.save_minutes)
+    if config.early_stop.enabled:
+        # the stop signal ends the training via the exit signal handler, which saves a checkpoint if save is set
+        config.megatron.exit_signal_handler = True
+        if config.early_stop.log_interval is not None:
+            config.megatron.log_interval = config.early_stop.log_interval
+        if not config.early_stop.keep_checkpoint:
+            config.megatron.save = None
+
+    cmdline_args = get_cmdline_args(
+        asdict(config.megatron),
+        skip_none=True,
+        ignore_args=["aux"],
+        default_skip={},
+        parser=get_megatron_schema(),
+    )
+
+    slurm_script = slurm_script_from_config(config, cmdline_args)
+    return config, slurm_script
+
+
+def check_memory(megatron_config: Any, num_gpus: int, max_gpu_mem: float | None) -> bool:
+    """
+    Prints the estimated memory per GPU and returns False if it exceeds max_gpu_mem (in GiB).
+    """
+    try:
+        estimate = estimate_memory(megatron_config, num_gpus)
+    except (TypeError, ValueError, ZeroDivisionError) as e:
+        print(f"Memory estimate not available: {e}")
+        return True
+    print(estimate.report())
+    if max_gpu_mem is not None and estimate.total > max_gpu_mem * GIB:
+        print(f"Estimated memory {estimate.total / GIB:.2f} GiB exceeds --max-gpu-mem {max_gpu_mem} GiB")
+        return False
+    return True
+
+
+def check_config(megatron_config: Any, num_gpus: int) -> bool:
+    """
+    Evaluates all config rules (parallel layout, batch sizes, incompatible options), prints every violation and
+    returns False if any of them is an error.
+    """
+    violations = validate_config(megatron_config, num_gpus)
+    if violations:
+        print(format_violations(violations))
+    return not errors(violations)
+
+
+def check_data(megatron_config: Any, global_batch_size: int) -> bool:
+    """
+    Prints the data_path blend (documents, tokens, epochs per component) and returns False if a prefix is
+    missing or its .idx/.bin files are inconsistent.
+    """
+    if cfg_get(megatron_config, "mock_data"):
+        return True
+    components = inspect_blend(megatron_config, global_batch_size=global_batch_size)
+    if not components:
+        print("No megatron.data_path to check")
+        return True
+    print(format_blend_table(components))
+    return all(component.stats.ok for component in components)
+
+
+def check_results(results: ResultsIndex, config: dict[str, Any], force: bool) -> tuple[str, bool]:
+    """
+    Looks up the config hash in the results index. Returns the hash and False if the configuration was already
+    measured (unless force). Earlier submissions without a valid measurement are only reported.
+    """
+    key = config_hash(config)
+    measured, pending = results.lookup(key)
+    for output_dir in pending:
+        print(f"Config {key[:12]} was submitted before without a valid measurement yet: {output_dir}")
+    if not measured:
+        return key, True
+    for result in measured:
+        print(f"Config {key[:12]} was already measured: {result}")
+    if force:
+        print("Resubmitting (--force)")
+        return key, True
+    return key, False
+
+
+def _render_sweep_point(config: dict[str, Any]) -> tuple[dict[str, Any], str]:
+    # runs in a worker process, return plain data only
+    config, slurm_script = render_config(config)
+    return asdict(config), slurm_script
+
+
+def write_job(config: dict[str, Any], slurm_script: str) -> Path:
+    os.makedirs(config["output_dir"])
+    print(f"Output Directory: {config['output_dir']}")
+    print(f"SLURMOUT: {config['slurm']['output']}")
+
+    sbatch_file = Path(config["output_dir"]) / SBATCH_FILE
+    with open(sbatch_file, "w") as fp:
+        fp.write(slurm_script)
+    with open(Path(config["output_dir"]) / "submit_config.yaml", "w") as fp:
+        yaml.dump(config, fp)
+    return sbatch_file
+
+
+def submit_job(sbatch_file: Path) -> str | None:
+    out = run_with_tee(["sbatch", str(sbatch_file)], text=True)
+    match = re.search(r"Submitted batch job (\d+)", out.stdout, flags=re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def write_array_jobs(
+    manifest: list[dict[str, Any]], configs: list[dict[str, Any]], throttle: int | None = None
+) -> list[dict[str, Any]]:
+    """
+    Packs the rendered sweep points into slurm array jobs. Points with identical sbatch options (apart from
+    the output file) share one array, whose tasks select their rendered script and log file from a task file
+    via SLURM_ARRAY_TASK_ID. throttle limits the number of simultaneously running tasks (--array=0-N%throttle).
+    """
+    groups: dict[str, list[int]] = {}
+    for n, config in enumerate(configs):
+        options = sbatch_options(config["slurm"])
+        options.pop("output", None)
+        groups.setdefault(json.dumps(options, sort_keys=True, default=str), []).append(n)
+
+    slurm_template = get_slurm_template("array.sh", base_dir="./slurm_template")
+    sweep_dir = Path(os.path.dirname(manifest[0]["output_dir"]))
+    arrays = []
+    for group, members in enumerate(groups.values()):
+        prefix = sweep_dir / f"sweep_{manifest[0]['timestamp']}_array{group}"
+        task_file = prefix.with_suffix(".tasks")
+        with open(task_file, "w") as fp:
+            for n in members:
+                fp.write(f"{configs[n]['slurm']['output']}\t{manifest[n]['sbatch_file']}\n")
+        options = sbatch_options(configs[members[0]]["slurm"])
+        options["output"] = f"{prefix}_%A_%a.out"
+        options["array"] = f"0-{len(members) - 1}" + (f"%{throttle}" if throttle else "")
+        sbatch_file = prefix.with_suffix(".sbatch")
+        with open(sbatch_file, "w") as fp:
+            fp.write(
+                generate_slurm_script(
+                    slurm_template, {"sbatch_cmds": format_sbatch_cmds(options), "task_file": str(task_file)}
+                )
+            )
+        for task, n in enumerate(members):
+            manifest[n]["array"] = group
+            manifest[n]["array_task"] = task
+        arrays.append(
+            {
+                "sbatch_file": str(sbatch_file),
+                "task_file": str(task_file),
+                "points": [manifest[n]["point"] for n in members],
+            }
+        )
+    return arrays
+
+
+def run_sweep(args: argparse.Namespace, points: list[list[str]] | None = None):
+    """
+    Renders (and submits) one job per point, the override lists of the points default to the grid of args.opts.
+    """
+    if points is None:
+        points = expand_sweep_overrides(args.opts)
+    print(f"Sweep over {len(points)} points")
+
+    config_yamls = run_hydra_many(
+        config_path=args.config_path,
+        config_name=args.config_name,
+        cmdline_opts_list=points,
+        config_yaml=args.config_yaml,
+        use_cache=not args.no_compose_cache,
+        config_yaml_mode=args.config_yaml_mode,
+    )
+    configs = [resolve_config(config_yaml, output_dir_suffix=f"_{n:04d}") for n, config_yaml in enumerate(config_yamls)]
+    if args.array and any(config["chain"]["enabled"] for config in configs):
+        # the chain signal and follow-up submission belong to the batch script of the point
+        print("Chained jobs (chain.enabled) cannot be submitted as array tasks, submit without --array")
+        sys.exit(1)
+
+    # the workers get the loaded schema instead of hashing the Megatron checkout again
+    with ProcessPoolExecutor(
+        max_workers=min(len(configs), args.sweep_workers or os.cpu_count() or 1),
+        initializer=set_megatron_schema,
+        initargs=(get_megatron_schema(),),
+    ) as pool:
+        rendered = list(pool.map(_render_sweep_point, configs))
+
+    results = ResultsIndex(args.results_index)
+    manifest = []
+    written_configs = []
+    for n, (overrides, (config, slurm_script)) in enumerate(zip(points, rendered)):
+        if args.validate and not check_config(config["megatron"], config["slurm"]["total_gpus"]):
+            print(f"Skipping invalid sweep point {n}: {' '.join(overrides)}")
+            continue
+        if not check_memory(config["megatron"], config["slurm"]["total_gpus"], args.max_gpu_mem):
+            print(f"Skipping sweep point {n}: {' '.join(overrides)}")
+            continue
+        if args.check_data and not check_data(config["megatron"], config["global_batch_size"]):
+            print(f"Skipping sweep point {n} with failed data check: {' '.join(overrides)}")
+            continue
+        key, submit = check_results(results, config, args.force)
+        if args.debug:
+            print(f"Output Directory: {config['output_dir']}")
+            print("SLURM_SCRIPT:")
+            print(slurm_script)
+            if not submit:
+                print(f"Measured sweep point {n} would be skipped: {' '.join(overrides)}")
+            continue
+        if not submit:
+            print(f"Skipping measured sweep point {n}: {' '.join(overrides)}")
+            continue
+        sbatch_file = write_job(config, slurm_script)
+        written_configs.append(config)
+        manifest.append(
+            {
+                "point": n,
+                "overrides": overrides,
+                "output_dir": config["output_dir"],
+                "sbatch_file": str(sbatch_file),
+                "timestamp": config["timestamp"],
+                "config_hash": key,
+            }
+        )
+
+    if args.debug:
+        results.save()
+        return
+    if not manifest:
+        print("No sweep point left to submit (invalid, over --max-gpu-mem, failed data check or already measured)")
+        results.save()
+        sys.exit(1)
+
+    manifest_file = Path(os.path.dirname(manifest[0]["output_dir"])) / f"sweep_{manifest[0]['timestamp']}.yaml"
+    arrays = write_array_jobs(manifest, written_configs, args.array_throttle) if args.array else []
+    for job in arrays or manifest:
+        if args.run:
+            job["jobid"] = submit_job(Path(job["sbatch_file"]))
+        else:
+            print(
+                f"Successful, to execute, run: SUBMIT_TIMESTAMP={manifest[0]['timestamp']} sbatch {job['sbatch_file']}"
+            )
+    for array in arrays:
+        if array.get("jobid"):
+            for point in manifest:
+                if point["point"] in array["points"]:
+                    point["jobid"] = f"{array['jobid']}_{point['array_task']}"
+    with Registry(args.registry) as registry:
+        for point, config in zip(manifest, written_configs):
+            results.record(point["config_hash"], config, point.get("jobid"))
+            registry.register_submission(config, point["config_hash"], point.get("jobid"), point["sbatch_file"])
+    results.save()
+    with open(manifest_file, "w") as fp:
+        yaml.dump(
+            {
+                "config_path": args.config_path,
+                "config_name": args.config_name,
+                "config_yaml": args.config_yaml,
+                "opts": args.opts,
+                "points": manifest,
+                **({"arrays": arrays} if arrays else {}),
+            },
+            fp,
+            sort_keys=False,
+        )
+    print(f"Sweep Manifest: {manifest_file}")
+
+    jobids = [point["jobid"] for point in manifest if point.get("jobid")]
+    if args.show_log and jobids:
+        follow(jobids)
+
+
+def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument("--config-path", type=str, default="./config", help="Path to config directory")
     parser.add_argument("--config-name", type=str, default="base", help="Name of base config file")
     parser.add_argument("--config-name-default", type=str, default="base", help="Name of base config file")
     parser.add_argument("--config-yaml", type=str, default="", help="Additional YAML config to override")
+    parser.add_argument(
+        "--config-yaml-mode",
+        choices=["merge", "overrides"],
+        default="merge",
+        help="Merge --config-yaml as structured config or expand it to per-leaf string overrides",
+    )
     # parser.add_argument("--no-diff-to-default", action="store_true")
     parser.add_argument("--debug", action="store_true")
     parser.add_argument("--run", action="store_true")
     parser.add_argument("--show-log", action="store_true")
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Interpret opts as a hydra multirun-style grid (e.g. slurm.nodes=1,2,4) and render one job per point",
+    )
+    parser.add_argument(
+        "--array", action="store_true", help="Submit a sweep as slurm array job(s) instead of one job per point"
+    )
+    parser.add_argument(
+        "--array-throttle", type=int, default=None, help="Maximal number of simultaneously running array tasks"
+    )
+    parser.add_argument("--sweep-workers", type=int, default=None, help="Number of processes to render a sweep")
+    parser.add_argument("--no-compose-cache", action="store_true", help="Always re-compose the hydra config")
+    parser.add_argument(
+        "--max-gpu-mem",
+        type=float,
+        default=None,
+        help="Refuse configs whose estimated memory per GPU (GiB) exceeds this limit",
+    )
+    parser.add_argument(
+        "--no-validate",
+        dest="validate",
+        action="store_false",
+        help="Submit without checking the config rules (parallel layout, batch sizes, incompatible options)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Submit configurations that already have a valid measurement"
+    )
+    parser.add_argument(
+        "--results-index",
+        type=str,
+        default=None,
+        help="JSON index of submitted config hashes and their measurements (default: in the megatron_train cache dir)",
+    )
+    parser.add_argument(
+        "--registry",
+        type=str,
+        default=None,
+        help="Experiment registry (SQLite) the submission is recorded in (default: in the megatron_train cache dir)",
+    )
+    parser.add_argument(
+        "--check-data",
+        action="store_true",
+        help="Check that all megatron.data_path prefixes exist and print their tokens and epochs before rendering",
+    )
 
     parser.add_argument(
         "opts",
@@ -205,56 +679,60 @@ def main():
         default=[],
         help="Additional arguments to override config (e.g. dataset.local_batch_size=32)",
     )
-    args = parser.parse_args()
+    return parser
+
+
+def main():
+    print("RUNNING:", sys.argv)
+    args = get_parser().parse_args()
+
+    if args.sweep:
+        run_sweep(args)
+        return
 
     config_yaml = run_hydra(
         config_path=args.config_path,
         config_name=args.config_name,
         cmdline_opts=args.opts,
         config_yaml=args.config_yaml,
+        use_cache=not args.no_compose_cache,
+        config_yaml_mode=args.config_yaml_mode,
     )
-    config_yaml_base = yaml.safe_load(config_yaml)
-    config = OmegaConf.create(config_yaml_base)
+    config, slurm_script = render_config(resolve_config(config_yaml))
 
-    OmegaConf.resolve(config)
-    config = OmegaConf.to_container(config)
-    config = parse_config(MegatronTrainConfig, config)
-
-    cmdline_args = get_cmdline_args(
-        asdict(config.megatron),
-        skip_none=True,
-        ignore_args=["aux"],
-        default_skip={},
-        parser=get_megatron_parser(),
-    )
-
-    slurm_script = slurm_script_from_config(config, cmdline_args)
+    if args.validate and not check_config(config.megatron, config.slurm.total_gpus):
+        sys.exit(1)
+    if not check_memory(config.megatron, config.slurm.total_gpus, args.max_gpu_mem):
+        sys.exit(1)
+    if args.check_data and not check_data(config.megatron, config.global_batch_size):
+        sys.exit(1)
 
+    results = ResultsIndex(args.results_index)
+    key, submit = check_results(results, asdict(config), args.force)
     if args.debug:
         print(f"Output Directory: {config.output_dir}")
         print("SLURM_SCRIPT:")
         print(slurm_script)
+        if not submit:
+            print("Would not be submitted, use --force to run the configuration again")
+        results.save()
+    elif not submit:
+        results.save()
+        print("Not submitted, use --force to run the configuration again")
     else:
-        os.makedirs(config.output_dir)
-        print(f"Output Directory: {config.output_dir}")
-        print(f"SLURMOUT: {config.slurm.output}")
-
-        with open(Path(config.output_dir) / "train_megatron.sbatch", "w") as fp:
-            fp.write(slurm_script)
-        with open(Path(config.output_dir) / "submit_config.yaml", "w") as fp:
-            yaml.dump(asdict(config), fp)
+        sbatch_file = write_job(asdict(config), slurm_script)
 
+        jobid = None
         if args.run:
-            out = run_with_tee(["sbatch", str(Path(config.output_dir) / "train_megatron.sbatch")], text=True)
-            if args.show_log:
-                match = re.search(r"Submitted batch job (\d+)", out.stdout, flags=re.MULTILINE)
-                if match:
-                    jobid = match.group(1)
-                    job_log(jobid)
+            jobid = submit_job(sbatch_file)
         else:
-            print(
-                f"Successful, to execute, run: SUBMIT_TIMESTAMP={config.timestamp} sbatch {str(Path(config.output_dir) / 'train_megatron.sbatch')}"
-            )
+            print(f"Successful, to execute, run: SUBMIT_TIMESTAMP={config.timestamp} sbatch {str(sbatch_file)}")
+        results.record(key, asdict(config), jobid)
+        results.save()
+        with Registry(args.registry) as registry:
+            registry.register_submission(asdict(config), key, jobid, str(sbatch_file))
+        if args.show_log and jobid:
+            job_log(jobid)
 
 
 if __name__ == "__main__":
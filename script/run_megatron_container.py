@@ -6,7 +6,7 @@ import os
 from pathlib import Path
 import re
 from megatron_train.run import run_with_tee
-from megatron_train.job_log import job_log
+from megatron_train.job_log import follow, job_log
 
 
 def main():
@@ -50,11 +50,15 @@ def main():
         print(f"STDOUT {res.returncode}", res.stdout.decode("utf-8"))
         print("ERRORS: ", res.stderr.decode("utf-8"))
         if res.returncode == 0:
-            sbatch_cmd = re.search(
-                "^(Successful, to execute, run: )(.*)(sbatch .*)", res.stdout.decode("utf-8"), flags=re.MULTILINE
+            # a sweep (--sweep) prints one submit command per point
+            sbatch_cmds = list(
+                re.finditer(
+                    "^(Successful, to execute, run: )(.*)(sbatch .*)", res.stdout.decode("utf-8"), flags=re.MULTILINE
+                )
             )
             print(res.stdout.decode("utf-8"))
-            if sbatch_cmd:
+            jobids = []
+            for sbatch_cmd in sbatch_cmds:
                 slurm_env = sbatch_cmd.group(2)
                 slurm_cmd = sbatch_cmd.group(3)
                 print(f"Slurm Command: {slurm_cmd}")
@@ -67,13 +71,15 @@ def main():
                     env.update(**env_subst)
                     print(f"Submit: {slurm_cmd} with env {env_subst}")
                     out = run_with_tee(slurm_cmd.split(" "), env=env, text=True)
-                    if args.show_log:
-                        match = re.search(r"Submitted batch job (\d+)", out.stdout, flags=re.MULTILINE)
-                        if match:
-                            jobid = match.group(1)
-                            job_log(jobid)
-            else:
+                    match = re.search(r"Submitted batch job (\d+)", out.stdout, flags=re.MULTILINE)
+                    if match:
+                        jobids.append(match.group(1))
+            if not sbatch_cmds:
                 print("Error finding submit command")
+            elif args.show_log and len(jobids) == 1:
+                job_log(jobids[0])
+            elif args.show_log and jobids:
+                follow(jobids)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+import argparse
+import asyncio
+import sys
+
+from megatron_train.job_log import watch_job
+from megatron_train.watchdog import add_watchdog_args, watchdog_settings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cancel a slurm job that stops printing iteration lines (e.g. a hung NCCL collective), after "
+        "saving the last log lines and py-spy dumps. Runs as a sidecar of the batch script or on the submit side."
+    )
+    parser.add_argument("--jobid", type=str, required=True, help="Slurm job id")
+    parser.add_argument("--log", type=str, default=None, help="StdOut file of the job (default: from scontrol)")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between polls of the log")
+    parser.add_argument(
+        "--slurm-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between job state queries, 0 to never query (sidecar: the watchdog ends with the job)",
+    )
+    parser.add_argument("--scontrol", type=str, default="scontrol", help="scontrol command")
+    parser.add_argument("--squeue", type=str, default="squeue", help="squeue command")
+    add_watchdog_args(parser)
+    args = parser.parse_args()
+
+    reason = asyncio.run(
+        watch_job(
+            args.jobid,
+            watchdog_settings(args),
+            stdout=args.log,
+            interval=args.interval,
+            slurm_interval=args.slurm_interval or None,
+            scontrol_cmd=args.scontrol,
+            squeue_cmd=args.squeue,
+        )
+    )
+    if reason:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+#!/bin/bash
+
+{{ sbatch_cmds }}
+
+# one line per array task: <slurm output pattern> TAB <rendered sbatch script of the sweep point>
+TASK_FILE={{ task_file }}
+IFS=$'\t' read -r TASK_OUTPUT TASK_SCRIPT < <(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "$TASK_FILE")
+TASK_OUTPUT=${TASK_OUTPUT//%j/$SLURM_JOB_ID}
+TASK_OUTPUT=${TASK_OUTPUT//%A/$SLURM_ARRAY_JOB_ID}
+TASK_OUTPUT=${TASK_OUTPUT//%a/$SLURM_ARRAY_TASK_ID}
+echo "Array task $SLURM_ARRAY_TASK_ID: $TASK_SCRIPT > $TASK_OUTPUT"
+
+# the point's script carries its env exports and launcher/megatron cmdline, #SBATCH lines are comments here
+bash "$TASK_SCRIPT" > "$TASK_OUTPUT" 2>&1
@@ -2,7 +2,26 @@
 
 {{ sbatch_cmds }}
 
+# time-to-first-iteration markers, parsed by extract_training_times.py --startup
+echo "PHASE submitted $(date -d "$(squeue -h -j $SLURM_JOB_ID -o %V)" +%s 2>/dev/null)"
+echo "PHASE job_start $(date +%s.%N)"
+
 {{ env_exports }}
 
+{{ staging }}
+
+{{ chain }}
+
+{{ watchdog }}
+
+{{ early_stop }}
+
+
+echo "PHASE launch $(date +%s.%N)"
+{{ launch_wrapper }}srun {{ srun_opts }} bash -c 'echo "PHASE srun_start $(date +%s.%N)"; {{ launcher }} {{ megatron_cmd }}'
+{{ watchdog_after }}
+{{ early_stop_after }}
+
+{{ staging_cleanup }}
 
-srun {{ srun_opts }} bash -c '{{ launcher }} {{ megatron_cmd }}'
\ No newline at end of file
+{{ chain_after }}
\ No newline at end of file
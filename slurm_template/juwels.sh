@@ -1,8 +1,20 @@
 #!/bin/bash
 {{ sbatch_cmds }}
 
+# time-to-first-iteration markers, parsed by extract_training_times.py --startup
+echo "PHASE submitted $(date -d "$(squeue -h -j $SLURM_JOB_ID -o %V)" +%s 2>/dev/null)"
+echo "PHASE job_start $(date +%s.%N)"
+
 {{ env_exports }}
 
+{{ staging }}
+
+{{ chain }}
+
+{{ watchdog }}
+
+{{ early_stop }}
+
 # export MASTER_ADDR_NAME="$(scontrol show hostnames "$SLURM_JOB_NODELIST" | head -n 1)i"
 # export MASTER_ADDR=$(nslookup $MASTER_ADDR_NAME | grep "Address: " | tail -n1 | awk '{print $2}' )
 # export MASTER_PORT=20073
@@ -29,7 +41,8 @@ ml ScaLAPACK/2.2.0-fb
 # for (( i=0; i<$SLURM_NNODES; i++ )); do
 #     node=${nodes[$i]}
 # -w ${node}
-srun {{ srun_opts }} bash -c 'echo $SLURM_PROCID ; {{ launcher }} {{ megatron_cmd }}' # &
+echo "PHASE launch $(date +%s.%N)"
+{{ launch_wrapper }}srun {{ srun_opts }} bash -c 'echo "PHASE srun_start $(date +%s.%N)"; echo $SLURM_PROCID ; {{ launcher }} {{ megatron_cmd }}' # &
 
 #     if [ $i -eq 0 ]; then
 #         sleep 10  # Master needs time to start
@@ -38,4 +51,10 @@ srun {{ srun_opts }} bash -c 'echo $SLURM_PROCID ; {{ launcher }} {{ megatron_cm
 #     fi
 # done
 
-# wait
\ No newline at end of file
+# wait
+{{ watchdog_after }}
+{{ early_stop_after }}
+
+{{ staging_cleanup }}
+
+{{ chain_after }}
\ No newline at end of file
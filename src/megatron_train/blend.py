@@ -0,0 +1,299 @@
+import json
+import math
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .cache import atomic_write, get_cache_dir
+from .flops import cfg_get
+
+# header of Megatron's indexed dataset (.idx): magic, version <Q, dtype code <B, sequence count <Q, document count <Q
+INDEX_HEADER = b"MMIDIDX\x00\x00"
+INDEX_HEADER_BYTES = len(INDEX_HEADER) + 8 + 1 + 8 + 8
+INDEX_DTYPES = {
+    1: np.uint8,
+    2: np.int8,
+    3: np.int16,
+    4: np.int32,
+    5: np.int64,
+    6: np.float64,
+    7: np.float32,
+    8: np.uint16,
+}
+# extra samples per blend component that Megatron draws on top of weight * size (mid_level_dataset_surplus)
+MID_LEVEL_SURPLUS = 0.005
+STATS_VERSION = 1
+
+
+@dataclass
+class IndexStats:
+    """
+    Counts of one indexed dataset prefix (<prefix>.idx/.bin), tokens per train/valid/test split.
+    """
+
+    prefix: str
+    dtype: str | None = None
+    sequences: int = 0
+    documents: int = 0
+    tokens: int = 0
+    split_tokens: list[int] = field(default_factory=lambda: [0, 0, 0])
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def parse_blend(data_path: list[str] | str | None) -> tuple[list[str], list[float] | None]:
+    """
+    Prefixes and weights of a data_path blend, following Megatron: either weight/prefix pairs or only prefixes.
+
+    >>> parse_blend(["0.3 /data/a", "0.7", "/data/b"])
+    (['/data/a', '/data/b'], [0.3, 0.7])
+    >>> parse_blend(["/data/a", "/data/b"])
+    (['/data/a', '/data/b'], None)
+    """
+    if data_path is None:
+        return [], None
+    items = [
+        item for entry in ([data_path] if isinstance(data_path, str) else data_path) for item in str(entry).split()
+    ]
+    if len(items) < 2 or len(items) % 2:
+        return items, None
+    try:
+        weights = [float(weight) for weight in items[::2]]
+    except ValueError:
+        return items, None
+    return items[1::2], weights
+
+
+def parse_split(split: str | None) -> list[float]:
+    """
+    Normalized train/valid/test fractions of a Megatron split string.
+
+    >>> parse_split("969,30,1")
+    [0.969, 0.03, 0.001]
+    """
+    parts = [float(part) for part in str(split or "969,30,1").replace("/", ",").split(",")]
+    parts = (parts + [0.0, 0.0, 0.0])[:3]
+    return [part / sum(parts) for part in parts]
+
+
+def split_document_bounds(split: list[float], num_documents: int) -> list[int]:
+    """
+    Document indices where the train/valid/test splits start and end, rounded as in Megatron.
+
+    >>> split_document_bounds([0.969, 0.03, 0.001], 1000)
+    [0, 969, 999, 1000]
+    """
+    bounds = np.concatenate([[0.0], np.cumsum(split)])
+    return [int(round(bound * num_documents)) for bound in bounds]
+
+
+def read_index_header(idx_file: str) -> tuple[np.dtype, int, int]:
+    """
+    Token dtype, number of sequences and number of document indices of a .idx file, raises ValueError if it is
+    not a Megatron indexed dataset.
+    """
+    with open(idx_file, "rb") as fp:
+        header = fp.read(INDEX_HEADER_BYTES)
+    if len(header) < INDEX_HEADER_BYTES or not header.startswith(INDEX_HEADER):
+        raise ValueError("not a Megatron indexed dataset")
+    _version, dtype_code, sequences, documents = struct.unpack("<QBQQ", header[len(INDEX_HEADER) :])
+    if dtype_code not in INDEX_DTYPES:
+        raise ValueError(f"unknown dtype code {dtype_code}")
+    return np.dtype(INDEX_DTYPES[dtype_code]), sequences, documents
+
+
+def read_index_arrays(prefix: str) -> tuple[np.dtype, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Token dtype and the memory-mapped sequence lengths, sequence byte offsets and document indices of <prefix>.idx.
+    """
+    idx_file = f"{prefix}.idx"
+    dtype, sequences, documents = read_index_header(idx_file)
+    if sequences == 0:
+        return dtype, np.zeros(0, np.int32), np.zeros(0, np.int64), np.zeros(documents, np.int64)
+    lengths = np.memmap(idx_file, dtype=np.int32, mode="r", offset=INDEX_HEADER_BYTES, shape=(sequences,))
+    pointers = np.memmap(
+        idx_file, dtype=np.int64, mode="r", offset=INDEX_HEADER_BYTES + 4 * sequences, shape=(sequences,)
+    )
+    document_indices = np.memmap(
+        idx_file, dtype=np.int64, mode="r", offset=INDEX_HEADER_BYTES + 12 * sequences, shape=(documents,)
+    )
+    return dtype, lengths, pointers, document_indices
+
+
+def read_index_stats(prefix: str, split: list[float]) -> IndexStats:
+    """
+    Reads the header and size arrays of <prefix>.idx (memory-mapped) and checks the size of <prefix>.bin.
+    """
+    stats = IndexStats(prefix=prefix)
+    idx_file, bin_file = f"{prefix}.idx", f"{prefix}.bin"
+    try:
+        idx_size = os.path.getsize(idx_file)
+        bin_size = os.path.getsize(bin_file)
+        dtype, sequences, documents = read_index_header(idx_file)
+    except OSError as e:
+        stats.error = f"{type(e).__name__}: {e.filename}"
+        return stats
+    except ValueError as e:
+        stats.error = str(e)
+        return stats
+    stats.dtype, stats.sequences, stats.documents = dtype.name, sequences, documents - 1
+    expected_size = INDEX_HEADER_BYTES + 12 * sequences + 8 * documents
+    # multimodal datasets append one int8 mode per sequence
+    if idx_size not in [expected_size, expected_size + sequences]:
+        stats.error = f"{idx_file} has {idx_size} bytes, its header implies {expected_size}"
+        return stats
+    if sequences == 0:
+        return stats
+
+    _, lengths, _, document_indices = read_index_arrays(prefix)
+    bounds = document_indices[split_document_bounds(split, stats.documents)]
+    stats.split_tokens = [int(lengths[begin:end].sum(dtype=np.int64)) for begin, end in zip(bounds[:-1], bounds[1:])]
+    stats.tokens = int(lengths.sum(dtype=np.int64))
+    if bin_size != stats.tokens * dtype.itemsize:
+        stats.error = f"{bin_file} has {bin_size} bytes, the index implies {stats.tokens * dtype.itemsize}"
+    return stats
+
+
+class IndexStatsCache:
+    """
+    JSON file with the IndexStats per prefix, valid as long as size and mtime of .idx and .bin are unchanged.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path is not None else get_cache_dir("blend") / "index_stats.json"
+        self.entries: dict[str, Any] = {}
+        self.changed = False
+        try:
+            with open(self.path) as fp:
+                raw = json.load(fp)
+            if raw.get("version") == STATS_VERSION:
+                self.entries = raw["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def file_key(prefix: str, split: list[float]) -> list[Any] | None:
+        try:
+            idx_stat, bin_stat = os.stat(f"{prefix}.idx"), os.stat(f"{prefix}.bin")
+        except OSError:
+            return None
+        return [idx_stat.st_size, idx_stat.st_mtime_ns, bin_stat.st_size, bin_stat.st_mtime_ns, split]
+
+    def get(self, prefix: str, split: list[float]) -> IndexStats:
+        key = self.file_key(prefix, split)
+        entry = self.entries.get(os.path.abspath(prefix))
+        if key is not None and entry is not None and entry["key"] == key:
+            return IndexStats(**entry["stats"])
+        stats = read_index_stats(prefix, split)
+        # missing files are not cached, they may appear later
+        if key is not None:
+            self.entries[os.path.abspath(prefix)] = {"key": key, "stats": asdict(stats)}
+            self.changed = True
+        return stats
+
+    def save(self):
+        if self.changed:
+            atomic_write(self.path, json.dumps({"version": STATS_VERSION, "entries": self.entries}))
+            self.changed = False
+
+
+def inspect_prefixes(
+    prefixes: list[str], split: list[float], workers: int | None = None, cache: IndexStatsCache | None = None
+) -> list[IndexStats]:
+    """
+    IndexStats of many prefixes, read in parallel threads (the work is file I/O and numpy reductions).
+    """
+    cache = cache or IndexStatsCache()
+    workers = workers or min(32, 4 * (os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prefixes)))) as pool:
+        stats = list(pool.map(lambda prefix: cache.get(prefix, split), prefixes))
+    cache.save()
+    return stats
+
+
+@dataclass
+class BlendComponent:
+    stats: IndexStats
+    weight: float
+    train_samples: int
+    epochs: float
+
+
+def train_samples(cfg: Any, global_batch_size: int | None = None) -> int:
+    """
+    Number of training samples of a run: train_samples or train_iters * global batch size.
+
+    >>> train_samples({"train_iters": 500, "global_batch_size": 64})
+    32000
+    """
+    if cfg_get(cfg, "train_samples") is not None:
+        return int(cfg_get(cfg, "train_samples"))
+    return int(cfg_get(cfg, "train_iters")) * int(cfg_get(cfg, "global_batch_size", global_batch_size))
+
+
+def inspect_blend(
+    cfg: Any,
+    global_batch_size: int | None = None,
+    workers: int | None = None,
+    cache: IndexStatsCache | None = None,
+) -> list[BlendComponent]:
+    """
+    Inspects the data_path blend of a megatron config: per component its counts, the number of training samples
+    it contributes (weight * train samples plus Megatron's surplus) and the number of epochs over its train split
+    these samples consume. Without weights, Megatron samples in proportion to the component sizes.
+    """
+    prefixes, weights = parse_blend(cfg_get(cfg, "data_path"))
+    split = parse_split(cfg_get(cfg, "split"))
+    stats = inspect_prefixes(prefixes, split, workers=workers, cache=cache)
+    samples = train_samples(cfg, global_batch_size)
+    seq_length = int(cfg_get(cfg, "seq_length"))
+
+    if weights is None:
+        weights = [float(stat.split_tokens[0]) for stat in stats]
+        surplus = 0.0
+    else:
+        surplus = MID_LEVEL_SURPLUS if len(prefixes) > 1 else 0.0
+    total_weight = sum(weights) or 1.0
+    components = []
+    for stat, weight in zip(stats, weights):
+        weight = weight / total_weight
+        component_samples = math.ceil(math.ceil(samples * weight) * (1 + surplus))
+        train_tokens = stat.split_tokens[0]
+        epochs = component_samples * seq_length / train_tokens if train_tokens else math.inf
+        components.append(BlendComponent(stats=stat, weight=weight, train_samples=component_samples, epochs=epochs))
+    return components
+
+
+def format_blend_table(components: list[BlendComponent]) -> str:
+    rows = [["prefix", "weight", "documents", "tokens", "train_tokens", "train_samples", "epochs", "status"]]
+    for component in components:
+        stats = component.stats
+        rows.append(
+            [
+                stats.prefix,
+                f"{component.weight:.4f}",
+                f"{stats.documents:,}",
+                f"{stats.tokens:,}",
+                f"{stats.split_tokens[0]:,}",
+                f"{component.train_samples:,}",
+                f"{component.epochs:.3f}" if stats.ok else "-",
+                "ok" if stats.ok else stats.error,
+            ]
+        )
+    tokens = sum(component.stats.tokens for component in components)
+    rows.append(["total", "", "", f"{tokens:,}", "", f"{sum(c.train_samples for c in components):,}", "", ""])
+    widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]) - 1)]
+    return "\n".join(
+        "  ".join(
+            [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:-1], widths[1:])] + [row[-1]]
+        ).rstrip()
+        for row in rows
+    )
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+
+def get_cache_dir(*subdirs: str) -> Path:
+    """
+    Returns (and creates) the cache directory for megatron_train.
+
+    The location can be set via MEGATRON_TRAIN_CACHE_DIR, otherwise it defaults to
+    $XDG_CACHE_HOME/megatron_train (~/.cache/megatron_train).
+    """
+    base = os.environ.get("MEGATRON_TRAIN_CACHE_DIR")
+    if not base:
+        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "megatron_train"
+    cache_dir = Path(base).joinpath(*subdirs)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def hash_files(root: str | Path, suffixes: tuple[str, ...] = (".py",), hasher=None) -> str:
+    """
+    Content hash over all files below root with the given suffixes (relative path + content),
+    independent of the directory listing order.
+    """
+    root = Path(root)
+    hasher = hasher or hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(suffixes):
+                continue
+            path = Path(dirpath) / filename
+            hasher.update(str(path.relative_to(root)).encode())
+            hasher.update(b"\0")
+            with open(path, "rb") as fp:
+                hasher.update(fp.read())
+            hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def hash_file_stats(root: str | Path, suffixes: tuple[str, ...] = (".py",), hasher=None) -> str:
+    """
+    Hash over the relative path, size and modification time of all files below root with the given suffixes.
+    Needs only metadata, no file contents, which matters on parallel filesystems.
+    """
+    root = Path(root)
+    hasher = hasher or hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith(suffixes):
+                continue
+            path = Path(dirpath) / filename
+            stat = path.stat()
+            hasher.update(f"{path.relative_to(root)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+    return hasher.hexdigest()
+
+
+def atomic_write(path: str | Path, data: str | bytes):
+    """
+    Writes data to path via a temporary file and rename, such that concurrent readers never see partial files.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as fp:
+        fp.write(data)
+    os.replace(tmp_path, path)
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    Stable hash over JSON-serializable parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class DiskLRUCache:
+    """
+    Size-bounded on-disk cache with one file per entry. Entries are evicted least-recently-used first
+    (by file modification time, which is refreshed on every hit) once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_bytes: int = 64 * 2**20, suffix: str = ".cache"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / (key + self.suffix)
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path) as fp:
+                data = fp.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key: str, data: str):
+        atomic_write(self._path(key), data)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.cache_dir.glob("*" + self.suffix):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob("*" + self.suffix):
+            path.unlink(missing_ok=True)
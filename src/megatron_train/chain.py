@@ -0,0 +1,179 @@
+import re
+import shlex
+from dataclasses import dataclass
+from pathlib import Path
+
+CHAIN_FILE = "chain.log"
+# Megatron's checkpoint tracker in the save dir
+TRACKER_FILE = "latest_checkpointed_iteration.txt"
+CHAIN_MODES = ["requeue", "dependency"]
+# "CHAIN <event> <segment> <job id> <iteration> <epoch seconds>", appended to the chain file by the job
+CHAIN_RE = re.compile(r"^CHAIN (\w+) (\d+) (\S+) (-?\d+) (\d+(?:\.\d+)?)\s*$", flags=re.MULTILINE)
+
+
+def parse_slurm_time(time: str) -> float:
+    """
+    Minutes of a slurm time limit (minutes, MM:SS, HH:MM:SS, D-HH, D-HH:MM, D-HH:MM:SS).
+
+    >>> parse_slurm_time("00:20:00"), parse_slurm_time("90"), parse_slurm_time("1-12"), parse_slurm_time("2:30")
+    (20.0, 90.0, 2160.0, 2.5)
+    """
+    days, _, rest = str(time).rpartition("-")
+    parts = [float(part) for part in rest.split(":")]
+    if days:
+        # D-HH, D-HH:MM, D-HH:MM:SS
+        hours, minutes, seconds = (parts + [0.0, 0.0])[:3]
+    elif len(parts) == 3:
+        hours, minutes, seconds = parts
+    elif len(parts) == 2:
+        hours, (minutes, seconds) = 0.0, parts
+    else:
+        hours, minutes, seconds = 0.0, parts[0], 0.0
+    return (float(days or 0) * 24 + hours) * 60 + minutes + seconds / 60
+
+
+def exit_duration(time_limit: str, save_minutes: float) -> int:
+    """
+    Megatron's exit_duration_in_mins for a job time limit, leaving save_minutes for the final checkpoint.
+
+    >>> exit_duration("04:00:00", 15)
+    225
+    """
+    minutes = int(parse_slurm_time(time_limit) - save_minutes)
+    if minutes <= 0:
+        raise ValueError(f"Time limit {time_limit} leaves no time to train before the {save_minutes} min save")
+    return minutes
+
+
+def chain_sbatch_options(mode: str, signal: str, signal_seconds: int) -> dict[str, str | bool]:
+    """
+    sbatch options of a chained job: the signal is sent to the batch shell (B:) before the time limit. Requeued
+    segments append to the log of the job.
+
+    >>> chain_sbatch_options("requeue", "USR1", 600)
+    {'signal': 'B:USR1@600', 'requeue': True, 'open_mode': 'append'}
+    """
+    options: dict[str, str | bool] = {"signal": f"B:{signal}@{signal_seconds}"}
+    if mode == "requeue":
+        options["requeue"] = True
+        options["open_mode"] = "append"
+    return options
+
+
+def chain_script(
+    chain_file: str,
+    save_dir: str,
+    train_iters: int,
+    mode: str,
+    max_segments: int,
+    signal: str,
+    sbatch_file: str,
+    sbatch_cmd: str = "sbatch",
+    scontrol_cmd: str = "scontrol",
+) -> tuple[str, str]:
+    """
+    Bash blocks before and after the launch of a chained job.
+
+    The first block records the segment start, traps the signal (forwarded as SIGTERM to srun, such that
+    Megatron's exit_signal_handler saves and exits) and defines chain_run, which runs srun in the background so the
+    trap fires while waiting for it.
+
+    The second block decides from Megatron's checkpoint tracker in the save dir:
+      - completed: the checkpointed iteration reached train_iters
+      - stalled: no checkpoint progress in this segment (e.g. a crash), the chain stops
+      - limit: max_segments were run
+      - otherwise the next segment is started via `scontrol requeue` (same job id) or `sbatch
+        --dependency=afterany` (new job id), which resumes from the checkpoint (load = save)
+    Each event is appended to the chain file as "CHAIN <event> <segment> <job id> <iteration> <epoch seconds>".
+    """
+    if mode not in CHAIN_MODES:
+        raise ValueError(f"Unknown chain mode {mode}, expected one of {CHAIN_MODES}")
+    tracker = shlex.quote(f"{save_dir}/{TRACKER_FILE}")
+    if mode == "requeue":
+        next_segment = f'{scontrol_cmd} requeue "$SLURM_JOB_ID"'
+    else:
+        next_segment = f'{sbatch_cmd} --dependency=afterany:"$SLURM_JOB_ID" {shlex.quote(sbatch_file)}'
+    setup = [
+        "# checkpoint chaining: continue in a new segment until train_iters are checkpointed",
+        f"export CHAIN_FILE={shlex.quote(chain_file)}",
+        "chain_iteration() {",
+        f"    cat {tracker} 2>/dev/null | grep -E '^[0-9]+$' || echo -1",
+        "}",
+        "chain_event() {",
+        '    echo "CHAIN $1 $CHAIN_SEGMENT $SLURM_JOB_ID $(chain_iteration) $(date +%s.%N)" | tee -a "$CHAIN_FILE"',
+        "}",
+        'CHAIN_SEGMENT=$(grep -c "^CHAIN start " "$CHAIN_FILE" 2>/dev/null || true)',
+        "CHAIN_SEGMENT=${CHAIN_SEGMENT:-0}",
+        "CHAIN_START_ITERATION=$(chain_iteration)",
+        "chain_event start",
+        "chain_signal() {",
+        "    chain_event signal",
+        '    [ -n "$CHAIN_PID" ] && kill -TERM "$CHAIN_PID"',
+        "}",
+        f"trap chain_signal {signal}",
+        "chain_run() {",
+        '    "$@" &',
+        "    CHAIN_PID=$!",
+        "    # a trap interrupts wait, the last wait returns the exit status of srun",
+        '    while kill -0 "$CHAIN_PID" 2>/dev/null; do',
+        '        wait "$CHAIN_PID"',
+        "    done",
+        '    wait "$CHAIN_PID"',
+        "}",
+    ]
+    after = [
+        "chain_status=$?",
+        "CHAIN_ITERATION=$(chain_iteration)",
+        f'if [ "$CHAIN_ITERATION" -ge {int(train_iters)} ]; then',
+        "    chain_event completed",
+        'elif [ "$CHAIN_ITERATION" -le "$CHAIN_START_ITERATION" ]; then',
+        "    chain_event stalled",
+        f"elif [ $((CHAIN_SEGMENT + 1)) -ge {int(max_segments)} ]; then",
+        "    chain_event limit",
+        "else",
+        "    chain_event next",
+        f"    {next_segment} || chain_event submit_failed",
+        "fi",
+        "( exit $chain_status )",
+    ]
+    return "\n".join(setup) + "\n", "\n".join(after) + "\n"
+
+
+@dataclass
+class ChainEvent:
+    event: str
+    segment: int
+    jobid: str
+    iteration: int
+    time: float
+
+
+def read_chain(output_dir: str | Path) -> list[ChainEvent]:
+    """
+    Events of a chained run from the chain file in its output dir.
+    """
+    try:
+        with open(Path(output_dir) / CHAIN_FILE) as fp:
+            data = fp.read()
+    except OSError:
+        return []
+    return [
+        ChainEvent(event=event, segment=int(segment), jobid=jobid, iteration=int(iteration), time=float(time))
+        for event, segment, jobid, iteration, time in CHAIN_RE.findall(data)
+    ]
+
+
+def chain_state(events: list[ChainEvent]) -> str:
+    """
+    State of a chain: the last decision, or running if the last segment has not decided yet.
+
+    >>> chain_state([ChainEvent("start", 0, "1", -1, 0.0), ChainEvent("next", 0, "1", 500, 1.0)])
+    'next'
+    >>> chain_state([ChainEvent("start", 1, "2", 500, 2.0), ChainEvent("signal", 1, "2", 500, 3.0)])
+    'running'
+    >>> chain_state([])
+    'not_started'
+    """
+    if not events:
+        return "not_started"
+    return "running" if events[-1].event in ["start", "signal"] else events[-1].event
@@ -1,21 +1,295 @@
 import argparse
-from typing import Any, Type
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import weakref
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import Any, Iterable, Type
 from enum import Enum
 
-from megatron.training.arguments import add_megatron_arguments
+from .cache import atomic_write, get_cache_dir, hash_file_stats
+
+SCHEMA_VERSION = 1
+
+_BUILTIN_TYPES = {t.__name__: t for t in (int, float, str, bool)}
 
 
 def get_megatron_parser():
     """
     Extracts the arguments from megatron.training.arguments.py.
     """
+    from megatron.training.arguments import add_megatron_arguments
+
     parser = argparse.ArgumentParser(description="Megatron-LM Arguments", allow_abbrev=False)
     parser = add_megatron_arguments(parser)
     return parser
 
 
-def _extract_action_type(action: argparse.Action):
-    typ = bool if isinstance(action, argparse._StoreTrueAction | argparse._StoreFalseAction) else action.type
+class OpaqueType:
+    """
+    Stand-in for argument types that cannot be restored without importing Megatron (lambdas, functions, Megatron
+    classes). It is not a `type`, so it is handled like the callables it replaces.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return f"OpaqueType({self.name})"
+
+    def __call__(self, value):
+        return value
+
+
+@lru_cache(maxsize=None)
+def _enum_class(name: str, members: str) -> type[Enum]:
+    """
+    Recreates an Enum with the name and members (JSON list of [name, value]) of Megatron's, such that str() / repr()
+    match. The class cannot be looked up in this module, its members pickle as (name, members, member name).
+    """
+    enum_class = Enum(name, [tuple(member) for member in json.loads(members)])
+    enum_class.__reduce_ex__ = lambda member, protocol: (_enum_member, (name, members, member.name))
+    return enum_class
+
+
+def _enum_member(name: str, members: str, member: str) -> Enum:
+    return _enum_class(name, members)[member]
+
+
+@dataclass
+class SchemaAction:
+    """
+    The parts of an argparse.Action that are needed to generate configs and command lines.
+    """
+
+    dest: str
+    option_strings: list[str]
+    nargs: int | str | None = None
+    type: Any = None
+    default: Any = None
+    const: Any = None
+    choices: list[Any] | None = None
+    help: str | None = None
+    is_store_const: bool = False
+    is_store_bool: bool = False
+
+    @classmethod
+    def from_action(cls, action: argparse.Action) -> "SchemaAction":
+        return cls(
+            dest=action.dest,
+            option_strings=list(action.option_strings),
+            nargs=action.nargs,
+            type=action.type,
+            default=action.default,
+            const=action.const,
+            choices=list(action.choices) if action.choices is not None else None,
+            help=action.help,
+            is_store_const=isinstance(action, argparse._StoreConstAction),
+            is_store_bool=isinstance(action, argparse._StoreTrueAction | argparse._StoreFalseAction),
+        )
+
+
+@dataclass
+class MegatronArgSchema:
+    """
+    Serializable description of the Megatron argument parser: all actions and the parsed defaults.
+    """
+
+    actions: list[SchemaAction]
+    defaults: dict[str, Any]
+    key: str = ""
+
+    @cached_property
+    def index(self) -> "ParserIndex":
+        return ParserIndex(self)
+
+    def __reduce__(self):
+        # pickled as its JSON form: parser types (lambdas, Megatron functions) become OpaqueType, as in the cache
+        return MegatronArgSchema.from_json, (self.to_json(),)
+
+    @classmethod
+    def from_parser(cls, parser: argparse.ArgumentParser, key: str = "") -> "MegatronArgSchema":
+        return cls(
+            actions=[SchemaAction.from_action(action) for action in parser._actions],
+            defaults=dict(vars(parser.parse_args(args=[]))),
+            key=key,
+        )
+
+    def _encode(self, obj: Any) -> Any:
+        if obj is argparse.SUPPRESS:
+            return {"__suppress__": True}
+        if isinstance(obj, Enum):
+            return {
+                "__enum__": type(obj).__name__,
+                "members": [[member.name, member.value] for member in type(obj)],
+                "name": obj.name,
+            }
+        if isinstance(obj, bool | int | float | str) or obj is None:
+            return obj
+        if isinstance(obj, list | tuple):
+            return [self._encode(o) for o in obj]
+        if isinstance(obj, dict):
+            return {str(k): self._encode(v) for k, v in obj.items()}
+        return str(obj)
+
+    def _decode(self, obj: Any) -> Any:
+        if isinstance(obj, list):
+            return [self._decode(o) for o in obj]
+        if isinstance(obj, dict):
+            if "__suppress__" in obj:
+                return argparse.SUPPRESS
+            if "__enum__" in obj:
+                return _enum_member(obj["__enum__"], json.dumps(obj["members"]), obj["name"])
+            return {k: self._decode(v) for k, v in obj.items()}
+        return obj
+
+    @staticmethod
+    def _encode_type(typ: Any) -> str | None:
+        if typ is None:
+            return None
+        if isinstance(typ, type) and typ.__name__ in _BUILTIN_TYPES and _BUILTIN_TYPES[typ.__name__] is typ:
+            return typ.__name__
+        if isinstance(typ, OpaqueType):
+            return "opaque:" + typ.name
+        return "opaque:" + getattr(typ, "__qualname__", repr(typ))
+
+    @staticmethod
+    def _decode_type(typ: str | None) -> Any:
+        if typ is None:
+            return None
+        if typ in _BUILTIN_TYPES:
+            return _BUILTIN_TYPES[typ]
+        return OpaqueType(typ.removeprefix("opaque:"))
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": SCHEMA_VERSION,
+                "key": self.key,
+                "actions": [
+                    {
+                        "dest": action.dest,
+                        "option_strings": action.option_strings,
+                        "nargs": action.nargs,
+                        "type": self._encode_type(action.type),
+                        "default": self._encode(action.default),
+                        "const": self._encode(action.const),
+                        "choices": self._encode(action.choices),
+                        "help": action.help,
+                        "is_store_const": action.is_store_const,
+                        "is_store_bool": action.is_store_bool,
+                    }
+                    for action in self.actions
+                ],
+                "defaults": self._encode(self.defaults),
+            }
+        )
+
+    @classmethod
+    def from_json(cls, data: str) -> "MegatronArgSchema":
+        raw = json.loads(data)
+        if raw.get("version") != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported schema version {raw.get('version')}")
+        schema = cls(actions=[], defaults={}, key=raw["key"])
+        schema.actions = [
+            SchemaAction(
+                dest=action["dest"],
+                option_strings=action["option_strings"],
+                nargs=action["nargs"],
+                type=cls._decode_type(action["type"]),
+                default=schema._decode(action["default"]),
+                const=schema._decode(action["const"]),
+                choices=schema._decode(action["choices"]),
+                help=action["help"],
+                is_store_const=action["is_store_const"],
+                is_store_bool=action["is_store_bool"],
+            )
+            for action in raw["actions"]
+        ]
+        schema.defaults = schema._decode(raw["defaults"])
+        return schema
+
+
+def megatron_checkout_dir() -> str | None:
+    """
+    Locates the `megatron` package without importing it (and therefore torch).
+    """
+    spec = importlib.util.find_spec("megatron")
+    if spec is None:
+        return None
+    if spec.submodule_search_locations:
+        return list(spec.submodule_search_locations)[0]
+    if spec.origin:
+        return os.path.dirname(spec.origin)
+    return None
+
+
+def megatron_schema_key() -> str | None:
+    """
+    Hash of the Megatron-LM checkout (path, size and mtime of all python files of the megatron package) and the
+    python version. Only file metadata is read, a changed file gets a new mtime.
+    """
+    megatron_dir = megatron_checkout_dir()
+    if megatron_dir is None:
+        return None
+    hasher = hashlib.sha256(f"{SCHEMA_VERSION}:{sys.version_info[:2]}".encode())
+    return hash_file_stats(megatron_dir, suffixes=(".py",), hasher=hasher)
+
+
+# schema handed over by the parent process (e.g. to the workers of a sweep), skips the checkout hash
+_GIVEN_SCHEMA: MegatronArgSchema | None = None
+
+
+def set_megatron_schema(schema: MegatronArgSchema):
+    """
+    Sets the schema returned by get_megatron_schema, e.g. as initializer of worker processes.
+    """
+    global _GIVEN_SCHEMA
+    _GIVEN_SCHEMA = schema
+
+
+def get_megatron_schema(use_cache: bool = True) -> MegatronArgSchema:
+    """
+    Returns the Megatron argument schema, loaded from the on-disk cache if the Megatron-LM checkout did not change.
+    Only on a cache miss Megatron (and torch) are imported to build the parser.
+    """
+    if _GIVEN_SCHEMA is not None:
+        return _GIVEN_SCHEMA
+    return _load_megatron_schema(use_cache)
+
+
+@lru_cache
+def _load_megatron_schema(use_cache: bool = True) -> MegatronArgSchema:
+    key = megatron_schema_key() if use_cache else None
+    cache_file = get_cache_dir("megatron_schema") / f"{key}.json" if key else None
+    if cache_file is not None and cache_file.exists():
+        try:
+            with open(cache_file) as fp:
+                return MegatronArgSchema.from_json(fp.read())
+        except (ValueError, KeyError):
+            pass
+    schema = MegatronArgSchema.from_parser(get_megatron_parser(), key=key or "")
+    if cache_file is not None:
+        atomic_write(cache_file, schema.to_json())
+    return schema
+
+
+_PARSER_SCHEMAS: "weakref.WeakKeyDictionary[argparse.ArgumentParser, MegatronArgSchema]" = weakref.WeakKeyDictionary()
+
+
+def as_schema(parser: argparse.ArgumentParser | MegatronArgSchema) -> MegatronArgSchema:
+    if isinstance(parser, MegatronArgSchema):
+        return parser
+    if parser not in _PARSER_SCHEMAS:
+        _PARSER_SCHEMAS[parser] = MegatronArgSchema.from_parser(parser)
+    return _PARSER_SCHEMAS[parser]
+
+
+def _extract_action_type(action: SchemaAction):
+    typ = bool if action.is_store_bool else action.type
     if action.nargs == "+" or action.nargs == "*":
         if typ is None:
             return list[str]
@@ -26,29 +300,21 @@ def _extract_action_type(action: argparse.Action):
 
 
 def get_choices_arg(
-    parser: argparse.ArgumentParser,
+    parser: argparse.ArgumentParser | MegatronArgSchema,
     arg: str,
 ):
-    for action in parser._actions:
-        if action.dest == arg:
-            if action.choices:
-                return action.choices
-    return None
+    return as_schema(parser).index.choices.get(arg)
 
 
 def get_help(
-    parser: argparse.ArgumentParser,
+    parser: argparse.ArgumentParser | MegatronArgSchema,
     arg: str,
 ):
-    for action in parser._actions:
-        if action.dest == arg:
-            if action.help:
-                return action.help
-    return None
+    return as_schema(parser).index.help.get(arg)
 
 
 def get_args_and_types(
-    parser: argparse.ArgumentParser,
+    parser: argparse.ArgumentParser | MegatronArgSchema,
     exclude_args: list[str] | None = None,
     override_defaults: dict[str, Any] | None = None,
 ) -> dict[str, tuple[Type, Any]]:
@@ -56,24 +322,23 @@ def get_args_and_types(
     Generates a configuration dictionary from the given arguments.
 
     Args:
-        args: The parsed arguments from argparse.
+        parser: The argument parser or its cached schema.
         exclude_args: A list of argument names to exclude from the configuration.
         override_defaults: A dictionary of argument names and values to override the defaults.
 
     Returns:
         A dictionary representing the configuration.
     """
-    args = parser.parse_args(args=[])
+    schema = as_schema(parser)
 
     config = {}
     exclude_args = exclude_args or []
     override_defaults = override_defaults or {}
 
-    arg_types = {action.dest: _extract_action_type(action) for action in parser._actions}
+    arg_types = {action.dest: _extract_action_type(action) for action in schema.actions}
 
-    for arg in vars(args):
+    for arg, value in schema.defaults.items():
         if arg not in exclude_args:
-            value = getattr(args, arg)
             if arg in override_defaults:
                 value = override_defaults.get(arg, value)
 
@@ -89,33 +354,134 @@ def _arg_to_str(a: Any):
         return str(a)
 
 
-def _arg_to_cmdline(arg: str, argval: Any, parser: argparse.ArgumentParser) -> list[str]:
-    def is_default(a: argparse.Action, value: Any) -> bool:
-        # Treat SUPPRESS as "no default"
-        if a.default is argparse.SUPPRESS:
-            return False
-        return value == a.default
+@dataclass(frozen=True)
+class EmitPlan:
+    """
+    Precompiled command-line emission for a single argument (dest).
 
-    cmdline = []
-    for action in parser._actions:
-        if action.dest == arg:
-            if isinstance(action, argparse._StoreConstAction):
-                if not is_default(action, argval):
-                    if argval == action.const:
-                        cmdline.append(action.option_strings[0])
-            else:
-                default = action.default
-                if isinstance(default, Enum):
-                    default = str(default)
-                if argval != default and (action.nargs not in ["+", "*"] or argval):
-                    cmdline.append("--" + arg.replace("_", "-"))
-                    if action.nargs in ["+", "*"]:
-                        for argv in argval:
-                            cmdline.append(_arg_to_str(argv))
-                    else:
-                        cmdline.append(_arg_to_str(argval))
-            break
-    return cmdline
+    store_const actions emit their flag iff the value equals the const and differs from the default, all other
+    actions emit `--dest value...` iff the value differs from the (Enum-normalized) default.
+    """
+
+    dest: str
+    flag: str
+    store_const: bool
+    is_list: bool
+    default: Any
+    const: Any = None
+    has_default: bool = True
+
+    @classmethod
+    def from_action(cls, action: SchemaAction) -> "EmitPlan":
+        if action.is_store_const:
+            return cls(
+                dest=action.dest,
+                flag=action.option_strings[0],
+                store_const=True,
+                is_list=False,
+                default=action.default,
+                const=action.const,
+                has_default=action.default is not argparse.SUPPRESS,
+            )
+        default = action.default
+        if isinstance(default, Enum):
+            default = str(default)
+        return cls(
+            dest=action.dest,
+            flag="--" + action.dest.replace("_", "-"),
+            store_const=False,
+            is_list=action.nargs in ["+", "*"],
+            default=default,
+        )
+
+    def emit(self, argval: Any) -> list[str]:
+        if self.store_const:
+            if not (self.has_default and argval == self.default) and argval == self.const:
+                return [self.flag]
+            return []
+        if argval != self.default and (not self.is_list or argval):
+            if self.is_list:
+                return [self.flag] + [_arg_to_str(argv) for argv in argval]
+            return [self.flag, _arg_to_str(argval)]
+        return []
+
+
+def _memo_key(argval: Any):
+    # include types, as e.g. True == 1 but they are rendered differently
+    if isinstance(argval, list | tuple):
+        return (type(argval), tuple(_memo_key(v) for v in argval))
+    return (type(argval), argval)
+
+
+class ParserIndex:
+    """
+    Index over the Megatron arguments that is built once: choices, help and an emit plan per dest.
+    Converts config dicts to command lines in a single pass, emitted tokens are memoized per (dest, value),
+    such that rendering many similar configs (sweeps) is cheap.
+    """
+
+    def __init__(self, parser: argparse.ArgumentParser | MegatronArgSchema):
+        schema = as_schema(parser)
+        self.plans: dict[str, EmitPlan] = {}
+        self.choices: dict[str, list[Any]] = {}
+        self.help: dict[str, str] = {}
+        # first match wins, as for argparse actions sharing a dest
+        for action in schema.actions:
+            if action.dest not in self.plans:
+                self.plans[action.dest] = EmitPlan.from_action(action)
+            if action.choices and action.dest not in self.choices:
+                self.choices[action.dest] = action.choices
+            if action.help and action.dest not in self.help:
+                self.help[action.dest] = action.help
+        self._memo: dict[tuple[str, Any], list[str]] = {}
+
+    def emit(self, arg: str, argval: Any) -> list[str]:
+        plan = self.plans.get(arg)
+        if plan is None:
+            return []
+        try:
+            key = (arg, _memo_key(argval))
+            if key not in self._memo:
+                self._memo[key] = plan.emit(argval)
+            return self._memo[key]
+        except TypeError:  # unhashable values
+            return plan.emit(argval)
+
+    def to_cmdline(
+        self,
+        args: dict[str, Any],
+        skip_none: bool = True,
+        ignore_args: Iterable[str] = (),
+        default_skip: dict[str, Any] | None = None,
+    ) -> list[str]:
+        ignore_args = set(ignore_args)
+        default_skip = default_skip or {}
+        cmdline = []
+        for arg, val in args.items():
+            if (val is not None or not skip_none) and arg not in ignore_args:
+                if arg not in default_skip or default_skip[arg] != val:
+                    cmdline += self.emit(arg, val)
+        return cmdline
+
+    def to_cmdlines(
+        self,
+        configs: Iterable[dict[str, Any]],
+        skip_none: bool = True,
+        ignore_args: Iterable[str] = (),
+        default_skip: dict[str, Any] | None = None,
+    ) -> list[list[str]]:
+        """
+        Batch version of to_cmdline, e.g. for rendering all points of a sweep.
+        """
+        ignore_args = set(ignore_args)
+        return [
+            self.to_cmdline(cfg, skip_none=skip_none, ignore_args=ignore_args, default_skip=default_skip)
+            for cfg in configs
+        ]
+
+
+def _arg_to_cmdline(arg: str, argval: Any, parser: argparse.ArgumentParser | MegatronArgSchema) -> list[str]:
+    return list(as_schema(parser).index.emit(arg, argval))
 
 
 def get_cmdline_args(
@@ -123,17 +489,18 @@ def get_cmdline_args(
     skip_none: bool = True,
     ignore_args: list[str] = [],
     default_skip: dict[str, Any] | None = None,
-    parser: argparse.ArgumentParser | None = None,
+    parser: argparse.ArgumentParser | MegatronArgSchema | None = None,
 ):
     cmdline = []
     if default_skip is None:
         default_skip = {}
+    if parser is not None:
+        return as_schema(parser).index.to_cmdline(
+            args, skip_none=skip_none, ignore_args=ignore_args, default_skip=default_skip
+        )
     for arg, val in args.items():
         if (val is not None or not skip_none) and arg not in ignore_args:
             if arg not in default_skip or default_skip[arg] != val:
-                if parser is None:
-                    cmdline.append("--" + arg.replace("_", "-"))
-                    cmdline.append(_arg_to_str(val))
-                else:
-                    cmdline += _arg_to_cmdline(arg, val, parser)
+                cmdline.append("--" + arg.replace("_", "-"))
+                cmdline.append(_arg_to_str(val))
     return cmdline
@@ -0,0 +1,167 @@
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from .blend import INDEX_DTYPES, INDEX_HEADER, read_index_arrays
+
+# samples are drawn in batches, so the per-sample python overhead is only the reads themselves
+DRAW_BATCH = 1024
+
+
+def write_indexed_dataset(
+    prefix: str | Path, lengths: np.ndarray, dtype=np.uint16, vocab_size: int = 32000, seed: int = 0
+) -> int:
+    """
+    Writes a Megatron indexed dataset (<prefix>.idx/.bin) with one sequence per document of the given lengths and
+    random tokens. Returns the number of tokens.
+    """
+    dtype = np.dtype(dtype)
+    lengths = np.asarray(lengths, dtype=np.int32)
+    pointers = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1].astype(np.int64) * dtype.itemsize, out=pointers[1:])
+    document_indices = np.arange(len(lengths) + 1, dtype=np.int64)
+    dtype_code = next(code for code, code_dtype in INDEX_DTYPES.items() if np.dtype(code_dtype) == dtype)
+
+    with open(f"{prefix}.idx", "wb") as fp:
+        fp.write(INDEX_HEADER + struct.pack("<QBQQ", 1, dtype_code, len(lengths), len(document_indices)))
+        fp.write(lengths.tobytes())
+        fp.write(pointers.tobytes())
+        fp.write(document_indices.tobytes())
+
+    rng = np.random.default_rng(seed)
+    num_tokens = int(lengths.sum(dtype=np.int64))
+    with open(f"{prefix}.bin", "wb") as fp:
+        for start in range(0, num_tokens, 2**24):
+            fp.write(rng.integers(0, vocab_size, min(2**24, num_tokens - start)).astype(dtype).tobytes())
+    return num_tokens
+
+
+def synthetic_blend(
+    directory: str | Path,
+    num_shards: int,
+    tokens_per_shard: int,
+    mean_document_length: int = 1024,
+    dtype=np.uint16,
+    seed: int = 0,
+) -> list[str]:
+    """
+    Writes num_shards indexed datasets with geometrically distributed document lengths, returns their prefixes.
+    """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    prefixes = []
+    for shard in range(num_shards):
+        num_documents = max(1, tokens_per_shard // mean_document_length)
+        lengths = rng.geometric(1 / mean_document_length, num_documents)
+        prefix = str(Path(directory) / f"synthetic_{shard:05d}")
+        write_indexed_dataset(prefix, lengths, dtype=dtype, seed=seed + shard + 1)
+        prefixes.append(prefix)
+    return prefixes
+
+
+def drop_page_cache(prefixes: list[str]):
+    """
+    Asks the kernel to evict the .bin files from the page cache, such that reads hit the storage.
+    """
+    for prefix in prefixes:
+        with open(f"{prefix}.bin", "rb") as fp:
+            os.posix_fadvise(fp.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class _Shard:
+    def __init__(self, prefix: str):
+        self.dtype, self.lengths, self.pointers, _ = read_index_arrays(prefix)
+        self.fp = open(f"{prefix}.bin", "rb")
+        self.bin = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, sequence: int, offset: int, count: int) -> np.ndarray:
+        start = int(self.pointers[sequence]) + offset * self.dtype.itemsize
+        return np.frombuffer(self.bin, dtype=self.dtype, count=count, offset=start).copy()
+
+
+def _read_samples(
+    prefixes: list[str], weights: list[float], seq_length: int, duration: float, seed: int
+) -> tuple[int, int, float]:
+    """
+    Worker: reads samples like GPTDataset for duration seconds. A sample of seq_length + 1 tokens starts at a
+    random position of a random document and continues with further random documents of the same blend component
+    (the shuffled document order). Returns the number of samples, tokens and the elapsed time.
+    """
+    rng = np.random.default_rng(seed)
+    shards = [_Shard(prefix) for prefix in prefixes]
+    num_samples = num_tokens = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        components = rng.choice(len(shards), size=DRAW_BATCH, p=weights)
+        for component in components:
+            shard = shards[component]
+            needed = seq_length + 1
+            sequence = int(rng.integers(len(shard.lengths)))
+            offset = int(rng.integers(max(1, shard.lengths[sequence])))
+            while needed > 0:
+                count = min(needed, int(shard.lengths[sequence]) - offset)
+                num_tokens += len(shard.read(sequence, offset, count))
+                needed -= count
+                sequence, offset = int(rng.integers(len(shard.lengths))), 0
+            num_samples += 1
+    return num_samples, num_tokens, time.perf_counter() - start
+
+
+@dataclass
+class PipelineThroughput:
+    """
+    Read rate of all workers together (the sum of the per-worker rates, as they run concurrently).
+    """
+
+    workers: int
+    samples: int
+    tokens: int
+    samples_per_s: float
+    tokens_per_s: float
+
+
+def benchmark_data_pipeline(
+    prefixes: list[str],
+    weights: list[float] | None,
+    seq_length: int,
+    workers: int = 1,
+    duration: float = 10.0,
+    seed: int = 0,
+) -> PipelineThroughput:
+    """
+    Reads random samples of a blend with workers processes for duration seconds.
+    Without weights, components are sampled in proportion to their number of tokens.
+    """
+    if weights is None:
+        weights = [float(read_index_arrays(prefix)[1].sum(dtype=np.int64)) for prefix in prefixes]
+    weights = list(np.asarray(weights, dtype=np.float64) / sum(weights))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_read_samples, prefixes, weights, seq_length, duration, seed + worker)
+            for worker in range(workers)
+        ]
+        results = [future.result() for future in futures]
+    samples, tokens, seconds = (np.array(values) for values in zip(*results))
+    return PipelineThroughput(
+        workers=workers,
+        samples=int(samples.sum()),
+        tokens=int(tokens.sum()),
+        samples_per_s=float((samples / seconds).sum()),
+        tokens_per_s=float((tokens / seconds).sum()),
+    )
+
+
+def required_tokens_per_s_per_node(global_batch_size: int, seq_length: int, itertime_ms: float, nodes: int) -> float:
+    """
+    Tokens per second each node has to load to sustain an iteration time.
+
+    >>> required_tokens_per_s_per_node(512, 4096, 2000.0, 4)
+    262144.0
+    """
+    return global_batch_size * seq_length / (itertime_ms / 1000) / nodes
@@ -0,0 +1,90 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from .config import get_cmdline_args, get_megatron_schema
+
+# files written by GPTDataset / BlendedDataset next to their <hash>-<class>-<split>-description.txt
+CACHE_SUFFIXES = ("description.txt", ".npy")
+
+
+def megatron_cmdline(megatron_cfg: dict[str, Any]) -> list[str]:
+    """
+    Megatron command line of a (resolved) megatron config, as rendered into the sbatch script.
+    """
+    return get_cmdline_args(
+        megatron_cfg, skip_none=True, ignore_args=["aux"], default_skip={}, parser=get_megatron_schema()
+    )
+
+
+def init_megatron_args(cmdline_args: list[str], world_size: int) -> argparse.Namespace:
+    """
+    Parses and validates the Megatron arguments like rank 0 of a job with world_size GPUs would, without initializing
+    torch.distributed, and sets Megatron's global args and tokenizer.
+    Derived values (data parallel size, global batch size) therefore match the training job.
+    """
+    from megatron.training.arguments import parse_args, validate_args
+    from megatron.training.global_vars import set_global_variables
+
+    os.environ["WORLD_SIZE"] = str(world_size)
+    os.environ["RANK"] = "0"
+    argv, sys.argv = sys.argv, [sys.argv[0]] + list(cmdline_args)
+    try:
+        args = parse_args()
+    finally:
+        sys.argv = argv
+    validate_args(args)
+    set_global_variables(args, build_tokenizer=True)
+    return args
+
+
+def list_cache_files(path: str | Path | None) -> set[Path]:
+    if path is None or not Path(path).is_dir():
+        return set()
+    return {file for file in Path(path).iterdir() if file.name.endswith(CACHE_SUFFIXES)}
+
+
+def prebuild_data_cache(args: argparse.Namespace, num_workers: int | None = None) -> dict[str, Any]:
+    """
+    Builds the document/sample/shuffle indices of all blend components (and the blending indices) for the
+    train/valid/test sample counts of the run, with Megatron's own dataset builder such that the hash-based cache
+    file names and their contents are exactly the ones the training job looks up.
+    Indices that are already cached are only loaded (memory-mapped). The low-level datasets are built by
+    num_workers threads (default: num_dataset_builder_threads of the config); numpy and the C++ helpers release
+    the GIL, so this scales on a CPU node.
+    Call init_megatron_args first.
+    """
+    from megatron.core.datasets.blended_megatron_dataset_builder import BlendedMegatronDatasetBuilder
+    from megatron.core.datasets.gpt_dataset import GPTDataset
+    from megatron.training.training import get_train_valid_test_num_samples
+
+    # pretrain_gpt.py lives in the root of the Megatron-LM checkout
+    from pretrain_gpt import core_gpt_dataset_config_from_args
+
+    config = core_gpt_dataset_config_from_args(args)
+    if num_workers is not None:
+        config.num_dataset_builder_threads = num_workers
+    num_samples = get_train_valid_test_num_samples()
+
+    before = list_cache_files(config.path_to_cache)
+    start = time.perf_counter()
+    # without torch.distributed every dataset is built in this process
+    datasets = BlendedMegatronDatasetBuilder(GPTDataset, num_samples, lambda: True, config).build()
+    duration = time.perf_counter() - start
+    after = list_cache_files(config.path_to_cache)
+
+    return {
+        "path_to_cache": config.path_to_cache,
+        "num_samples": dict(zip(["train", "valid", "test"], num_samples)),
+        "global_batch_size": args.global_batch_size,
+        "seq_length": args.seq_length,
+        "seed": args.seed,
+        "split": args.split,
+        "dataset_lengths": [len(dataset) if dataset is not None else None for dataset in datasets],
+        "new_files": sorted(str(file) for file in after - before),
+        "cached_files": len(after),
+        "duration_s": duration,
+    }
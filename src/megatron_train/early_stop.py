@@ -0,0 +1,189 @@
+import argparse
+import json
+import math
+import shlex
+import subprocess
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .cache import atomic_write
+from .regression import robust_stats
+
+EARLY_STOP_FILE = "early_stop.json"
+# standard error of the median in units of the standard error of the mean (normal distribution, sqrt(pi / 2))
+MEDIAN_SE_SCALE = 1.2533
+
+
+@dataclass
+class EarlyStopSettings:
+    """
+    A speed test converged once, after warmup logged iterations, the last window logged iteration times (at least
+    min_count) give a median with a relative confidence half-width of at most rel_ci (z standard errors) and the
+    medians of the two halves of the window differ by at most 2 x rel_ci (no drift).
+    """
+
+    warmup: int = 4
+    min_count: int = 8
+    window: int = 40
+    rel_ci: float = 0.01
+    z: float = 1.96
+    stop_signal: str = "TERM"
+    stop_timeout: float = 300.0
+    scancel_cmd: str = "scancel"
+    dry_run: bool = False
+
+
+@dataclass
+class SteadyState:
+    median: float
+    noise: float
+    count: int
+    half_width: float
+    drift: float
+    converged: bool
+
+
+def steady_state(itertimes: Any, settings: EarlyStopSettings) -> SteadyState | None:
+    """
+    Steady-state estimate of the iteration time from the logged iteration times after the warmup, None while
+    fewer than min_count are available.
+
+    >>> settings = EarlyStopSettings(warmup=2, min_count=4, window=10)
+    >>> steady_state([5000.0, 1300.0, 1000.0, 1001.0, 999.0], settings) is None
+    True
+    >>> steady_state([5000.0, 1300.0] + [1000.0, 1002.0, 998.0, 1001.0, 999.0, 1000.0], settings)
+    SteadyState(median=1000.0, noise=0.001483, count=6, half_width=0.001487, drift=0.0, converged=True)
+    >>> steady_state([5000.0, 1300.0] + [1000.0, 1100.0, 900.0, 1050.0, 950.0, 1000.0], settings).converged
+    False
+    """
+    values = np.asarray(itertimes, dtype=np.float64)[settings.warmup :][-settings.window :]
+    values = values[~np.isnan(values)]
+    if len(values) < max(settings.min_count, 2):
+        return None
+    stats = robust_stats(values)
+    half = len(values) // 2
+    half_width = settings.z * MEDIAN_SE_SCALE * stats.noise / math.sqrt(stats.count)
+    drift = abs(float(np.median(values[half:])) - float(np.median(values[:half]))) / stats.median
+    return SteadyState(
+        median=stats.median,
+        noise=stats.noise,
+        count=stats.count,
+        half_width=round(half_width, 6),
+        drift=round(drift, 6),
+        converged=bool(half_width <= settings.rel_ci and drift <= 2 * settings.rel_ci),
+    )
+
+
+def write_early_stop(
+    output_dir: str | Path,
+    jobid: str,
+    iteration: int | None,
+    train_iters: int | None,
+    state: SteadyState,
+    tokens_per_s: float,
+    settings: EarlyStopSettings,
+) -> Path:
+    """
+    Writes the final statistics of an early-stopped speed test to <output_dir>/early_stop.json.
+    """
+    path = Path(output_dir) / EARLY_STOP_FILE
+    record = {
+        "jobid": jobid,
+        "iteration": iteration,
+        "train_iters": train_iters,
+        **asdict(state),
+        "tokens_per_s": None if math.isnan(tokens_per_s) else tokens_per_s,
+        "stopped_at": time.time(),
+        "settings": asdict(settings),
+    }
+    atomic_write(path, json.dumps(record, indent=1))
+    return path
+
+
+def read_early_stop(output_dir: str | Path) -> dict[str, Any] | None:
+    try:
+        with open(Path(output_dir) / EARLY_STOP_FILE) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def stop_job(jobid: str, settings: EarlyStopSettings, signal_only: bool = True):
+    """
+    Sends the stop signal to the job steps (not the batch shell), such that Megatron's exit_signal_handler ends
+    the training cleanly, or cancels the job.
+    """
+    cmd = shlex.split(settings.scancel_cmd)
+    if signal_only:
+        cmd.append(f"--signal={settings.stop_signal}")
+    if settings.dry_run:
+        print(f"Dry run, not running {' '.join(cmd + [str(jobid)])}")
+        return
+    subprocess.run(cmd + [str(jobid)], check=False)
+
+
+def early_stop_script(cmd: str, log_pattern: str, output_dir: str, settings: EarlyStopSettings) -> tuple[str, str]:
+    """
+    Bash blocks before and after the launch: the first starts the early stop as a sidecar of the batch script (%j
+    of the log pattern is the job id), the second stops it once srun returned, keeping the exit status of srun.
+
+    >>> early_stop_script("python early_stop.py", "/out/%j.out", "/out", EarlyStopSettings())[0].splitlines()[1]
+    'python early_stop.py --jobid "$SLURM_JOB_ID" --log /out/"$SLURM_JOB_ID".out --output-dir /out --warmup 4 \
+--min-count 8 --window 40 --rel-ci 0.01 --z 1.96 --stop-signal TERM --stop-timeout 300.0 --scancel scancel &'
+    """
+    log = '"$SLURM_JOB_ID"'.join(shlex.quote(part) if part else "" for part in log_pattern.split("%j"))
+    args = [
+        f'--jobid "$SLURM_JOB_ID" --log {log} --output-dir {shlex.quote(output_dir)}',
+        f"--warmup {settings.warmup} --min-count {settings.min_count} --window {settings.window}",
+        f"--rel-ci {settings.rel_ci} --z {settings.z}",
+        f"--stop-signal {settings.stop_signal} --stop-timeout {settings.stop_timeout}",
+        f"--scancel {shlex.quote(settings.scancel_cmd)}",
+    ]
+    setup = [
+        "# early stop: ends the speed test once the iteration time converged",
+        f"{cmd} {' '.join(args)} &",
+        "EARLY_STOP_PID=$!",
+    ]
+    after = [
+        "early_stop_status=$?",
+        'kill "$EARLY_STOP_PID" 2>/dev/null',
+        "( exit $early_stop_status )",
+    ]
+    return "\n".join(setup) + "\n", "\n".join(after) + "\n"
+
+
+def add_early_stop_args(parser: argparse.ArgumentParser):
+    """
+    Arguments of the convergence criterion and the stop of the job.
+    """
+    parser.add_argument("--warmup", type=int, default=4, help="Logged iterations skipped as warmup")
+    parser.add_argument("--min-count", type=int, default=8, help="Minimal logged iterations of the estimate")
+    parser.add_argument("--window", type=int, default=40, help="Logged iterations of the steady-state estimate")
+    parser.add_argument(
+        "--rel-ci", type=float, default=0.01, help="Target relative confidence half-width of the median"
+    )
+    parser.add_argument("--z", type=float, default=1.96, help="Standard errors of the confidence interval")
+    parser.add_argument("--stop-signal", type=str, default="TERM", help="Signal handled by Megatron")
+    parser.add_argument(
+        "--stop-timeout", type=float, default=300.0, help="Seconds after the signal until the job is cancelled"
+    )
+    parser.add_argument("--scancel", type=str, default="scancel", help="scancel command")
+    parser.add_argument("--dry-run", action="store_true", help="Write the statistics, but do not stop the job")
+
+
+def early_stop_settings(args: argparse.Namespace) -> EarlyStopSettings:
+    return EarlyStopSettings(
+        warmup=args.warmup,
+        min_count=args.min_count,
+        window=args.window,
+        rel_ci=args.rel_ci,
+        z=args.z,
+        stop_signal=args.stop_signal,
+        stop_timeout=args.stop_timeout,
+        scancel_cmd=args.scancel,
+        dry_run=args.dry_run,
+    )
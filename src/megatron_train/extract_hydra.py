@@ -1,12 +1,22 @@
+import itertools
 import os
 from datetime import datetime
 from math import sqrt as _sqrt
 
+import hydra
 from hydra import compose, initialize_config_dir
-from omegaconf import OmegaConf
+from hydra._internal.config_loader_impl import ConfigLoaderImpl
+from hydra.core.override_parser.overrides_parser import OverridesParser
+from hydra.core.override_parser.types import Override
+from omegaconf import DictConfig, OmegaConf, open_dict
 from omegaconf.listconfig import ListConfig
 import omegaconf
 from functools import lru_cache
+from typing import Any, Literal
+
+from .cache import DiskLRUCache, get_cache_dir, hash_files, hash_key
+
+COMPOSE_CACHE_MAX_BYTES = int(os.environ.get("MEGATRON_TRAIN_COMPOSE_CACHE_BYTES", 256 * 2**20))
 
 
 def safe_mul(*args):
@@ -134,20 +144,139 @@ def config_yaml_to_cmdline(config_yaml: str, override: str = "") -> list[str]:
     return cmdline_opts
 
 
+def expand_sweep_overrides(overrides: list[str]) -> list[list[str]]:
+    """
+    Expands hydra multirun-style overrides (e.g. `slurm.nodes=1,2,4 megatron.micro_batch_size=range(1,3)`)
+    into the override lists of all points of the grid (like hydra's BasicSweeper).
+    """
+    axes = []
+    for override in OverridesParser.create().parse_overrides(overrides):
+        if override.is_sweep_override():
+            key = override.get_key_element()
+            axes.append([f"{key}={value}" for value in override.sweep_string_iterator()])
+        else:
+            axes.append([override.input_line])
+    return [list(point) for point in itertools.product(*axes)]
+
+
+def compose_cache_key(
+    config_dir_hash: str, config_name: str, overrides: list[str], overlay: dict[str, Any] | None = None
+) -> str:
+    # the composed (unresolved) config only depends on the config files, the config name, the overlay and overrides
+    return hash_key(
+        hydra.__version__, config_dir_hash, config_name, [override.strip() for override in overrides], overlay or {}
+    )
+
+
+def load_config_overlay(config_yaml: str | dict[str, Any] | None) -> dict[str, Any]:
+    if not config_yaml:
+        return {}
+    if isinstance(config_yaml, str):
+        config_yaml = OmegaConf.create(config_yaml)
+    overlay = OmegaConf.to_container(OmegaConf.create(config_yaml))
+    if "defaults" in overlay:
+        raise ValueError("A config overlay must not contain a defaults list, use command line overrides instead.")
+    return overlay
+
+
+def split_overrides(overrides: list[str], config_path: str) -> tuple[list[str], list[Override]]:
+    """
+    Splits command line overrides like hydra into config group overrides (e.g. `slurm=juwels`,
+    `+experiments@_global_=speed_test`), which select config files, and value overrides, which are applied to the
+    composed config. Overrides of the hydra config itself count as group overrides, they are handled by compose.
+    """
+    group_overrides, value_overrides = [], []
+    for override in OverridesParser.create().parse_overrides(overrides):
+        key = override.key_or_group
+        is_group = override.package is not None or os.path.isdir(os.path.join(config_path, key))
+        if key.split(".")[0] == "hydra" or (is_group and not isinstance(override.value(), dict)):
+            group_overrides.append(override.input_line)
+        else:
+            value_overrides.append(override)
+    return group_overrides, value_overrides
+
+
+def merge_config_overlay(cfg: DictConfig, overlay: dict[str, Any], value_overrides: list[Override]):
+    """
+    Merges the (structured) overlay into the config composed from the files and config group overrides, then
+    applies the value overrides, as hydra would have applied them after all config files.
+    """
+    with open_dict(cfg):
+        cfg.merge_with(overlay)
+    ConfigLoaderImpl._apply_overrides_to_config(value_overrides, cfg)
+
+
+def run_hydra_many(
+    config_path: str = "./config",
+    config_name: str = "default",
+    cmdline_opts_list: list[list[str]] = [[]],
+    config_yaml: str | dict[str, Any] = "",
+    config_yaml_override_opt: str = "++",
+    use_cache: bool = True,
+    config_yaml_mode: Literal["merge", "overrides"] = "merge",
+) -> list[str]:
+    """
+    Composes the config for several override lists, re-using a single hydra initialization.
+
+    The config_yaml (YAML string or dict) is merged into the composed config as a structured overlay
+    (config_yaml_mode="merge"), or expanded to one string override per leaf (config_yaml_mode="overrides"). Either
+    way it overrides all config files, including config groups selected on the command line, and command line
+    value overrides override it.
+    Composed configs are cached on disk, keyed by the content of all YAML files in the config directory,
+    the config name, the overlay and the overrides, so the cache is invalidated by any config change.
+    """
+    config_path = config_path if os.path.isabs(config_path) else os.path.abspath(config_path)
+    if config_yaml_mode == "merge":
+        overlay = load_config_overlay(config_yaml)
+        config_yaml_opts = []
+    else:
+        overlay = {}
+        config_yaml_opts = config_yaml_to_cmdline(config_yaml, override=config_yaml_override_opt)
+    overrides_list = [config_yaml_opts + list(cmdline_opts) for cmdline_opts in cmdline_opts_list]
+
+    cfgs: list[str | None] = [None] * len(overrides_list)
+    keys: list[str | None] = [None] * len(overrides_list)
+    cache = None
+    if use_cache:
+        cache = DiskLRUCache(get_cache_dir("hydra_compose"), max_bytes=COMPOSE_CACHE_MAX_BYTES, suffix=".yaml")
+        config_dir_hash = hash_files(config_path, suffixes=(".yaml", ".yml"))
+        for n, overrides in enumerate(overrides_list):
+            keys[n] = compose_cache_key(config_dir_hash, config_name, overrides, overlay)
+            cfgs[n] = cache.get(keys[n])
+
+    missing = [n for n, cfg in enumerate(cfgs) if cfg is None]
+    if missing:
+        with initialize_config_dir(version_base=None, config_dir=config_path):
+            for n in missing:
+                if overlay:
+                    # the overlay goes between the config files and the value overrides of the command line
+                    group_overrides, value_overrides = split_overrides(overrides_list[n], config_path)
+                    cfg = compose(config_name=config_name, overrides=group_overrides)
+                    merge_config_overlay(cfg, overlay, value_overrides)
+                else:
+                    cfg = compose(config_name=config_name, overrides=overrides_list[n])
+                cfgs[n] = OmegaConf.to_yaml(cfg)
+                if cache is not None:
+                    cache.put(keys[n], cfgs[n])
+    return cfgs
+
+
 def run_hydra(
     config_path: str = "./config",
     config_name: str = "default",
     cmdline_opts=[],
-    config_yaml: str = "",
+    config_yaml: str | dict[str, Any] = "",
     config_yaml_override_opt: str = "++",
+    use_cache: bool = True,
+    config_yaml_mode: Literal["merge", "overrides"] = "merge",
 ):
     # do not actually run hydra as a separate executable
-
-    config_path = config_path if os.path.isabs(config_path) else os.path.abspath(config_path)
-    with initialize_config_dir(version_base=None, config_dir=config_path):
-        cfg = compose(
-            config_name=config_name,
-            overrides=config_yaml_to_cmdline(config_yaml, override=config_yaml_override_opt) + cmdline_opts,
-        )
-
-    return OmegaConf.to_yaml(cfg)
+    return run_hydra_many(
+        config_path=config_path,
+        config_name=config_name,
+        cmdline_opts_list=[cmdline_opts],
+        config_yaml=config_yaml,
+        config_yaml_override_opt=config_yaml_override_opt,
+        use_cache=use_cache,
+        config_yaml_mode=config_yaml_mode,
+    )[0]
@@ -0,0 +1,159 @@
+from dataclasses import dataclass
+from typing import Any
+
+
+def cfg_get(cfg: Any, key: str, default: Any = None) -> Any:
+    """
+    Reads key from a config dataclass or dict, treating None as missing.
+    """
+    value = cfg.get(key, default) if isinstance(cfg, dict) else getattr(cfg, key, default)
+    return default if value is None else value
+
+
+def cfg_flag(cfg: Any, key: str, default: bool = False) -> bool:
+    """
+    Reads a boolean flag, arguments without a plain type arrive as strings.
+
+    >>> cfg_flag({"fp16": "False", "bf16": True}, "fp16"), cfg_flag({"bf16": "true"}, "bf16")
+    (False, True)
+    """
+    value = cfg_get(cfg, key, default)
+    if isinstance(value, str):
+        return value.strip().lower() not in ["", "false", "0", "no", "none"]
+    return bool(value)
+
+
+def padded_vocab_size(cfg: Any) -> int:
+    """
+    Vocabulary size padded as in Megatron (multiple of make_vocab_size_divisible_by * TP).
+
+    >>> padded_vocab_size({"vocab_size": 50257, "make_vocab_size_divisible_by": 128, "tensor_model_parallel_size": 2})
+    50432
+    """
+    vocab_size = cfg_get(cfg, "padded_vocab_size") or cfg_get(cfg, "vocab_size")
+    if vocab_size is None:
+        raise ValueError("vocab_size is required to compute the model FLOPs")
+    multiple = cfg_get(cfg, "make_vocab_size_divisible_by", 128) * cfg_get(cfg, "tensor_model_parallel_size", 1)
+    return ((int(vocab_size) + multiple - 1) // multiple) * multiple
+
+
+def effective_recompute_granularity(cfg: Any) -> str | None:
+    """
+    Megatron replaces the granularity by "selective" if recompute_activations is set.
+
+    >>> effective_recompute_granularity({"recompute_activations": True, "recompute_granularity": "full"})
+    'selective'
+    """
+    if cfg_get(cfg, "recompute_activations"):
+        return "selective"
+    return cfg_get(cfg, "recompute_granularity")
+
+
+@dataclass
+class FlopsBreakdown:
+    """
+    Floating point operations of one training iteration (forward + backward) for the whole global batch.
+
+    `model` counts the FLOPs of the model itself (as used for MFU), `hardware` additionally includes the
+    forward passes that are recomputed due to activation recomputation (as used for HFU).
+    """
+
+    attention: float
+    mlp: float
+    logits: float
+    recompute: float
+
+    @property
+    def model(self) -> float:
+        return self.attention + self.mlp + self.logits
+
+    @property
+    def hardware(self) -> float:
+        return self.model + self.recompute
+
+
+def flops_per_iteration(cfg: Any, global_batch_size: int | None = None) -> FlopsBreakdown:
+    """
+    Computes the FLOPs of one training iteration from a MegatronConfig (or the megatron part of a config dict),
+    following Megatron-LM's num_floating_point_operations: every GEMM is executed three times (forward,
+    weight gradient, data gradient), GQA reduces the key/value projections, MoE layers execute top-k experts
+    (plus shared experts) and SwiGLU adds a third MLP matrix.
+
+    >>> cfg = dict(num_layers=26, hidden_size=2048, ffn_hidden_size=8192, num_attention_heads=16,
+    ...            group_query_attention=True, num_query_groups=2, kv_channels=128, seq_length=4096,
+    ...            vocab_size=50304, swiglu=True, global_batch_size=1)
+    >>> round(flops_per_iteration(cfg).model / 1e12, 2)
+    46.08
+    >>> cfg["recompute_granularity"] = "full"
+    >>> round(flops_per_iteration(cfg).hardware / flops_per_iteration(cfg).model, 3)
+    1.315
+    """
+    batch_size = global_batch_size or cfg_get(cfg, "global_batch_size")
+    if batch_size is None:
+        raise ValueError("global_batch_size is required to compute the FLOPs per iteration")
+    seq_length = cfg_get(cfg, "seq_length")
+    num_layers = cfg_get(cfg, "num_layers")
+    hidden_size = cfg_get(cfg, "hidden_size")
+    num_heads = cfg_get(cfg, "num_attention_heads")
+    kv_channels = cfg_get(cfg, "kv_channels", hidden_size // num_heads)
+    num_query_groups = (
+        cfg_get(cfg, "num_query_groups", num_heads) if cfg_get(cfg, "group_query_attention") else num_heads
+    )
+
+    num_experts = cfg_get(cfg, "num_experts")
+    if num_experts:
+        ffn_hidden_size = cfg_get(cfg, "moe_ffn_hidden_size", cfg_get(cfg, "ffn_hidden_size"))
+        experts_routed_to = cfg_get(cfg, "moe_router_topk", 2)
+        shared_ffn_hidden_size = cfg_get(cfg, "moe_shared_expert_intermediate_size", 0)
+    else:
+        ffn_hidden_size = cfg_get(cfg, "ffn_hidden_size", 4 * hidden_size)
+        experts_routed_to = 1
+        shared_ffn_hidden_size = 0
+    gated_linear_multiplier = 3 / 2 if cfg_get(cfg, "swiglu") else 1
+
+    # 3x forward/wgrad/dgrad, 2x two stacked GEMMs per block, 2x multiply-add
+    tokens_x_layers = 3 * 2 * 2 * batch_size * seq_length * num_layers
+    query_projection_size = kv_channels * num_heads
+    attention_projections = tokens_x_layers * hidden_size * query_projection_size * (1 + num_query_groups / num_heads)
+    # only half of the attention matrix is non-zero (causal)
+    attention_core = tokens_x_layers * query_projection_size * seq_length / 2
+    mlp = tokens_x_layers * hidden_size * (ffn_hidden_size * experts_routed_to + shared_ffn_hidden_size)
+    mlp *= gated_linear_multiplier
+    logits = 3 * 2 * batch_size * seq_length * hidden_size * padded_vocab_size(cfg)
+
+    # recomputation repeats (parts of) the forward pass, i.e. a third of the layer FLOPs
+    recompute = 0.0
+    recompute_granularity = effective_recompute_granularity(cfg)
+    if recompute_granularity == "full":
+        recompute_method = cfg_get(cfg, "recompute_method")
+        recompute_num_layers = cfg_get(cfg, "recompute_num_layers")
+        fraction = 1.0
+        if recompute_method == "block" and recompute_num_layers is not None:
+            pipeline_size = cfg_get(cfg, "pipeline_model_parallel_size", 1)
+            fraction = min(1.0, recompute_num_layers * pipeline_size / num_layers)
+        recompute = fraction * (attention_projections + attention_core + mlp) / 3
+    elif recompute_granularity == "selective":
+        recompute = attention_core / 3
+
+    return FlopsBreakdown(attention=attention_projections + attention_core, mlp=mlp, logits=logits, recompute=recompute)
+
+
+def achieved_tflops_per_gpu(flops: float, itertime_ms: float, num_gpus: int) -> float:
+    return flops / (itertime_ms / 1000) / num_gpus / 1e12
+
+
+def model_flops_utilization(
+    cfg: Any, itertime_ms: float, num_gpus: int, peak_tflops_per_gpu: float | None, global_batch_size: int | None = None
+) -> dict[str, float]:
+    """
+    Achieved model TFLOP/s per GPU, MFU and HFU (including recomputation) for an iteration time.
+    """
+    flops = flops_per_iteration(cfg, global_batch_size=global_batch_size)
+    model_tflops = achieved_tflops_per_gpu(flops.model, itertime_ms, num_gpus)
+    hardware_tflops = achieved_tflops_per_gpu(flops.hardware, itertime_ms, num_gpus)
+    peak = peak_tflops_per_gpu or float("nan")
+    return {
+        "model_tflops_per_gpu": model_tflops,
+        "mfu": model_tflops / peak,
+        "hfu": hardware_tflops / peak,
+    }
@@ -3,7 +3,30 @@ import time
 import signal
 import atexit
 import os
+import sys
+import asyncio
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+import yaml
+from .early_stop import EarlyStopSettings, SteadyState, steady_state, stop_job, write_early_stop
 from .run import run_with_tee
+from .training_log import ITERATION_RE, parse_key_values
+from .watchdog import Watchdog, WatchdogSettings, handle_stall
+
+# squeue only lists pending/running jobs, scontrol reports these once they left the queue
+SLURM_FINAL_STATES = [
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "PREEMPTED",
+    "TIMEOUT",
+]
 
 
 def job_log(jobid: str):
@@ -35,4 +58,327 @@ def job_log(jobid: str):
             except Exception:
                 pass
 
-        run_with_tee(log_cmd, text=True)
+        # runs for the whole job, keep nothing in memory
+        run_with_tee(log_cmd, text=True, capture="none")
+
+
+@dataclass
+class JobProgress:
+    """
+    Live progress of one job, from the iteration lines of its StdOut file. Only a rolling window of iteration
+    times is kept, such that following a job for days needs constant memory.
+    """
+
+    jobid: str
+    window: int = 20
+    state: str = "PENDING"
+    stdout: str | None = None
+    offset: int = 0
+    inode: int = 0
+    iteration: int | None = None
+    train_iters: int | None = None
+    global_batch_size: float | None = None
+    seq_length: int | None = None
+    lm_loss: float | None = None
+    itertimes: deque = field(default_factory=deque)
+    rest: bytes = b""
+
+    @property
+    def finished(self) -> bool:
+        return self.state.split(" ")[0] in SLURM_FINAL_STATES
+
+    def feed(self, data: bytes):
+        """
+        Parses appended log data, a trailing incomplete line is kept for the next call.
+        """
+        data = self.rest + data
+        cut = data.rfind(b"\n") + 1
+        self.rest = data[cut:]
+        for match in ITERATION_RE.finditer(data, 0, cut):
+            iteration, train_iters, rest = match.groups()
+            row = parse_key_values(rest)
+            self.iteration, self.train_iters = int(iteration), int(train_iters)
+            if not math.isnan(row.get("itertime_ms", math.nan)):
+                self.itertimes.append(row["itertime_ms"])
+                while len(self.itertimes) > self.window:
+                    self.itertimes.popleft()
+            self.global_batch_size = row.get("global_batch_size", self.global_batch_size)
+            self.lm_loss = row.get("lm_loss", self.lm_loss)
+
+    def read_stdout(self, chunk_bytes: int = 2**20) -> bool:
+        """
+        Reads what was appended to the StdOut file since the last call, returns whether there was new data.
+        """
+        if self.stdout is None:
+            return False
+        try:
+            stat = os.stat(self.stdout)
+        except OSError:
+            return False
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode, self.offset, self.rest = stat.st_ino, 0, b""
+        if stat.st_size == self.offset:
+            return False
+        if self.seq_length is None:
+            self.seq_length = _seq_length_from_config(self.stdout)
+        with open(self.stdout, "rb") as fp:
+            fp.seek(self.offset)
+            while chunk := fp.read(chunk_bytes):
+                self.offset += len(chunk)
+                self.feed(chunk)
+        return True
+
+    @property
+    def itertime_ms(self) -> float:
+        if not self.itertimes:
+            return math.nan
+        ordered = sorted(self.itertimes)
+        return ordered[len(ordered) // 2]
+
+    @property
+    def tokens_per_s(self) -> float:
+        if self.global_batch_size is None or self.seq_length is None:
+            return math.nan
+        return 1000 * self.global_batch_size * self.seq_length / self.itertime_ms
+
+    @property
+    def eta_s(self) -> float:
+        if self.iteration is None or self.train_iters is None:
+            return math.nan
+        return (self.train_iters - self.iteration) * self.itertime_ms / 1000
+
+
+def _seq_length_from_config(stdout: str) -> int | None:
+    # run_megatron writes the config next to the slurm output
+    config_file = Path(stdout).parent / "submit_config.yaml"
+    try:
+        with open(config_file) as fp:
+            return int(yaml.safe_load(fp)["megatron"]["seq_length"])
+    except (OSError, KeyError, TypeError, ValueError, yaml.YAMLError):
+        return None
+
+
+def _format_duration(seconds: float) -> str:
+    """
+    >>> _format_duration(93784), _format_duration(float("nan"))
+    ('1d02:03:04', '-')
+    """
+    if math.isnan(seconds):
+        return "-"
+    seconds = int(seconds)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return (f"{days}d" if days else "") + f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def format_progress_table(jobs: list[JobProgress]) -> str:
+    rows = [["jobid", "state", "iteration", "itertime_ms", "tokens/s", "lm_loss", "eta"]]
+    for job in jobs:
+        rows.append(
+            [
+                job.jobid,
+                job.state,
+                f"{job.iteration}/{job.train_iters}" if job.iteration is not None else "-",
+                f"{job.itertime_ms:.1f}" if job.itertimes else "-",
+                f"{job.tokens_per_s:.0f}" if not math.isnan(job.tokens_per_s) else "-",
+                f"{job.lm_loss:.4f}" if job.lm_loss is not None else "-",
+                _format_duration(job.eta_s),
+            ]
+        )
+    widths = [max(len(row[col]) for row in rows) for col in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+async def _run_command(*cmd: str) -> tuple[int, str]:
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    stdout, _ = await proc.communicate()
+    return proc.returncode, stdout.decode(errors="replace")
+
+
+async def squeue_states(jobids: list[str], squeue_cmd: str = "squeue") -> dict[str, str]:
+    """
+    States of the queued/running jobs among jobids, with a single squeue call.
+    """
+    returncode, out = await _run_command(squeue_cmd, "-h", "-j", ",".join(jobids), "-o", "%i %T")
+    if returncode != 0:
+        return {}
+    states = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            states[parts[0]] = parts[1]
+    return states
+
+
+async def scontrol_show_job(jobid: str, scontrol_cmd: str = "scontrol") -> dict[str, str]:
+    """
+    Key=Value fields of `scontrol show job`, empty if the job is unknown.
+    """
+    returncode, out = await _run_command(scontrol_cmd, "show", f"jobid={jobid}")
+    if returncode != 0:
+        return {}
+    return dict(re.findall(r"(\w+)=(\S*)", out))
+
+
+async def follow_jobs(
+    jobids: list[str],
+    interval: float = 1.0,
+    slurm_interval: float = 15.0,
+    window: int = 20,
+    scontrol_cmd: str = "scontrol",
+    squeue_cmd: str = "squeue",
+    out=None,
+    watchdog: WatchdogSettings | None = None,
+) -> dict[str, JobProgress]:
+    """
+    Follows many jobs at once: polls the StdOut files every interval seconds (only reading appended bytes),
+    queries slurm every slurm_interval seconds (one squeue call for all jobs, scontrol only for jobs whose
+    StdOut is unknown or which left the queue) and shows a table of the rolling iteration time, tokens/s and
+    ETA until train_iters. Returns once all jobs are finished and their logs are read.
+    With watchdog settings, running jobs that stop printing iteration lines are diagnosed and cancelled.
+    """
+    out = out or sys.stdout
+    live = out.isatty()
+    jobs = {jobid: JobProgress(jobid=str(jobid), window=window) for jobid in jobids}
+    watchdogs: dict[str, Watchdog] = {}
+    last_table = None
+    next_slurm_query = 0.0
+    while True:
+        if time.monotonic() >= next_slurm_query:
+            next_slurm_query = time.monotonic() + slurm_interval
+            running = [job for job in jobs.values() if not job.finished]
+            states = await squeue_states([job.jobid for job in running], squeue_cmd) if running else {}
+            # jobs that left the queue (or whose log path is unknown) need scontrol
+            details = [job for job in running if job.jobid not in states or job.stdout is None]
+            for job, info in zip(
+                details, await asyncio.gather(*[scontrol_show_job(job.jobid, scontrol_cmd) for job in details])
+            ):
+                job.stdout = info.get("StdOut", job.stdout)
+                if job.jobid not in states:
+                    states[job.jobid] = info.get("JobState", "COMPLETED")
+            for job in running:
+                job.state = states.get(job.jobid, job.state)
+
+        for job in jobs.values():
+            job.read_stdout()
+        if watchdog is not None:
+            await _check_stalls(jobs, watchdogs, watchdog)
+
+        table = format_progress_table(list(jobs.values()))
+        if table != last_table:
+            if live and last_table is not None:
+                # move the cursor up and overwrite the previous table
+                out.write(f"\x1b[{last_table.count(chr(10)) + 1}F\x1b[J")
+            out.write(table + "\n")
+            out.flush()
+            last_table = table
+
+        if all(job.finished for job in jobs.values()):
+            return jobs
+        await asyncio.sleep(interval)
+
+
+async def _check_stalls(jobs: dict[str, JobProgress], watchdogs: dict[str, Watchdog], settings: WatchdogSettings):
+    now = time.monotonic()
+    for job in jobs.values():
+        # the startup grace counts from the time the job is seen running
+        if job.state != "RUNNING" or job.finished:
+            continue
+        watchdog = watchdogs.setdefault(job.jobid, Watchdog(settings, started=now))
+        watchdog.update(now, job.iteration, job.itertimes[-1] if job.itertimes else math.nan)
+        reason = watchdog.check(now)
+        if reason and not watchdog.triggered:
+            watchdog.triggered = True
+            await asyncio.to_thread(handle_stall, job.jobid, job.stdout, reason, settings)
+
+
+async def watch_job(
+    jobid: str,
+    settings: WatchdogSettings,
+    stdout: str | None = None,
+    interval: float = 10.0,
+    slurm_interval: float | None = 60.0,
+    scontrol_cmd: str = "scontrol",
+    squeue_cmd: str = "squeue",
+) -> str | None:
+    """
+    Watches a single job (e.g. as a sidecar of its batch script): polls its StdOut every interval seconds and
+    handles a stall once. Without slurm_interval the job state is not queried, the sidecar ends with the job.
+    Returns the stall reason, or None if the job finished.
+    """
+    job = JobProgress(jobid=str(jobid), window=settings.window, state="RUNNING", stdout=stdout)
+    watchdog = Watchdog(settings, started=time.monotonic())
+    next_slurm_query = 0.0
+    while True:
+        if job.stdout is None:
+            job.stdout = (await scontrol_show_job(job.jobid, scontrol_cmd)).get("StdOut")
+        if slurm_interval is not None and time.monotonic() >= next_slurm_query:
+            next_slurm_query = time.monotonic() + slurm_interval
+            states = await squeue_states([job.jobid], squeue_cmd)
+            if job.jobid not in states:
+                states[job.jobid] = (await scontrol_show_job(job.jobid, scontrol_cmd)).get("JobState", "COMPLETED")
+            job.state = states[job.jobid]
+            if job.finished:
+                return None
+        job.read_stdout()
+        now = time.monotonic()
+        if job.state == "RUNNING":
+            watchdog.update(now, job.iteration, job.itertimes[-1] if job.itertimes else math.nan)
+            reason = watchdog.check(now)
+            if reason:
+                await asyncio.to_thread(handle_stall, job.jobid, job.stdout, reason, settings)
+                return reason
+        else:
+            # pending: the startup grace starts when the job runs
+            watchdog.started = now
+        await asyncio.sleep(interval)
+
+
+async def watch_speed(
+    jobid: str,
+    settings: EarlyStopSettings,
+    stdout: str,
+    output_dir: str | None = None,
+    interval: float = 10.0,
+) -> SteadyState | None:
+    """
+    Ends a speed test early (as a sidecar of its batch script): polls its StdOut every interval seconds until the
+    steady-state iteration time converged, writes the statistics to the output dir (default: the log's dir), sends
+    the stop signal and cancels the job if it did not end within stop_timeout seconds. Returns the steady state,
+    or None if the log reached train_iters first.
+    """
+    # the rolling window keeps the warmup until it is full, steady_state skips it
+    job = JobProgress(jobid=str(jobid), window=settings.warmup + settings.window, state="RUNNING", stdout=stdout)
+    while True:
+        if job.read_stdout():
+            if job.iteration is not None and job.iteration >= job.train_iters:
+                return None
+            state = steady_state(job.itertimes, settings)
+            if state is not None and state.converged:
+                break
+        await asyncio.sleep(interval)
+    path = write_early_stop(
+        output_dir or os.path.dirname(stdout),
+        job.jobid,
+        job.iteration,
+        job.train_iters,
+        state,
+        job.tokens_per_s,
+        settings,
+    )
+    print(
+        f"Job {job.jobid} converged at iteration {job.iteration}/{job.train_iters}: {state.median:.1f} ms/iteration "
+        f"+- {100 * state.half_width:.2f}% ({state.count} logged iterations), statistics in {path}"
+    )
+    await asyncio.to_thread(stop_job, job.jobid, settings)
+    if not settings.dry_run:
+        # the sidecar is stopped once srun returned, reaching the timeout means the job did not exit
+        await asyncio.sleep(settings.stop_timeout)
+        print(f"Job {job.jobid} did not exit within {settings.stop_timeout:.0f}s, cancelling it")
+        await asyncio.to_thread(stop_job, job.jobid, settings, False)
+    return state
+
+
+def follow(jobids: list[str], **kwargs) -> dict[str, JobProgress]:
+    return asyncio.run(follow_jobs(jobids, **kwargs))
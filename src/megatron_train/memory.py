@@ -0,0 +1,268 @@
+from dataclasses import dataclass, fields
+from typing import Any
+
+from .flops import cfg_get, effective_recompute_granularity, padded_vocab_size
+
+GIB = 2**30
+
+
+@dataclass
+class ParallelLayout:
+    """
+    Parallel decomposition of the world size as in Megatron-LM (TP x CP x PP x DP, experts: ETP x EP x PP x EDP).
+    """
+
+    world_size: int
+    tp: int = 1
+    pp: int = 1
+    cp: int = 1
+    ep: int = 1
+    etp: int = 1
+
+    @classmethod
+    def from_config(cls, cfg: Any, world_size: int) -> "ParallelLayout":
+        tp = cfg_get(cfg, "tensor_model_parallel_size", 1)
+        return cls(
+            world_size=world_size,
+            tp=tp,
+            pp=cfg_get(cfg, "pipeline_model_parallel_size", 1),
+            cp=cfg_get(cfg, "context_parallel_size", 1),
+            ep=cfg_get(cfg, "expert_model_parallel_size", 1),
+            etp=cfg_get(cfg, "expert_tensor_parallel_size", tp),
+        )
+
+    @property
+    def dp(self) -> int:
+        return max(1, self.world_size // (self.tp * self.pp * self.cp))
+
+    @property
+    def expert_dp(self) -> int:
+        return max(1, self.world_size // (self.etp * self.ep * self.pp))
+
+
+@dataclass
+class ParameterCount:
+    """
+    Number of parameters, split into the parts that are sharded differently.
+    """
+
+    embedding: int
+    output_layer: int
+    dense_per_layer: int
+    expert_per_layer: int
+    num_layers: int
+    final_norm: int
+
+    @property
+    def total(self) -> int:
+        return (
+            self.embedding
+            + self.output_layer
+            + self.num_layers * (self.dense_per_layer + self.expert_per_layer)
+            + self.final_norm
+        )
+
+
+def count_parameters(cfg: Any) -> ParameterCount:
+    """
+    Analytic parameter count of a Megatron GPT model.
+
+    >>> cfg = dict(num_layers=26, hidden_size=2048, ffn_hidden_size=8192, num_attention_heads=16,
+    ...            group_query_attention=True, num_query_groups=2, kv_channels=128, vocab_size=50304,
+    ...            swiglu=True, add_bias_linear=False, untie_embeddings_and_output_weights=True,
+    ...            normalization="RMSNorm")
+    >>> round(count_parameters(cfg).total / 1e9, 2)
+    1.76
+    """
+    hidden_size = cfg_get(cfg, "hidden_size")
+    num_layers = cfg_get(cfg, "num_layers")
+    num_heads = cfg_get(cfg, "num_attention_heads")
+    kv_channels = cfg_get(cfg, "kv_channels", hidden_size // num_heads)
+    num_query_groups = (
+        cfg_get(cfg, "num_query_groups", num_heads) if cfg_get(cfg, "group_query_attention") else num_heads
+    )
+    bias = 1 if cfg_get(cfg, "add_bias_linear", True) else 0
+    qkv_bias = 1 if bias or cfg_get(cfg, "add_qkv_bias") else 0
+    norm = 1 if cfg_get(cfg, "normalization", "LayerNorm") == "RMSNorm" else 2
+    gated = 2 if cfg_get(cfg, "swiglu") else 1
+
+    query_size = kv_channels * num_heads
+    kv_size = kv_channels * num_query_groups
+    attention = hidden_size * (query_size + 2 * kv_size) + qkv_bias * (query_size + 2 * kv_size)
+    attention += query_size * hidden_size + bias * hidden_size
+    if cfg_get(cfg, "qk_layernorm"):
+        attention += 2 * norm * kv_channels
+    layer_norms = 2 * norm * hidden_size
+
+    num_experts = cfg_get(cfg, "num_experts")
+    if num_experts:
+        ffn_hidden_size = cfg_get(cfg, "moe_ffn_hidden_size", cfg_get(cfg, "ffn_hidden_size"))
+        expert = (gated + 1) * hidden_size * ffn_hidden_size + bias * (gated * ffn_hidden_size + hidden_size)
+        shared_size = cfg_get(cfg, "moe_shared_expert_intermediate_size", 0)
+        dense_mlp = hidden_size * num_experts + (gated + 1) * hidden_size * shared_size
+        expert_per_layer = num_experts * expert
+    else:
+        ffn_hidden_size = cfg_get(cfg, "ffn_hidden_size", 4 * hidden_size)
+        dense_mlp = (gated + 1) * hidden_size * ffn_hidden_size + bias * (gated * ffn_hidden_size + hidden_size)
+        expert_per_layer = 0
+
+    vocab_size = padded_vocab_size(cfg)
+    embedding = vocab_size * hidden_size
+    if cfg_get(cfg, "position_embedding_type", "learned_absolute") == "learned_absolute":
+        embedding += cfg_get(cfg, "max_position_embeddings", cfg_get(cfg, "seq_length", 0)) * hidden_size
+    return ParameterCount(
+        embedding=embedding,
+        output_layer=vocab_size * hidden_size if cfg_get(cfg, "untie_embeddings_and_output_weights") else 0,
+        dense_per_layer=attention + layer_norms + dense_mlp,
+        expert_per_layer=expert_per_layer,
+        num_layers=num_layers,
+        final_norm=norm * hidden_size,
+    )
+
+
+@dataclass
+class MemoryEstimate:
+    """
+    Estimated peak memory per GPU in bytes (for the most loaded pipeline stage).
+    """
+
+    parameters: float
+    gradients: float
+    optimizer: float
+    activations: float
+    logits: float
+    overhead: float
+
+    @property
+    def total(self) -> float:
+        return sum(getattr(self, f.name) for f in fields(self))
+
+    def report(self) -> str:
+        lines = [f"  {f.name:<12} {getattr(self, f.name) / GIB:8.2f} GiB" for f in fields(self)]
+        return "\n".join(["Estimated memory per GPU:"] + lines + [f"  {'total':<12} {self.total / GIB:8.2f} GiB"])
+
+
+def _sharding(cfg: Any) -> tuple[bool, bool, bool]:
+    """
+    Returns whether optimizer states, gradients and parameters are sharded across data parallel ranks.
+    """
+    fsdp = cfg_get(cfg, "use_megatron_fsdp") or cfg_get(cfg, "use_custom_fsdp") or cfg_get(cfg, "use_torch_fsdp2")
+    if fsdp:
+        strategy = cfg_get(cfg, "data_parallel_sharding_strategy", "optim_grads_params")
+        return (
+            strategy in ["optim", "optim_grads", "optim_grads_params"],
+            strategy in ["optim_grads", "optim_grads_params"],
+            strategy == "optim_grads_params" or bool(cfg_get(cfg, "use_torch_fsdp2")),
+        )
+    return bool(cfg_get(cfg, "use_distributed_optimizer")), False, False
+
+
+def activation_bytes_per_layer(cfg: Any, layout: ParallelLayout, micro_batch_size: int) -> float:
+    """
+    Activation memory of one transformer layer for one micro batch, following Korthikanti et al.
+    ("Reducing Activation Recomputation in Large Transformer Models"), generalized to GQA, SwiGLU and MoE.
+    """
+    hidden_size = cfg_get(cfg, "hidden_size")
+    num_heads = cfg_get(cfg, "num_attention_heads")
+    kv_channels = cfg_get(cfg, "kv_channels", hidden_size // num_heads)
+    num_query_groups = (
+        cfg_get(cfg, "num_query_groups", num_heads) if cfg_get(cfg, "group_query_attention") else num_heads
+    )
+    seq_length = cfg_get(cfg, "seq_length") // layout.cp
+    sbh = seq_length * micro_batch_size * hidden_size
+    tp = layout.tp
+    sequence_parallel = cfg_get(cfg, "sequence_parallel") and tp > 1
+
+    granularity = effective_recompute_granularity(cfg)
+    if granularity == "full":
+        # only the layer inputs are kept (in bf16)
+        return 2 * sbh / (tp if sequence_parallel else 1)
+
+    query_ratio = kv_channels * num_heads / hidden_size
+    kv_ratio = kv_channels * num_query_groups / hidden_size
+    num_experts = cfg_get(cfg, "num_experts")
+    if num_experts:
+        ffn_hidden_size = cfg_get(cfg, "moe_ffn_hidden_size", cfg_get(cfg, "ffn_hidden_size"))
+        routed = cfg_get(cfg, "moe_router_topk", 2)
+    else:
+        ffn_hidden_size = cfg_get(cfg, "ffn_hidden_size", 4 * hidden_size)
+        routed = 1
+    ffn_ratio = ffn_hidden_size / hidden_size
+    gated = 2 if cfg_get(cfg, "swiglu") else 1
+
+    # bytes per s*b*h that are split by TP: Q, K, V, attention output and the MLP intermediates
+    split = 2 * query_ratio + 4 * kv_ratio + 2 * query_ratio + routed * ffn_ratio * (2 * gated + 2)
+    # layer norm inputs, attention/MLP inputs and dropout masks, only split with sequence parallelism
+    replicated = 4 + 2 + 2 * routed + 2
+    per_layer = sbh * (split / tp + replicated / (tp if sequence_parallel else 1))
+
+    # softmax, attention dropout mask and output (5 a s^2 b), not stored for flash attention or selective recompute
+    flash = cfg_get(cfg, "use_flash_attn") or str(cfg_get(cfg, "attention_backend", "auto")).split(".")[-1] in [
+        "flash",
+        "fused",
+        "auto",
+    ]
+    if granularity != "selective" and not flash:
+        per_layer += 5 * num_heads * seq_length * seq_length * micro_batch_size / tp
+    return per_layer
+
+
+def parameters_per_gpu(params: ParameterCount, layout: ParallelLayout) -> tuple[float, float]:
+    """
+    Number of dense and expert parameters held by one GPU of the most loaded pipeline stage (before DP sharding).
+    """
+    layers_per_stage = -(-params.num_layers // layout.pp)
+    dense_layer_params = layers_per_stage * params.dense_per_layer / layout.tp
+    expert_params = layers_per_stage * params.expert_per_layer / (layout.ep * layout.etp)
+    # the first stage holds the embedding, the last one the output layer (tied weights are duplicated there)
+    first_stage = params.embedding / layout.tp
+    if layout.pp > 1:
+        last_stage = (params.output_layer or params.embedding) / layout.tp + params.final_norm
+        return dense_layer_params + max(first_stage, last_stage), expert_params
+    return dense_layer_params + first_stage + params.output_layer / layout.tp + params.final_norm, expert_params
+
+
+def estimate_memory(cfg: Any, world_size: int, overhead_gib: float = 3.0) -> MemoryEstimate:
+    """
+    Analytic per-GPU memory estimate for a MegatronConfig on world_size GPUs: parameters, gradients and optimizer
+    states (sharded by TP/PP/EP and, depending on the distributed optimizer / FSDP strategy, by DP) plus the
+    activations of the in-flight micro batches of the first pipeline stage and the logits of the last one.
+    """
+    layout = ParallelLayout.from_config(cfg, world_size)
+    params = count_parameters(cfg)
+
+    dense_params, expert_params = parameters_per_gpu(params, layout)
+    layers_per_stage = -(-params.num_layers // layout.pp)
+
+    mixed_precision = cfg_get(cfg, "bf16") or cfg_get(cfg, "fp16")
+    param_bytes = 2 if mixed_precision else 4
+    # main grads are accumulated in fp32 for bf16
+    grad_bytes = 4 if cfg_get(cfg, "bf16") or cfg_get(cfg, "accumulate_allreduce_grads_in_fp32") else param_bytes
+    # Adam: fp32 main params (mixed precision only) + two moments
+    optim_bytes = (12 if mixed_precision else 8) if cfg_get(cfg, "optimizer", "adam") == "adam" else 8
+
+    shard_optim, shard_grads, shard_params = _sharding(cfg)
+
+    def sharded(num_bytes_per_param: float, shard: bool) -> float:
+        dense = dense_params * num_bytes_per_param / (layout.dp if shard else 1)
+        expert = expert_params * num_bytes_per_param / (layout.expert_dp if shard else 1)
+        return dense + expert
+
+    micro_batch_size = cfg_get(cfg, "micro_batch_size", 1)
+    global_batch_size = cfg_get(cfg, "global_batch_size", micro_batch_size * layout.dp)
+    num_micro_batches = max(1, global_batch_size // (micro_batch_size * layout.dp))
+    in_flight = min(layout.pp, num_micro_batches)
+    activations = layers_per_stage * activation_bytes_per_layer(cfg, layout, micro_batch_size) * in_flight
+
+    # bf16 logits and fp32 cross entropy of the vocab-parallel output layer
+    seq_length = cfg_get(cfg, "seq_length") // layout.cp
+    logits = 6 * seq_length * micro_batch_size * padded_vocab_size(cfg) / layout.tp
+
+    return MemoryEstimate(
+        parameters=sharded(param_bytes, shard_params),
+        gradients=sharded(grad_bytes, shard_grads),
+        optimizer=sharded(optim_bytes, shard_optim),
+        activations=activations,
+        logits=logits,
+        overhead=overhead_gib * GIB,
+    )
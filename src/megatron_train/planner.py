@@ -0,0 +1,292 @@
+import itertools
+from dataclasses import dataclass
+from typing import Any
+
+from .flops import cfg_get, flops_per_iteration
+from .memory import GIB, ParallelLayout, count_parameters, estimate_memory, parameters_per_gpu
+
+RECOMPUTE_CHOICES = [None, "selective", "full"]
+
+
+@dataclass(frozen=True)
+class Layout:
+    """
+    One candidate parallel layout of a training run.
+    """
+
+    tp: int = 1
+    pp: int = 1
+    cp: int = 1
+    ep: int = 1
+    micro_batch_size: int = 1
+    recompute: str | None = None
+
+    def megatron_overrides(self, global_batch_size: int) -> dict[str, Any]:
+        """
+        MegatronConfig keys that realize this layout.
+        """
+        return {
+            "tensor_model_parallel_size": self.tp,
+            "pipeline_model_parallel_size": self.pp,
+            "context_parallel_size": self.cp,
+            "expert_model_parallel_size": self.ep,
+            "sequence_parallel": self.tp > 1,
+            "micro_batch_size": self.micro_batch_size,
+            "global_batch_size": global_batch_size,
+            # recompute_activations would force "selective"
+            "recompute_activations": False,
+            "recompute_granularity": self.recompute,
+            "recompute_method": "uniform" if self.recompute == "full" else None,
+            "recompute_num_layers": 1 if self.recompute == "full" else None,
+        }
+
+    def hydra_overrides(self, global_batch_size: int) -> list[str]:
+        """
+        >>> Layout(tp=2, recompute="full").hydra_overrides(64)[:2]
+        ['megatron.tensor_model_parallel_size=2', 'megatron.pipeline_model_parallel_size=1']
+        >>> Layout(tp=2, recompute="full").hydra_overrides(64)[-3:]
+        ['megatron.recompute_granularity=full', 'megatron.recompute_method=uniform', 'megatron.recompute_num_layers=1']
+        """
+
+        def fmt(value: Any) -> str:
+            if value is None:
+                return "null"
+            if isinstance(value, bool):
+                return str(value).lower()
+            return str(value)
+
+        return [f"megatron.{k}={fmt(v)}" for k, v in self.megatron_overrides(global_batch_size).items()]
+
+
+@dataclass
+class Hardware:
+    """
+    Per-GPU peak compute and bandwidths (GB/s per GPU and direction) of a cluster.
+    """
+
+    gpus_per_node: int
+    peak_tflops_per_gpu: float
+    gpu_memory_gib: float
+    intra_node_bandwidth_gbs: float
+    inter_node_bandwidth_gbs: float
+    # fraction of the peak reached by the GEMMs
+    compute_efficiency: float = 0.6
+
+    @classmethod
+    def from_slurm_config(cls, slurm: Any, **kwargs) -> "Hardware":
+        return cls(
+            gpus_per_node=cfg_get(slurm, "gpus_per_node", 1),
+            peak_tflops_per_gpu=cfg_get(slurm, "peak_tflops_per_gpu"),
+            gpu_memory_gib=cfg_get(slurm, "gpu_memory_gib"),
+            intra_node_bandwidth_gbs=cfg_get(slurm, "intra_node_bandwidth_gbs"),
+            inter_node_bandwidth_gbs=cfg_get(slurm, "inter_node_bandwidth_gbs"),
+            **kwargs,
+        )
+
+    def bandwidth(self, group_span: int) -> float:
+        """
+        Bandwidth in bytes/s of a process group spanning group_span consecutive ranks.
+        """
+        gbs = self.intra_node_bandwidth_gbs if group_span <= self.gpus_per_node else self.inter_node_bandwidth_gbs
+        return gbs * 1e9
+
+
+@dataclass
+class IterationCost:
+    """
+    Estimated time of one training iteration in seconds.
+    """
+
+    compute: float
+    bubble: float
+    tensor_parallel: float
+    context_parallel: float
+    expert_parallel: float
+    pipeline_parallel: float
+    data_parallel: float
+
+    @property
+    def total(self) -> float:
+        return (
+            self.compute
+            + self.bubble
+            + self.tensor_parallel
+            + self.context_parallel
+            + self.expert_parallel
+            + self.pipeline_parallel
+            + self.data_parallel
+        )
+
+
+@dataclass
+class Plan:
+    layout: Layout
+    cost: IterationCost
+    memory_gib: float
+
+
+def apply_layout(cfg: dict[str, Any], layout: Layout, global_batch_size: int) -> dict[str, Any]:
+    return {**cfg, **layout.megatron_overrides(global_batch_size)}
+
+
+def _ring(group_size: int) -> float:
+    return (group_size - 1) / group_size
+
+
+def iteration_cost(cfg: dict[str, Any], world_size: int, hardware: Hardware) -> IterationCost:
+    """
+    Analytic cost of one iteration of a MegatronConfig (with the layout applied): GEMM time at a fixed fraction of
+    the peak, the 1F1B pipeline bubble and the (non-overlapped) ring collectives of every parallel dimension.
+    Ranks are ordered TP-CP-EP-DP-PP as in Megatron, a group runs at NVLink bandwidth if it fits into a node.
+    """
+    layout = ParallelLayout.from_config(cfg, world_size)
+    global_batch_size = cfg_get(cfg, "global_batch_size")
+    micro_batch_size = cfg_get(cfg, "micro_batch_size", 1)
+    num_micro_batches = global_batch_size // (micro_batch_size * layout.dp)
+    seq_length = cfg_get(cfg, "seq_length")
+    hidden_size = cfg_get(cfg, "hidden_size")
+    num_layers = cfg_get(cfg, "num_layers")
+    layers_per_stage = num_layers // layout.pp
+    full_recompute = cfg_get(cfg, "recompute_granularity") == "full"
+
+    flops = flops_per_iteration(cfg, global_batch_size=global_batch_size)
+    compute = flops.hardware / (world_size * hardware.peak_tflops_per_gpu * 1e12 * hardware.compute_efficiency)
+    bubble = compute * (layout.pp - 1) / num_micro_batches
+
+    # bf16 activations of one micro batch on one CP rank
+    activation_bytes = 2 * seq_length // layout.cp * micro_batch_size * hidden_size
+    layer_steps = num_micro_batches * layers_per_stage
+
+    # two all-reduces (or all-gather + reduce-scatter with SP) in forward and backward, repeated for full recompute
+    tensor_parallel = 0.0
+    if layout.tp > 1:
+        collectives = 6 if full_recompute else 4
+        volume = collectives * layer_steps * 2 * _ring(layout.tp) * activation_bytes
+        tensor_parallel = volume / hardware.bandwidth(layout.tp)
+
+    # all-gather of keys and values in forward, reduce-scatter of their gradients in backward
+    context_parallel = 0.0
+    if layout.cp > 1:
+        num_heads = cfg_get(cfg, "num_attention_heads")
+        kv_channels = cfg_get(cfg, "kv_channels", hidden_size // num_heads)
+        num_query_groups = (
+            cfg_get(cfg, "num_query_groups", num_heads) if cfg_get(cfg, "group_query_attention") else num_heads
+        )
+        kv_bytes = 2 * 2 * seq_length // layout.cp * micro_batch_size * kv_channels * num_query_groups / layout.tp
+        volume = 2 * layer_steps * (layout.cp - 1) * kv_bytes
+        context_parallel = volume / hardware.bandwidth(layout.tp * layout.cp)
+
+    # token dispatch and combine all-to-alls in forward and backward
+    expert_parallel = 0.0
+    if layout.ep > 1 and cfg_get(cfg, "num_experts"):
+        routed = cfg_get(cfg, "moe_router_topk", 2)
+        volume = 4 * layer_steps * routed * _ring(layout.ep) * activation_bytes
+        expert_parallel = volume / hardware.bandwidth(layout.etp * layout.ep)
+
+    # activations and their gradients between neighboring stages (always across nodes for multi-node runs)
+    pipeline_parallel = 0.0
+    if layout.pp > 1:
+        volume = 2 * num_micro_batches * activation_bytes / layout.tp
+        pipeline_parallel = volume / hardware.bandwidth(world_size)
+
+    # gradient reduce-scatter (fp32) and parameter all-gather (bf16), partially hidden behind the backward pass
+    data_parallel = 0.0
+    if layout.dp > 1:
+        dense_params, _ = parameters_per_gpu(count_parameters(cfg), layout)
+        volume = (4 + 2) * _ring(layout.dp) * dense_params
+        data_parallel = volume / hardware.bandwidth(layout.tp * layout.cp * layout.dp)
+        if cfg_get(cfg, "overlap_grad_reduce"):
+            data_parallel = max(0.0, data_parallel - compute * 2 / 3)
+
+    return IterationCost(
+        compute=compute,
+        bubble=bubble,
+        tensor_parallel=tensor_parallel,
+        context_parallel=context_parallel,
+        expert_parallel=expert_parallel,
+        pipeline_parallel=pipeline_parallel,
+        data_parallel=data_parallel,
+    )
+
+
+def _powers_of_two(limit: int) -> list[int]:
+    return [2**k for k in range(limit.bit_length()) if 2**k <= limit]
+
+
+def enumerate_layouts(
+    cfg: dict[str, Any],
+    world_size: int,
+    global_batch_size: int,
+    gpus_per_node: int,
+    micro_batch_sizes: list[int] = (1, 2, 4, 8),
+    recompute_choices: list[str | None] = RECOMPUTE_CHOICES,
+    max_pp: int | None = None,
+    max_cp: int = 8,
+) -> list[Layout]:
+    """
+    All layouts satisfying Megatron's divisibility rules: TP within a node and dividing the attention heads and
+    query groups, PP dividing the layers, CP dividing the sequence into 2*CP chunks, EP dividing the experts and
+    the global batch splitting into micro batches on every data parallel rank.
+
+    >>> cfg = dict(num_layers=26, num_attention_heads=16, num_query_groups=2, group_query_attention=True,
+    ...            seq_length=4096)
+    >>> layouts = enumerate_layouts(cfg, 8, 64, 4, micro_batch_sizes=[4], recompute_choices=[None])
+    >>> sorted({(l.tp, l.pp) for l in layouts})
+    [(1, 1), (1, 2), (2, 1), (2, 2)]
+    >>> sorted({l.cp for l in layouts if l.tp == 2 and l.pp == 2})
+    [1, 2]
+    """
+    num_layers = cfg_get(cfg, "num_layers")
+    num_heads = cfg_get(cfg, "num_attention_heads")
+    num_query_groups = (
+        cfg_get(cfg, "num_query_groups", num_heads) if cfg_get(cfg, "group_query_attention") else num_heads
+    )
+    seq_length = cfg_get(cfg, "seq_length")
+    num_experts = cfg_get(cfg, "num_experts")
+
+    tps = [tp for tp in _powers_of_two(gpus_per_node) if num_heads % tp == 0 and num_query_groups % tp == 0]
+    pps = [pp for pp in range(1, (max_pp or num_layers) + 1) if num_layers % pp == 0]
+    cps = [cp for cp in _powers_of_two(max_cp) if seq_length % (2 * cp) == 0]
+    eps = [ep for ep in range(1, num_experts + 1) if num_experts % ep == 0] if num_experts else [1]
+
+    layouts = []
+    for tp, pp, cp, ep in itertools.product(tps, pps, cps, eps):
+        if world_size % (tp * pp * cp) or world_size % (tp * ep * pp):
+            continue
+        dp = world_size // (tp * pp * cp)
+        for micro_batch_size, recompute in itertools.product(micro_batch_sizes, recompute_choices):
+            if global_batch_size % (micro_batch_size * dp):
+                continue
+            layouts.append(Layout(tp=tp, pp=pp, cp=cp, ep=ep, micro_batch_size=micro_batch_size, recompute=recompute))
+    return layouts
+
+
+def plan_layouts(
+    cfg: dict[str, Any],
+    world_size: int,
+    global_batch_size: int,
+    hardware: Hardware,
+    max_gpu_mem: float | None = None,
+    **enumerate_kwargs,
+) -> list[Plan]:
+    """
+    Ranks all valid layouts that fit into max_gpu_mem (GiB, defaults to the GPU memory of the hardware) by their
+    estimated iteration time. Ties (e.g. micro batch sizes without pipeline parallelism) prefer larger micro
+    batches and less recomputation.
+    """
+    max_gpu_mem = max_gpu_mem or hardware.gpu_memory_gib
+    plans = []
+    for layout in enumerate_layouts(cfg, world_size, global_batch_size, hardware.gpus_per_node, **enumerate_kwargs):
+        layout_cfg = apply_layout(cfg, layout, global_batch_size)
+        memory_gib = estimate_memory(layout_cfg, world_size).total / GIB
+        if max_gpu_mem is not None and memory_gib > max_gpu_mem:
+            continue
+        plans.append(Plan(layout=layout, cost=iteration_cost(layout_cfg, world_size, hardware), memory_gib=memory_gib))
+    return sorted(
+        plans,
+        key=lambda plan: (
+            round(plan.cost.total, 6),
+            -plan.layout.micro_batch_size,
+            RECOMPUTE_CHOICES.index(plan.layout.recompute),
+        ),
+    )
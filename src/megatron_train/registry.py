@@ -0,0 +1,299 @@
+import json
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from .cache import get_cache_dir
+from .flops import cfg_get
+from .regression import benchmark_key, container_image
+from .training_log import LogState
+
+REGISTRY_VERSION = 1
+
+# indexed config fields: column -> (section, key, default); megatron keys fall back to the top level
+CONFIG_COLUMNS = {
+    "experiment_name": (None, "experiment_name", None),
+    "model_name": ("aux", "model_name", None),
+    "nodes": ("slurm", "nodes", None),
+    "total_gpus": ("slurm", "total_gpus", None),
+    "tp": ("megatron", "tensor_model_parallel_size", 1),
+    "pp": ("megatron", "pipeline_model_parallel_size", 1),
+    "cp": ("megatron", "context_parallel_size", 1),
+    "ep": ("megatron", "expert_model_parallel_size", 1),
+    "micro_batch_size": ("megatron", "micro_batch_size", None),
+    "global_batch_size": ("megatron", "global_batch_size", None),
+    "seq_length": ("megatron", "seq_length", None),
+    "recompute_granularity": ("megatron", "recompute_granularity", None),
+}
+METRIC_COLUMNS = [
+    "iterations",
+    "itertime_ms",
+    "token_throughput",
+    "model_tflops_per_gpu",
+    "mfu",
+    "hfu",
+    "num_params",
+]
+# submitted: job written, started: log without iterations, incomplete: fewer iterations than train_iters (and no
+# early stop)
+STATUSES = ["submitted", "started", "incomplete", "completed"]
+
+TEXT_COLUMNS = ["experiment_name", "model_name", "recompute_granularity"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    output_dir TEXT PRIMARY KEY,
+    config_hash TEXT,
+    benchmark_key TEXT,
+    cluster TEXT,
+    image TEXT,
+    {config_columns},
+    timestamp TEXT,
+    submitted_at REAL,
+    jobid TEXT,
+    sbatch_file TEXT,
+    log_file TEXT,
+    status TEXT,
+    updated_at REAL,
+    {metric_columns},
+    config TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model_name, total_gpus, submitted_at);
+CREATE INDEX IF NOT EXISTS runs_submitted ON runs (submitted_at);
+CREATE INDEX IF NOT EXISTS runs_hash ON runs (config_hash);
+CREATE INDEX IF NOT EXISTS runs_jobid ON runs (jobid);
+""".format(
+    config_columns=", ".join(
+        f"{column} {'TEXT' if column in TEXT_COLUMNS else 'INTEGER'}" for column in CONFIG_COLUMNS
+    ),
+    metric_columns=", ".join(f"{column} REAL" for column in METRIC_COLUMNS),
+)
+
+
+def config_columns(config: dict[str, Any]) -> dict[str, Any]:
+    """
+    Key fields of a resolved config (as dict) as registry columns.
+
+    >>> config_columns({"megatron": {"aux": {"model_name": "llama1.8b"}, "seq_length": 4096, "micro_batch_size": 4},
+    ...                 "slurm": {"nodes": 2, "total_gpus": 8, "template": "jupiter.sh"}, "global_batch_size": 64,
+    ...                 "experiment_name": "speed"})["global_batch_size"]
+    64
+    """
+    megatron = config.get("megatron") or {}
+    sections = {
+        None: config,
+        "megatron": megatron,
+        "slurm": config.get("slurm") or {},
+        "aux": megatron.get("aux") or {},
+    }
+    columns = {
+        column: cfg_get(sections[section], key, default) for column, (section, key, default) in CONFIG_COLUMNS.items()
+    }
+    if columns["global_batch_size"] is None:
+        columns["global_batch_size"] = cfg_get(config, "global_batch_size")
+    columns["cluster"] = Path(str(cfg_get(config.get("slurm") or {}, "template", ""))).stem or None
+    columns["benchmark_key"] = benchmark_key(config)
+    columns["image"] = container_image(config)
+    return columns
+
+
+def log_status(state: LogState) -> str:
+    """
+    Status of a run from its parsed log.
+    """
+    iterations, train_iters = state.iterations.get("iteration"), state.iterations.get("train_iters")
+    if len(iterations) == 0:
+        return "started"
+    return "completed" if iterations[-1] >= train_iters[-1] else "incomplete"
+
+
+def timestring_seconds(timestamp: str) -> float | None:
+    """
+    Epoch seconds of an oc.timestring (UTC), None for other formats.
+
+    >>> timestring_seconds("19700101_000100_500"), timestring_seconds("X")
+    (60.5, None)
+    """
+    try:
+        return datetime.strptime(timestamp, "%Y%m%d_%H%M%S_%f").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_since(since: str, now: float | None = None) -> float:
+    """
+    Epoch seconds of a relative age (e.g. 7d, 12h, 30m) or an ISO date.
+
+    >>> parse_since("7d", now=1000000.0)
+    395200.0
+    >>> parse_since("2025-09-13") == datetime(2025, 9, 13).timestamp()
+    True
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw])", since.strip())
+    if match:
+        seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}[match.group(2)]
+        return (time.time() if now is None else now) - float(match.group(1)) * seconds
+    return datetime.fromisoformat(since).timestamp()
+
+
+def parse_where(conditions: list[str]) -> dict[str, Any]:
+    """
+    column=value filters of Registry.query, numbers are compared as numbers.
+
+    >>> parse_where(["tp=2", "model_name=llama1.8b", "mfu=0.4"])
+    {'tp': 2, 'model_name': 'llama1.8b', 'mfu': 0.4}
+    """
+    where = {}
+    for condition in conditions:
+        column, sep, value = condition.partition("=")
+        if not sep:
+            raise ValueError(f"Expected column=value, got {condition}")
+        for typ in (int, float):
+            try:
+                value = typ(value)
+                break
+            except ValueError:
+                pass
+        where[column] = value
+    return where
+
+
+class Registry:
+    """
+    SQLite database with one row per submitted run (keyed by output_dir): config hash, key config fields, job id,
+    paths, and the status and metrics of the log parser. Queries run on indexed columns instead of walking the
+    experiment directories.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path is not None else get_cache_dir("registry") / "experiments.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in [0, REGISTRY_VERSION]:
+            raise ValueError(f"Registry {self.path} has version {version}, expected {REGISTRY_VERSION}")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {REGISTRY_VERSION}")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> "Registry":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _upsert(self, output_dir: str, values: dict[str, Any]):
+        values = {"output_dir": output_dir, "updated_at": time.time(), **values}
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{column}" for column in values)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in values if column != "output_dir")
+        with self.connection:
+            self.connection.execute(
+                f"INSERT INTO runs ({columns}) VALUES ({placeholders}) ON CONFLICT (output_dir) DO UPDATE SET {updates}",
+                values,
+            )
+
+    def register_submission(
+        self, config: dict[str, Any], config_hash: str, jobid: str | None = None, sbatch_file: str | None = None
+    ):
+        """
+        Registers a written job (config as dict); resubmitting the same output_dir updates the job id.
+        """
+        self._upsert(
+            str(config["output_dir"]),
+            {
+                "config_hash": config_hash,
+                **config_columns(config),
+                "timestamp": str(config.get("timestamp")),
+                "submitted_at": time.time(),
+                "jobid": jobid,
+                "sbatch_file": sbatch_file,
+                "status": "submitted",
+                "config": json.dumps(config, default=str),
+            },
+        )
+
+    def update_run(
+        self,
+        output_dir: str | Path,
+        status: str,
+        log_file: str | None = None,
+        jobid: str | None = None,
+        metrics: dict[str, Any] | None = None,
+        config: dict[str, Any] | None = None,
+    ):
+        """
+        Sets the status and metrics (METRIC_COLUMNS) of a run found by the log parser. Runs submitted before the
+        registry existed are registered from their config.
+        """
+        values = {"status": status, "log_file": log_file}
+        if jobid is not None:
+            values["jobid"] = jobid
+        values.update({column: (metrics or {}).get(column) for column in METRIC_COLUMNS if column in (metrics or {})})
+        if (
+            config is not None
+            and not self.connection.execute("SELECT 1 FROM runs WHERE output_dir = ?", (str(output_dir),)).fetchone()
+        ):
+            values.update(config_columns(config))
+            values["timestamp"] = str(config.get("timestamp"))
+            values["submitted_at"] = timestring_seconds(values["timestamp"])
+            values["config"] = json.dumps(config, default=str)
+        self._upsert(str(output_dir), values)
+
+    def query(
+        self,
+        model_name: str | None = None,
+        total_gpus: int | None = None,
+        since: float | None = None,
+        status: str | None = None,
+        config_hash: str | None = None,
+        where: dict[str, Any] | None = None,
+        order_by: str = "submitted_at",
+        descending: bool = True,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Runs matching all given filters (where: further column equalities), without the config JSON.
+        """
+        known = self.columns()
+        filters = {
+            "model_name": model_name,
+            "total_gpus": total_gpus,
+            "status": status,
+            "config_hash": config_hash,
+            **(where or {}),
+        }
+        conditions, params = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column not in known:
+                raise ValueError(f"Unknown registry column {column}")
+            conditions.append(f"{column} = ?")
+            params.append(value)
+        if since is not None:
+            conditions.append("submitted_at >= ?")
+            params.append(since)
+        if order_by not in known:
+            raise ValueError(f"Unknown registry column {order_by}")
+        sql = (
+            f"SELECT {', '.join(column for column in known if column != 'config')} FROM runs"
+            + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+            + f" ORDER BY {order_by} IS NULL, {order_by} {'DESC' if descending else 'ASC'}"
+            + (f" LIMIT {int(limit)}" if limit else "")
+        )
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def config(self, output_dir: str | Path) -> dict[str, Any] | None:
+        row = self.connection.execute("SELECT config FROM runs WHERE output_dir = ?", (str(output_dir),)).fetchone()
+        return json.loads(row["config"]) if row and row["config"] else None
+
+    def columns(self) -> list[str]:
+        return [row["name"] for row in self.connection.execute("PRAGMA table_info(runs)")]
@@ -0,0 +1,235 @@
+import json
+import re
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .cache import atomic_write
+from .flops import cfg_get
+
+# scales the median absolute deviation to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+
+LAYOUT_KEYS = [
+    ("tp", "tensor_model_parallel_size", 1),
+    ("pp", "pipeline_model_parallel_size", 1),
+    ("cp", "context_parallel_size", 1),
+    ("ep", "expert_model_parallel_size", 1),
+    ("mbs", "micro_batch_size", 1),
+    ("gbs", "global_batch_size", None),
+    ("seq", "seq_length", None),
+    ("rc", "recompute_granularity", "none"),
+]
+
+
+@dataclass
+class RobustStats:
+    """
+    Median and relative robust standard deviation (scaled MAD / median) of a series of iteration times.
+    """
+
+    median: float
+    noise: float
+    count: int
+
+
+def robust_stats(values: Any, warmup: int = 0) -> RobustStats:
+    """
+    >>> robust_stats([900.0, 100.0, 101.0, 99.0, 100.0, 250.0], warmup=1)
+    RobustStats(median=100.0, noise=0.014826, count=5)
+    """
+    values = np.asarray(values, dtype=np.float64)[warmup:]
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return RobustStats(median=float("nan"), noise=float("nan"), count=0)
+    median = float(np.median(values))
+    mad = float(np.median(np.abs(values - median)))
+    return RobustStats(median=median, noise=round(MAD_SCALE * mad / median, 6), count=len(values))
+
+
+def benchmark_key(cfg: dict[str, Any]) -> str:
+    """
+    Baseline key of a run: model, cluster, number of GPUs and parallel layout.
+
+    >>> benchmark_key({"megatron": {"aux": {"model_name": "llama1.8b"}, "micro_batch_size": 4, "seq_length": 4096,
+    ...                             "recompute_granularity": "full"},
+    ...                "slurm": {"template": "jupiter.sh", "total_gpus": 8}, "global_batch_size": 32})
+    'llama1.8b/jupiter/8gpu/tp1-pp1-cp1-ep1-mbs4-gbs32-seq4096-rcfull'
+    """
+    megatron = cfg.get("megatron") or {}
+    slurm = cfg.get("slurm") or {}
+    model = cfg_get(cfg_get(megatron, "aux", {}), "model_name", "unknown")
+    cluster = Path(str(cfg_get(slurm, "template", "unknown"))).stem
+    defaults = {"global_batch_size": cfg_get(cfg, "global_batch_size")}
+    layout = "-".join(
+        f"{name}{cfg_get(megatron, key, defaults.get(key, default))}" for name, key, default in LAYOUT_KEYS
+    )
+    return f"{model}/{cluster}/{cfg_get(slurm, 'total_gpus')}gpu/{layout}"
+
+
+def container_image(cfg: dict[str, Any]) -> str | None:
+    """
+    Container image of a run, as referenced in the launcher command.
+    """
+    match = re.search(r"[\w./-]+\.sif", str(cfg_get(cfg_get(cfg, "launcher", {}), "cmd", "")))
+    return match.group(0) if match else None
+
+
+class BaselineStore:
+    """
+    JSON file with the reference runs per benchmark key. Each key keeps the most recent max_runs runs,
+    the baseline is the median over their median iteration times.
+    """
+
+    def __init__(self, path: str | Path, max_runs: int = 10):
+        self.path = Path(path)
+        self.max_runs = max_runs
+        self.baselines: dict[str, list[dict[str, Any]]] = {}
+        if self.path.exists():
+            with open(self.path) as fp:
+                self.baselines = json.load(fp)["baselines"]
+
+    def reference(self, key: str) -> RobustStats | None:
+        """
+        Baseline iteration time and noise of a key: the median over runs, the noise is the larger of the typical
+        in-run noise and the run-to-run spread.
+        """
+        runs = self.baselines.get(key)
+        if not runs:
+            return None
+        across_runs = robust_stats([run["itertime_ms"] for run in runs])
+        in_run = float(np.median([run["noise"] for run in runs]))
+        return RobustStats(median=across_runs.median, noise=max(in_run, across_runs.noise), count=len(runs))
+
+    def add(self, key: str, run: dict[str, Any]):
+        runs = self.baselines.setdefault(key, [])
+        if any(known.get("slurmid") == run.get("slurmid") for known in runs):
+            return
+        runs.append(run)
+        del runs[: -self.max_runs]
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps({"version": 1, "baselines": self.baselines}, indent=1, sort_keys=True))
+
+
+@dataclass
+class RegressionResult:
+    key: str
+    status: str
+    itertime_ms: float
+    noise: float
+    baseline_ms: float | None
+    baseline_noise: float | None
+    rel_change: float | None
+    threshold: float | None
+    slurmid: str | None = None
+    image: str | None = None
+
+
+def compare_to_baseline(
+    key: str,
+    stats: RobustStats,
+    reference: RobustStats | None,
+    tolerance: float = 0.03,
+    noise_factor: float = 3.0,
+    **info,
+) -> RegressionResult:
+    """
+    Compares the median iteration time of a run to its baseline. A run fails if it is slower by more than the
+    threshold, i.e. the larger of tolerance and noise_factor times the (baseline or run) relative noise.
+
+    >>> compare_to_baseline("k", RobustStats(106.0, 0.01, 50), RobustStats(100.0, 0.005, 3)).status
+    'fail'
+    >>> compare_to_baseline("k", RobustStats(106.0, 0.03, 50), RobustStats(100.0, 0.005, 3)).status
+    'pass'
+    >>> compare_to_baseline("k", RobustStats(90.0, 0.01, 50), RobustStats(100.0, 0.005, 3)).status
+    'improved'
+    >>> compare_to_baseline("k", RobustStats(float("nan"), float("nan"), 0), None).status
+    'failed_run'
+    """
+    if reference is None or np.isnan(stats.median):
+        return RegressionResult(
+            key=key,
+            # a run without iterations fails, also without a baseline
+            status="failed_run" if np.isnan(stats.median) else "new",
+            itertime_ms=stats.median,
+            noise=stats.noise,
+            baseline_ms=reference.median if reference else None,
+            baseline_noise=reference.noise if reference else None,
+            rel_change=None,
+            threshold=None,
+            **info,
+        )
+    rel_change = stats.median / reference.median - 1
+    threshold = max(tolerance, noise_factor * max(reference.noise, stats.noise))
+    if rel_change > threshold:
+        status = "fail"
+    elif rel_change < -threshold:
+        status = "improved"
+    else:
+        status = "pass"
+    return RegressionResult(
+        key=key,
+        status=status,
+        itertime_ms=stats.median,
+        noise=stats.noise,
+        baseline_ms=reference.median,
+        baseline_noise=reference.noise,
+        rel_change=rel_change,
+        threshold=threshold,
+        **info,
+    )
+
+
+def regression_report(
+    runs: list[dict[str, Any]],
+    store: BaselineStore,
+    tolerance: float = 0.03,
+    noise_factor: float = 3.0,
+    update: bool = False,
+) -> dict[str, Any]:
+    """
+    Compares runs (dicts with benchmark_key, itertime_median, itertime_noise, itertime_count, slurmid, image)
+    to the stored baselines. With update, the runs are added to the baselines after the comparison.
+    Failed runs (no iterations) count as failures.
+    """
+    results = []
+    for run in runs:
+        stats = RobustStats(
+            median=run["itertime_median"], noise=run["itertime_noise"], count=int(run["itertime_count"])
+        )
+        result = compare_to_baseline(
+            run["benchmark_key"],
+            stats,
+            store.reference(run["benchmark_key"]),
+            tolerance=tolerance,
+            noise_factor=noise_factor,
+            slurmid=run.get("slurmid"),
+            image=run.get("image"),
+        )
+        results.append(result)
+        if update and stats.count > 0:
+            store.add(
+                run["benchmark_key"],
+                {
+                    "itertime_ms": stats.median,
+                    "noise": stats.noise,
+                    "count": stats.count,
+                    "slurmid": run.get("slurmid"),
+                    "image": run.get("image"),
+                    "added": datetime.now().isoformat(timespec="seconds"),
+                },
+            )
+    if update:
+        store.save()
+    return {
+        "passed": all(result.status in ["pass", "improved", "new"] for result in results),
+        "tolerance": tolerance,
+        "noise_factor": noise_factor,
+        "baselines": str(store.path),
+        "results": [asdict(result) for result in results],
+    }
@@ -0,0 +1,164 @@
+import json
+import math
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from .cache import atomic_write, get_cache_dir, hash_key
+from .early_stop import read_early_stop
+from .flops import cfg_get
+from .regression import robust_stats
+from .training_log import update_log_state
+
+RESULTS_VERSION = 1
+# fields that differ between submissions of the same configuration
+VOLATILE_KEYS = ["timestamp", "output_dir"]
+# logged iterations needed (after the first one) for a valid throughput measurement
+MIN_ITERATIONS = 3
+
+
+def normalize_config(config: Any, volatile: dict[str, str]) -> Any:
+    """
+    Canonical form of a resolved config: volatile values inside strings (e.g. the output_dir in megatron.save or
+    slurm.output) are replaced by placeholders.
+
+    >>> normalize_config({"save": "/out/exp_X/ckpt", "n": [1, "X"]}, {"output_dir": "/out/exp_X", "timestamp": "X"})
+    {'save': '{output_dir}/ckpt', 'n': [1, '{timestamp}']}
+    """
+    if isinstance(config, dict):
+        return {key: normalize_config(value, volatile) for key, value in config.items()}
+    if isinstance(config, list | tuple):
+        return [normalize_config(value, volatile) for value in config]
+    if isinstance(config, str):
+        # longest first, the output_dir usually contains the timestamp
+        for key, value in sorted(volatile.items(), key=lambda item: -len(item[1])):
+            if value:
+                config = config.replace(value, f"{{{key}}}")
+    return config
+
+
+def config_hash(config: dict[str, Any]) -> str:
+    """
+    Hash of a resolved MegatronTrainConfig (as dict) without its volatile fields, equal for resubmissions of the
+    same configuration.
+
+    >>> a = {"megatron": {"lr": 1e-3, "save": "/out/e_1"}, "output_dir": "/out/e_1", "timestamp": "1"}
+    >>> b = {"timestamp": "2", "output_dir": "/out/e_2", "megatron": {"save": "/out/e_2", "lr": 1e-3}}
+    >>> config_hash(a) == config_hash(b), config_hash(a) == config_hash({**a, "megatron": {"lr": 2e-3}})
+    (True, False)
+    """
+    volatile = {key: str(config.get(key) or "") for key in VOLATILE_KEYS}
+    stable = {key: value for key, value in config.items() if key not in VOLATILE_KEYS}
+    return hash_key(normalize_config(stable, volatile))
+
+
+@dataclass
+class MeasuredResult:
+    output_dir: str
+    log_file: str
+    itertime_ms: float
+    noise: float
+    count: int
+    token_throughput: float
+
+    def __str__(self):
+        return (
+            f"{self.output_dir}: {self.itertime_ms:.1f} ms/iteration ({self.count} iterations), "
+            f"{self.token_throughput:.0f} tokens/s/GPU"
+        )
+
+
+def measure_output_dir(
+    output_dir: str | Path, tokens_per_gpu: float, min_iterations: int = MIN_ITERATIONS
+) -> MeasuredResult | None:
+    """
+    Median iteration time of the logs in an output dir, if one of them finished (its last iteration reached
+    train_iters, or the speed test was stopped early once converged) with enough logged iterations. Runs in
+    progress, crashed or cancelled runs have no measurement.
+    """
+    early_stop = read_early_stop(output_dir)
+    results = []
+    for log_file in sorted(Path(output_dir).glob("*.out")):
+        try:
+            state = update_log_state(log_file)
+        except OSError:
+            continue
+        iterations, train_iters = state.iterations.get("iteration"), state.iterations.get("train_iters")
+        finished = len(iterations) > 0 and iterations[-1] >= train_iters[-1]
+        stopped = bool(early_stop and early_stop.get("converged") and log_file.stem == str(early_stop.get("jobid")))
+        if not (finished or stopped):
+            continue
+        stats = robust_stats(state.itertimes, warmup=1)
+        if stats.count >= min_iterations and math.isfinite(stats.median) and stats.median > 0:
+            results.append(
+                MeasuredResult(
+                    output_dir=str(output_dir),
+                    log_file=str(log_file),
+                    itertime_ms=stats.median,
+                    noise=stats.noise,
+                    count=stats.count,
+                    token_throughput=1000 * tokens_per_gpu / stats.median,
+                )
+            )
+    return max(results, key=lambda result: result.count, default=None)
+
+
+class ResultsIndex:
+    """
+    JSON file mapping config hashes to their submissions (output_dir, job id). Valid measurements are looked up in
+    the logs of the output dirs once and then kept in the index.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path is not None else get_cache_dir("results") / "index.json"
+        self.entries: dict[str, list[dict[str, Any]]] = {}
+        self.changed = False
+        try:
+            with open(self.path) as fp:
+                raw = json.load(fp)
+            if raw.get("version") == RESULTS_VERSION:
+                self.entries = raw["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def record(self, key: str, config: dict[str, Any], jobid: str | None = None):
+        """
+        Records a submission of a config (as dict, with output_dir and timestamp).
+        """
+        submissions = self.entries.setdefault(key, [])
+        submission = next((known for known in submissions if known["output_dir"] == config["output_dir"]), None)
+        if submission is None:
+            megatron = config["megatron"]
+            global_batch_size = cfg_get(megatron, "global_batch_size") or config["global_batch_size"]
+            submission = {
+                "output_dir": config["output_dir"],
+                "timestamp": config["timestamp"],
+                "tokens_per_gpu": global_batch_size * cfg_get(megatron, "seq_length") / config["slurm"]["total_gpus"],
+            }
+            submissions.append(submission)
+        if jobid is not None:
+            submission["jobid"] = jobid
+        self.changed = True
+
+    def lookup(self, key: str, min_iterations: int = MIN_ITERATIONS) -> tuple[list[MeasuredResult], list[str]]:
+        """
+        Returns the valid measurements of a config hash and the output dirs of its submissions without one (yet).
+        """
+        measured, pending = [], []
+        for submission in self.entries.get(key, []):
+            if submission.get("result") is None:
+                result = measure_output_dir(submission["output_dir"], submission["tokens_per_gpu"], min_iterations)
+                if result is not None:
+                    submission["result"] = asdict(result)
+                    self.changed = True
+            if submission.get("result") is not None:
+                measured.append(MeasuredResult(**submission["result"]))
+            else:
+                pending.append(submission["output_dir"])
+        return measured, pending
+
+    def save(self):
+        if self.changed:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.path, json.dumps({"version": RESULTS_VERSION, "entries": self.entries}, indent=1))
+            self.changed = False
@@ -1,7 +1,155 @@
+import codecs
+import io
+import locale
+import os
+import selectors
 import subprocess
 import sys
-import threading
-from typing import Sequence, Union, Optional
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Literal, Optional, Sequence, Union
+
+DEFAULT_CHUNK_BYTES = 65536
+DEFAULT_CAPTURE_BYTES = 2**20
+# lines without newline longer than this are passed to the line callback in pieces
+MAX_LINE_LENGTH = 2**20
+
+
+class RingBuffer:
+    """
+    Keeps the last max_size characters (or bytes) written to it.
+
+    >>> buf = RingBuffer(5)
+    >>> for chunk in ["abc", "defg", "h"]:
+    ...     buf.write(chunk)
+    >>> buf.getvalue()
+    'defgh'
+    """
+
+    def __init__(self, max_size: int, empty: Union[str, bytes] = ""):
+        self.max_size = max_size
+        self.empty = empty
+        self.chunks = deque()
+        self.size = 0
+
+    def write(self, chunk: Union[str, bytes]):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        while len(self.chunks) > 1 and self.size - len(self.chunks[0]) >= self.max_size:
+            self.size -= len(self.chunks.popleft())
+
+    def getvalue(self) -> Union[str, bytes]:
+        return self.empty.join(self.chunks)[-self.max_size :]
+
+    def close(self):
+        pass
+
+
+class _FullCapture(RingBuffer):
+    def __init__(self, empty: Union[str, bytes]):
+        super().__init__(max_size=0, empty=empty)
+
+    def write(self, chunk: Union[str, bytes]):
+        self.chunks.append(chunk)
+
+    def getvalue(self) -> Union[str, bytes]:
+        return self.empty.join(self.chunks)
+
+
+class _SpillCapture:
+    def __init__(self, path: Path, is_text: bool, encoding: str, errors: str):
+        self.path = path
+        self.fp = open(path, "w", encoding=encoding, errors=errors) if is_text else open(path, "wb")
+
+    def write(self, chunk: Union[str, bytes]):
+        self.fp.write(chunk)
+
+    def getvalue(self) -> Path:
+        return self.path
+
+    def close(self):
+        self.fp.close()
+
+
+class _NoCapture:
+    def write(self, chunk: Union[str, bytes]):
+        pass
+
+    def getvalue(self) -> None:
+        return None
+
+    def close(self):
+        pass
+
+
+class _Stream:
+    """
+    One output pipe of the child: decodes chunks, forwards them to the console sink, captures them and splits
+    them into lines for the callback.
+    """
+
+    def __init__(self, name: str, fd: int, sink, capture, is_text: bool, encoding: str, errors: str, on_line=None):
+        self.name = name
+        self.fd = fd
+        self.sink = sink if is_text else (sink.buffer if hasattr(sink, "buffer") else sink)
+        self.capture = capture
+        self.on_line = on_line
+        self.decoder = (
+            io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(errors), translate=True)
+            if is_text
+            else None
+        )
+        self.partial = None
+
+    def feed(self, data: bytes, final: bool = False):
+        chunk = self.decoder.decode(data, final=final) if self.decoder is not None else data
+        if not chunk:
+            return
+        self.sink.write(chunk)
+        self.sink.flush()
+        self.capture.write(chunk)
+        if self.on_line is not None:
+            self._split_lines(chunk, final)
+
+    def _split_lines(self, chunk: Union[str, bytes], final: bool):
+        newline = "\n" if isinstance(chunk, str) else b"\n"
+        if self.partial:
+            chunk = self.partial + chunk
+        lines = chunk.split(newline)
+        self.partial = lines.pop()
+        for line in lines:
+            self.on_line(self.name, line + newline)
+        if self.partial and (final or len(self.partial) > MAX_LINE_LENGTH):
+            self.on_line(self.name, self.partial)
+            self.partial = None
+
+    def flush(self):
+        self.feed(b"", final=True)
+        if self.on_line is not None and self.partial:
+            self.on_line(self.name, self.partial)
+            self.partial = None
+
+
+def _make_capture(
+    capture: str, name: str, capture_bytes: int, spill_prefix: Optional[Union[str, Path]], is_text, encoding, errors
+):
+    if capture == "all":
+        return _FullCapture("" if is_text else b"")
+    elif capture == "ring":
+        return RingBuffer(capture_bytes, "" if is_text else b"")
+    elif capture == "spill":
+        if spill_prefix is None:
+            fd, path = tempfile.mkstemp(prefix="run_with_tee_", suffix=f".{name}")
+            os.close(fd)
+            path = Path(path)
+        else:
+            path = Path(f"{spill_prefix}.{name}")
+        return _SpillCapture(path, is_text, encoding, errors)
+    elif capture == "none":
+        return _NoCapture()
+    raise ValueError(f"Unknown capture mode {capture}")
 
 
 def run_with_tee(
@@ -16,6 +164,11 @@ def run_with_tee(
     env=None,
     cwd=None,
     shell: bool = False,
+    capture: Literal["all", "ring", "spill", "none"] = "all",
+    capture_bytes: int = DEFAULT_CAPTURE_BYTES,
+    spill_prefix: Optional[Union[str, Path]] = None,
+    on_line: Optional[Callable[[str, Union[str, bytes]], None]] = None,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
 ) -> subprocess.CompletedProcess:
     """
     Run a command like subprocess.run but:
@@ -23,83 +176,109 @@ def run_with_tee(
       - returns a CompletedProcess with captured stdout/stderr
       - supports check, timeout, input, text/encoding/errors
 
+    Both pipes are multiplexed in the calling thread with a selector and forwarded chunk-wise (one flush per
+    chunk instead of per line). Memory stays bounded unless the whole output is captured:
+      - capture="all": stdout/stderr contain the full output
+      - capture="ring": stdout/stderr contain the last capture_bytes characters (bytes in binary mode)
+      - capture="spill": the output is written to the files <spill_prefix>.stdout/.stderr (temporary files by
+        default), stdout/stderr of the result are their paths
+      - capture="none": nothing is kept, stdout/stderr are None
+    on_line(stream_name, line) is called for every line ("stdout" or "stderr", line including its newline),
+    e.g. to parse the output while it streams.
+
     NOTE: We always pipe child stdout/stderr to implement tee behavior.
     """
+    is_text = bool(text or encoding or errors)
+    if is_text:
+        encoding = encoding or locale.getpreferredencoding(False)
+        errors = errors or "strict"
+        if isinstance(input, str):
+            input = input.encode(encoding, errors)
+    elif isinstance(input, str):
+        input = input.encode()
 
-    popen_kwargs = {
-        "stdin": subprocess.PIPE if input is not None else None,
-        "stdout": subprocess.PIPE,
-        "stderr": subprocess.PIPE,
-        "env": env,
-        "cwd": cwd,
-        "shell": shell,
-        "text": text,
-        "encoding": encoding,
-        "errors": errors,
-    }
-
-    proc = subprocess.Popen(args, **popen_kwargs)
-
-    # Select console targets and buffers depending on text/binary mode
-    is_text = proc.stdout is not None and (text or encoding or errors) is not None or (text is True)
-    if is_text is None:  # follow Popen's actual mode
-        is_text = proc.text if hasattr(proc, "text") else False
-
-    out_buf = []
-    err_buf = []
-
-    def _forward(src, sink, buf, chunk_bytes: int = 8192):
-        if src is None:
-            return
-        if is_text:
-            for line in iter(src.readline, ""):
-                buf.append(line)
-                sink.write(line)
-                sink.flush()
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE if input is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        cwd=cwd,
+        shell=shell,
+    )
+
+    streams = {}
+    selector = selectors.DefaultSelector()
+    for name, pipe, sink in [("stdout", proc.stdout, sys.stdout), ("stderr", proc.stderr, sys.stderr)]:
+        stream = _Stream(
+            name,
+            pipe.fileno(),
+            sink,
+            _make_capture(capture, name, capture_bytes, spill_prefix, is_text, encoding, errors),
+            is_text,
+            encoding,
+            errors,
+            on_line=on_line,
+        )
+        streams[name] = stream
+        selector.register(pipe, selectors.EVENT_READ, stream)
+
+    pending_input = memoryview(input) if input is not None else None
+    if pending_input is not None:
+        if len(pending_input):
+            os.set_blocking(proc.stdin.fileno(), False)
+            selector.register(proc.stdin, selectors.EVENT_WRITE, None)
         else:
-            # binary mode: forward in chunks
-            bsink = sink.buffer if hasattr(sink, "buffer") else sink
-            for chunk in iter(lambda: src.read(chunk_bytes), b""):
-                buf.append(chunk)
-                bsink.write(chunk)
-                bsink.flush()
-        src.close()
-
-    t_out = threading.Thread(target=_forward, args=(proc.stdout, sys.stdout, out_buf))
-    t_err = threading.Thread(target=_forward, args=(proc.stderr, sys.stderr, err_buf))
-    t_out.start()
-    t_err.start()
-
-    # Write input (if any)
-    if input is not None:
-        try:
-            if is_text or isinstance(input, str):
-                data = input if isinstance(input, str) else input.decode(encoding or "utf-8", errors or "strict")
-            else:
-                data = input if isinstance(input, (bytes, bytearray)) else str(input).encode()
-            proc.stdin.write(data)  # type: ignore[union-attr]
-        finally:
-            proc.stdin.close()  # type: ignore[union-attr]
+            proc.stdin.close()
+
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def results():
+        for stream in streams.values():
+            stream.capture.close()
+        return streams["stdout"].capture.getvalue(), streams["stderr"].capture.getvalue()
 
     try:
-        retcode = proc.wait(timeout=timeout)
+        while selector.get_map():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(args, timeout)
+            for key, _ in selector.select(timeout=remaining):
+                if key.data is None:
+                    try:
+                        written = os.write(key.fd, pending_input[:chunk_bytes])
+                    except BrokenPipeError:
+                        written = len(pending_input)
+                    pending_input = pending_input[written:]
+                    if not len(pending_input):
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                    continue
+                data = os.read(key.fd, chunk_bytes)
+                if data:
+                    key.data.feed(data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    key.data.flush()
+        retcode = proc.wait(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
     except subprocess.TimeoutExpired as e:
         # Kill, finish draining, then raise with partial output
         proc.kill()
+        for key in list(selector.get_map().values()):
+            if key.data is not None:
+                os.set_blocking(key.fd, True)
+                for data in iter(lambda: os.read(key.fd, chunk_bytes), b""):
+                    key.data.feed(data)
+                key.data.flush()
+            key.fileobj.close()
         proc.wait()
-        t_out.join()
-        t_err.join()
-        captured_stdout = "".join(out_buf) if is_text else b"".join(out_buf)
-        captured_stderr = "".join(err_buf) if is_text else b"".join(err_buf)
-        e.output = captured_stdout
-        e.stderr = captured_stderr
+        e.output, e.stderr = results()
         raise
+    finally:
+        selector.close()
 
-    t_out.join()
-    t_err.join()
-
-    captured_stdout = "".join(out_buf) if is_text else b"".join(out_buf)
-    captured_stderr = "".join(err_buf) if is_text else b"".join(err_buf)
+    captured_stdout, captured_stderr = results()
 
     if check and retcode != 0:
         raise subprocess.CalledProcessError(retcode, args, output=captured_stdout, stderr=captured_stderr)
@@ -0,0 +1,134 @@
+import os
+import shlex
+from dataclasses import dataclass
+
+
+@dataclass
+class StagedFile:
+    src: str
+    dst: str
+
+
+def staged_prefix(stage_dir: str, n: int, prefix: str) -> str:
+    """
+    Node-local location of a dataset prefix. The index n keeps shards with equal file names apart.
+
+    >>> staged_prefix("$STAGE_DIR", 3, "/p/data/train/merged")
+    '$STAGE_DIR/data/3/merged'
+    """
+    return f"{stage_dir}/data/{n}/{os.path.basename(prefix)}"
+
+
+def staging_plan(
+    stage_dir: str, image: str | None, data_shards: list[str]
+) -> tuple[StagedFile | None, list[StagedFile], dict[str, str]]:
+    """
+    Files to stage (image, .idx/.bin of the data shards) and the mapping of the original image path and dataset
+    prefixes to their node-local replacements.
+    """
+    image_file = StagedFile(image, f"{stage_dir}/{os.path.basename(image)}") if image else None
+    replacements = {image: image_file.dst} if image_file else {}
+    data_files = []
+    for n, prefix in enumerate(data_shards):
+        local = staged_prefix(stage_dir, n, prefix)
+        replacements[prefix] = local
+        data_files += [StagedFile(f"{prefix}{suffix}", f"{local}{suffix}") for suffix in [".idx", ".bin"]]
+    return image_file, data_files, replacements
+
+
+def _quote(path: str) -> str:
+    # keep $STAGE_DIR expandable
+    return '"' + path.replace('"', '\\"') + '"'
+
+
+def _function(name: str, commands: list[str]) -> str:
+    return f"{name}() {{\n" + " &&\n".join(f"    {command}" for command in commands) + "\n}"
+
+
+def staging_script(
+    stage_dir: str,
+    image_file: StagedFile | None,
+    data_files: list[StagedFile],
+    copy_cmd: str,
+    node_cmd: str,
+    checksum_cmd: str | None,
+    checksum_dir: str = ".",
+) -> str:
+    """
+    Bash block that copies the files to node-local storage before the launch and verifies their checksums on every
+    node. Each phase is timed and logged as "STAGING <phase> <seconds>s"; the job exits if a phase fails.
+    copy_cmd is a template with {src} and {dst} (e.g. "sbcast --force {src} {dst}", which broadcasts from the batch
+    host); node_cmd prefixes commands that run once per node (e.g. "srun --ntasks-per-node=1").
+    The checksums of the sources are written once per phase by the batch host to a list in checksum_dir (on a
+    shared filesystem), which every node verifies with a single `<checksum_cmd> -c` (coreutils format).
+    """
+    node = f"{node_cmd} " if node_cmd else ""
+    lines = [
+        "# stage the container image and dataset shards to node-local storage",
+        f"export STAGE_DIR={shlex.quote(stage_dir)}",
+        "stage_timed() {",
+        "    local phase=$1",
+        "    shift",
+        "    local start=$(date +%s.%N)",
+        '    if ! "$@"; then',
+        '        echo "STAGING $phase failed"',
+        "        exit 1",
+        "    fi",
+        '    echo "STAGING $phase $(awk -v start=$start -v end=$(date +%s.%N) \'BEGIN {printf "%.2f", end - start}\')s"',
+        "}",
+    ]
+    if checksum_cmd:
+        lines += [
+            "# <list> <src> <dst>...: checksum list of the sources under their staged names",
+            "stage_checksums() {",
+            "    local list=$1 sum",
+            "    shift",
+            '    : > "$list" || return 1',
+            "    while [ $# -gt 0 ]; do",
+            f'        sum=$({checksum_cmd} < "$1") || return 1',
+            '        echo "${sum%% *}  $2" >> "$list" || return 1',
+            "        shift 2",
+            "    done",
+            "}",
+        ]
+
+    directories = sorted({os.path.dirname(file.dst) for file in ([image_file] if image_file else []) + data_files})
+    lines.append(f"stage_timed mkdir {node}mkdir -p " + " ".join(_quote(directory) for directory in directories))
+    for phase, files in [("image", [image_file] if image_file else []), ("data", data_files)]:
+        if not files:
+            continue
+        copies = [copy_cmd.format(src=_quote(file.src), dst=_quote(file.dst)) for file in files]
+        lines += [_function(f"stage_{phase}_copy", copies), f"stage_timed {phase}_copy stage_{phase}_copy"]
+        if checksum_cmd:
+            checksum_list = _quote(f"{checksum_dir}/staging_{phase}_$SLURM_JOB_ID.{checksum_cmd.split()[0]}")
+            pairs = " \\\n".join(f"        {_quote(file.src)} {_quote(file.dst)}" for file in files)
+            lines += [
+                _function(
+                    f"stage_{phase}_verify",
+                    [
+                        f"stage_checksums {checksum_list} \\\n{pairs}",
+                        f"{node}{checksum_cmd} --strict --quiet -c {checksum_list}",
+                    ],
+                ),
+                f"stage_timed {phase}_checksum stage_{phase}_verify",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def cleanup_script(node_cmd: str) -> str:
+    """
+    Removes the staged files after the launch, keeping the exit status of the launch (for the script's exit status
+    and the following blocks).
+    """
+    node = f"{node_cmd} " if node_cmd else ""
+    return f'stage_status=$?\nstage_timed cleanup {node}rm -rf "$STAGE_DIR"\n( exit $stage_status )\n'
+
+
+def replace_staged(value: str, replacements: dict[str, str]) -> str:
+    """
+    Replaces staged paths in a command line or argument, only whole paths are replaced.
+
+    >>> replace_staged("exec --nv /c/img.sif python", {"/c/img.sif": "$STAGE_DIR/img.sif"})
+    'exec --nv $STAGE_DIR/img.sif python'
+    """
+    return " ".join(replacements.get(part, part) for part in value.split(" "))
@@ -0,0 +1,128 @@
+import math
+import re
+from pathlib import Path
+
+from .training_log import ITERATION_RE, TIMESTAMP_RE, _parse_timestamp
+
+# "PHASE <name> <epoch seconds>", written by the slurm templates
+PHASE_RE = re.compile(rb"^PHASE (\w+) (\d+(?:\.\d+)?)\s*$", flags=re.MULTILINE)
+# "STAGING <phase> <seconds>s", written by the node-local staging block
+STAGING_RE = re.compile(rb"^STAGING (\w+) (\d+(?:\.\d+)?)s\s*$", flags=re.MULTILINE)
+# e.g. "[after megatron is initialized] datetime: 2025-09-13 13:30:00"
+DATETIME_RE = re.compile(rb"\[([^\]\n]+)\] datetime: (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+INIT_TIME_RE = re.compile(rb"time to initialize megatron \(seconds\): (\d+(?:\.\d+)?)")
+# e.g. "    model-and-optimizer-setup ......................: (1234.56, 1300.12)", in ms, possibly with the
+# "[default0]:" prefix of torch.distributed.run --tee
+TIMER_RE = re.compile(rb"^(?:\[\w+\]:)?\s+([\w/-]+) \.*: \((\d+(?:\.\d+)?), (\d+(?:\.\d+)?)\)", flags=re.MULTILINE)
+
+STARTUP_PHASES = [
+    "queue_wait",
+    "staging",
+    "srun",
+    "launch",
+    "megatron_init",
+    "model_setup",
+    "load_checkpoint",
+    "data_setup",
+    "first_iteration",
+    "time_to_first_iteration",
+]
+
+# the startup is at the beginning of the log, stop reading a log without iterations here
+MAX_STARTUP_BYTES = 256 * 2**20
+CHUNK_BYTES = 2**20
+
+
+def parse_startup(path: str | Path, max_bytes: int = MAX_STARTUP_BYTES) -> dict:
+    """
+    Reads a job log up to its first iteration line and collects the startup markers: the template's PHASE
+    markers (earliest occurrence, e.g. srun_start of the first node), the staging phase durations, Megatron's
+    datetime markers and its (min, max) timers (max in seconds) and the timestamp of the first iteration.
+    """
+    data = b""
+    with open(path, "rb") as fp:
+        while len(data) < max_bytes:
+            chunk = fp.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            # only the new data (from the last complete line on) needs to be searched
+            start = data.rfind(b"\n") + 1
+            data += chunk
+            # the first iteration line is complete once a newline follows it
+            match = ITERATION_RE.search(data, start)
+            if match and data.find(b"\n", match.end()) >= 0:
+                break
+
+    phases: dict[str, float] = {}
+    for name, value in PHASE_RE.findall(data):
+        phases[name.decode()] = min(float(value), phases.get(name.decode(), math.inf))
+    startup = {
+        "phases": phases,
+        "staging": {name.decode(): float(value) for name, value in STAGING_RE.findall(data)},
+        "datetimes": {},
+        "timers": {name.decode(): float(maximum) / 1000 for name, _, maximum in TIMER_RE.findall(data)},
+        "init_seconds": None,
+        "first_iteration": None,
+    }
+    for name, timestamp in DATETIME_RE.findall(data):
+        startup["datetimes"].setdefault(name.decode(), _parse_timestamp(timestamp))
+    match = INIT_TIME_RE.search(data)
+    if match:
+        startup["init_seconds"] = float(match.group(1))
+    match = ITERATION_RE.search(data)
+    if match:
+        line_start = data.rfind(b"\n", 0, match.start()) + 1
+        timestamp = TIMESTAMP_RE.search(data, line_start, match.start())
+        if timestamp:
+            startup["first_iteration"] = _parse_timestamp(timestamp.group(1))
+    return startup
+
+
+def _diff(end: float | None, start: float | None) -> float:
+    return end - start if end is not None and start is not None else math.nan
+
+
+def startup_breakdown(startup: dict) -> dict[str, float]:
+    """
+    Seconds spent per startup phase (NaN where the markers are missing):
+      - queue_wait: submission until the batch script starts
+      - staging: node-local staging (without the cleanup)
+      - srun: batch script launch until the first node runs its srun task
+      - launch: container start, torch.distributed.run rendezvous and imports until Megatron's pretrain starts
+      - megatron_init: Megatron's initialization (torch.distributed, parallel groups)
+      - model_setup: model, optimizer and scheduler build including the checkpoint load
+      - load_checkpoint: Megatron's load-checkpoint timer, if it is logged
+      - data_setup: dataset (index) building and data loaders
+      - first_iteration: data loaders built until the first logged iteration
+      - time_to_first_iteration: batch script start until the first logged iteration
+    Megatron's datetimes have a resolution of one second and are interpreted in the local time zone.
+
+    >>> startup_breakdown({"phases": {"submitted": 100.0, "job_start": 160.0, "launch": 161.0, "srun_start": 163.0},
+    ...                    "staging": {}, "timers": {}, "init_seconds": 7.0, "first_iteration": 230.0,
+    ...                    "datetimes": {"after megatron is initialized": 180.0,
+    ...                                  "after model, optimizer, and learning rate scheduler are built": 200.0,
+    ...                                  "after dataloaders are built": 220.0}})["launch"]
+    10.0
+    """
+    phases, datetimes, timers = startup["phases"], startup["datetimes"], startup["timers"]
+    after_init = datetimes.get("after megatron is initialized")
+    after_model = datetimes.get("after model, optimizer, and learning rate scheduler are built")
+    after_data = datetimes.get("after dataloaders are built")
+    megatron_start = after_init - startup["init_seconds"] if after_init and startup["init_seconds"] else None
+    model_setup = _diff(after_model, after_init)
+    data_setup = _diff(after_data, after_model)
+    staging = [seconds for name, seconds in startup["staging"].items() if name != "cleanup"]
+    return {
+        "queue_wait": _diff(phases.get("job_start"), phases.get("submitted")),
+        "staging": sum(staging) if staging else math.nan,
+        "srun": _diff(phases.get("srun_start"), phases.get("launch")),
+        "launch": _diff(megatron_start, phases.get("srun_start")),
+        "megatron_init": startup["init_seconds"] if startup["init_seconds"] is not None else math.nan,
+        "model_setup": timers.get("model-and-optimizer-setup", math.nan) if math.isnan(model_setup) else model_setup,
+        "load_checkpoint": timers.get("load-checkpoint", math.nan),
+        "data_setup": (
+            timers.get("train/valid/test-data-iterators-setup", math.nan) if math.isnan(data_setup) else data_setup
+        ),
+        "first_iteration": _diff(startup["first_iteration"], after_data),
+        "time_to_first_iteration": _diff(startup["first_iteration"], phases.get("job_start")),
+    }
@@ -0,0 +1,344 @@
+import json
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .cache import atomic_write, hash_key
+
+NUM_PARAMS_RE = re.compile(rb"Total number of parameters in billions: (\d+\.\d+)")
+# e.g. " [2025-09-13 13:30:00] iteration       10/     500 | consumed samples: 640 | ..."
+ITERATION_RE = re.compile(rb"\biteration\s+(\d+)\s*/\s*(\d+)\s*\|([^\n]*)")
+TIMESTAMP_RE = re.compile(rb"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]")
+# e.g. "[Rank 0] (after 10 iterations) memory (MB) | allocated: 1234.5 | max allocated: 2345.6 | ..."
+MEMORY_RE = re.compile(rb"\[Rank (\d+)\] \(after (\d+) iterations\) memory \(MB\)\s*\|([^\n]*)")
+
+CHUNK_BYTES = 16 * 2**20
+
+# short column names for the keys of Megatron's iteration log line, other keys are normalized
+COLUMN_ALIASES = {
+    "consumed samples": "consumed_samples",
+    "consumed tokens": "consumed_tokens",
+    "elapsed time per iteration (ms)": "itertime_ms",
+    "throughput per gpu (tflop/s/gpu)": "tflops_per_gpu",
+    "learning rate": "lr",
+    "global batch size": "global_batch_size",
+    "lm loss": "lm_loss",
+    "loss scale": "loss_scale",
+    "grad norm": "grad_norm",
+    "num zeros": "num_zeros",
+    "params norm": "params_norm",
+    "number of skipped iterations": "skipped_iterations",
+    "number of nan iterations": "nan_iterations",
+    "allocated": "allocated_mb",
+    "max allocated": "max_allocated_mb",
+    "reserved": "reserved_mb",
+    "max reserved": "max_reserved_mb",
+}
+
+
+def column_name(key: str) -> str:
+    """
+    >>> column_name("elapsed time per iteration (ms)")
+    'itertime_ms'
+    >>> column_name("mtp_1 loss")
+    'mtp_1_loss'
+    """
+    key = key.strip().lower()
+    return COLUMN_ALIASES.get(key) or re.sub(r"[^a-z0-9]+", "_", key).strip("_")
+
+
+@lru_cache(maxsize=4096)
+def _column_name(key: bytes) -> str:
+    return column_name(key.decode(errors="replace"))
+
+
+def _parse_timestamp(timestamp: bytes) -> float:
+    # "%Y-%m-%d %H:%M:%S", parsed by hand as strptime dominates the parse time otherwise
+    return datetime(
+        int(timestamp[0:4]),
+        int(timestamp[5:7]),
+        int(timestamp[8:10]),
+        int(timestamp[11:13]),
+        int(timestamp[14:16]),
+        int(timestamp[17:19]),
+    ).timestamp()
+
+
+def _to_float(value: bytes) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def parse_key_values(data: bytes) -> dict[str, float]:
+    """
+    Parses `key: value | key: value` segments into numeric columns.
+
+    >>> parse_key_values(b" lm loss: 9.876543E+00 | loss scale: 1.0 | grad norm: 2.345 |")
+    {'lm_loss': 9.876543, 'loss_scale': 1.0, 'grad_norm': 2.345}
+    """
+    row = {}
+    for segment in data.split(b"|"):
+        key, sep, value = segment.rpartition(b":")
+        if sep and key.strip():
+            row[_column_name(key)] = _to_float(value)
+    return row
+
+
+class ColumnTable:
+    """
+    Append-only table of float64 columns. Columns that appear later are padded with NaN.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray] | None = None):
+        self.columns: dict[str, list[float]] = {key: list(values) for key, values in (columns or {}).items()}
+        self.num_rows = max((len(values) for values in self.columns.values()), default=0)
+
+    def append(self, row: dict[str, float]):
+        if row.keys() == self.columns.keys():
+            for key, value in row.items():
+                self.columns[key].append(value)
+        else:
+            for key in row:
+                if key not in self.columns:
+                    self.columns[key] = [math.nan] * self.num_rows
+            for key, values in self.columns.items():
+                values.append(row.get(key, math.nan))
+        self.num_rows += 1
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def get(self, key: str) -> np.ndarray:
+        return np.array(self.columns.get(key, []), dtype=np.float64)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {key: np.array(values, dtype=np.float64) for key, values in self.columns.items()}
+
+
+@dataclass
+class LogState:
+    """
+    Parse state of a (growing) training log: the byte offset up to which complete lines were parsed,
+    the parameter count and columnar tables of all iteration and memory report lines.
+    The tables are stored in columns_file (npz) and loaded lazily.
+    """
+
+    path: str
+    inode: int = 0
+    offset: int = 0
+    num_params: float | None = None
+    columns_file: str | None = None
+    _iterations: ColumnTable | None = field(default=None, repr=False, compare=False)
+    _memory: ColumnTable | None = field(default=None, repr=False, compare=False)
+    _dirty: bool = field(default=False, repr=False, compare=False)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "LogState":
+        return cls(**data)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "inode": self.inode,
+            "offset": self.offset,
+            "num_params": self.num_params,
+            "columns_file": self.columns_file,
+        }
+
+    def _load_columns(self):
+        arrays = {}
+        if self.offset > 0 and self.columns_file and os.path.exists(self.columns_file):
+            with np.load(self.columns_file) as npz:
+                arrays = {key: npz[key] for key in npz.files}
+        self._iterations = ColumnTable(
+            {key.removeprefix("iter/"): val for key, val in arrays.items() if key.startswith("iter/")}
+        )
+        self._memory = ColumnTable(
+            {key.removeprefix("mem/"): val for key, val in arrays.items() if key.startswith("mem/")}
+        )
+
+    @property
+    def iterations(self) -> ColumnTable:
+        if self._iterations is None:
+            self._load_columns()
+        return self._iterations
+
+    @property
+    def memory(self) -> ColumnTable:
+        if self._memory is None:
+            self._load_columns()
+        return self._memory
+
+    @property
+    def itertimes(self) -> list[float]:
+        return [itertime for itertime in self.iterations.get("itertime_ms").tolist() if not math.isnan(itertime)]
+
+    def parse(self, data: bytes):
+        """
+        Parses a block of complete lines.
+        """
+        for match in ITERATION_RE.finditer(data):
+            iteration, train_iters, rest = match.groups()
+            row = {"iteration": float(iteration), "train_iters": float(train_iters)}
+            timestamp = TIMESTAMP_RE.search(data, data.rfind(b"\n", 0, match.start()) + 1, match.start())
+            if timestamp:
+                row["timestamp"] = _parse_timestamp(timestamp.group(1))
+            row.update(parse_key_values(rest))
+            self.iterations.append(row)
+            self._dirty = True
+        for match in MEMORY_RE.finditer(data):
+            rank, iteration, rest = match.groups()
+            self.memory.append({"rank": float(rank), "iteration": float(iteration), **parse_key_values(rest)})
+            self._dirty = True
+        if self.num_params is None:
+            match = NUM_PARAMS_RE.search(data)
+            if match:
+                self.num_params = float(match.group(1))
+
+    def check_columns(self):
+        """
+        Reconciles the offset with the columns file. The columns are written before the index, so after an
+        interruption in between the columns already hold the rows beyond the indexed offset (their own offset is
+        stored with them); without the columns file, the log is parsed from the start again.
+        """
+        if self.columns_file is None or self._iterations is not None or self.offset == 0:
+            return
+        try:
+            with np.load(self.columns_file) as npz:
+                if "meta/offset" not in npz.files:
+                    return
+                offset, inode, num_params = (
+                    int(npz["meta/offset"]),
+                    int(npz["meta/inode"]),
+                    float(npz["meta/num_params"]),
+                )
+        except (OSError, ValueError):
+            self.offset = 0
+            return
+        if inode == self.inode and offset > self.offset:
+            self.offset = offset
+            if not math.isnan(num_params):
+                self.num_params = num_params
+
+    def save_columns(self):
+        if self.columns_file and self._dirty:
+            arrays = {f"iter/{key}": val for key, val in self.iterations.to_arrays().items()}
+            arrays.update({f"mem/{key}": val for key, val in self.memory.to_arrays().items()})
+            arrays.update(
+                {
+                    "meta/offset": np.array(self.offset),
+                    "meta/inode": np.array(self.inode),
+                    "meta/num_params": np.array(math.nan if self.num_params is None else self.num_params),
+                }
+            )
+            tmp_file = f"{self.columns_file}.{os.getpid()}.tmp.npz"
+            np.savez_compressed(tmp_file, **arrays)
+            os.replace(tmp_file, self.columns_file)
+            self._dirty = False
+
+    def drop_columns(self):
+        """
+        Frees the in-memory tables (e.g. before sending the state between processes), they are re-loaded on access.
+        """
+        self.save_columns()
+        if self.columns_file:
+            self._iterations = None
+            self._memory = None
+
+
+def update_log_state(path: str | Path, state: LogState | None = None, chunk_bytes: int = CHUNK_BYTES) -> LogState:
+    """
+    Parses only the bytes appended to the log since the last call. A truncated or replaced log
+    (smaller size or different inode) is parsed from the start again. A trailing incomplete line
+    is left for the next call.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile("wb", suffix=".out") as fp:
+    ...     _ = fp.write(b" iteration 1/ 10 | elapsed time per iteration (ms): 10.5 | lm loss: 2.0 |\\n iteration 2/")
+    ...     fp.flush()
+    ...     state = update_log_state(fp.name)
+    ...     _ = fp.write(b" 10 | elapsed time per iteration (ms): 11.5 | lm loss: 1.5 |\\n")
+    ...     fp.flush()
+    ...     state = update_log_state(fp.name, state)
+    >>> state.itertimes, state.iterations.get("lm_loss").tolist()
+    ([10.5, 11.5], [2.0, 1.5])
+    """
+    path = str(path)
+    stat = os.stat(path)
+    if state is not None:
+        state.check_columns()
+    if state is None or state.inode != stat.st_ino or stat.st_size < state.offset:
+        state = LogState(path=path, inode=stat.st_ino, columns_file=state.columns_file if state else None)
+        state._iterations, state._memory, state._dirty = ColumnTable(), ColumnTable(), True
+    with open(path, "rb") as fp:
+        fp.seek(state.offset)
+        rest = b""
+        while True:
+            chunk = fp.read(chunk_bytes)
+            if not chunk:
+                break
+            data = rest + chunk
+            cut = data.rfind(b"\n") + 1
+            state.parse(data[:cut])
+            state.offset += cut
+            rest = data[cut:]
+    return state
+
+
+def new_log_state(path: str | Path, columns_dir: str | Path | None = None) -> LogState:
+    path = str(path)
+    return LogState(
+        path=path, columns_file=str(Path(columns_dir) / f"{hash_key(path)[:16]}.npz") if columns_dir else None
+    )
+
+
+class LogIndex:
+    """
+    On-disk index of LogStates (one JSON file with offsets, plus one npz file with the metric columns per log),
+    such that re-runs only parse newly appended bytes.
+    """
+
+    def __init__(self, index_file: str | Path | None = None):
+        self.index_file = Path(index_file) if index_file else None
+        self.states: dict[str, LogState] = {}
+        if self.index_file is not None and self.index_file.exists():
+            try:
+                with open(self.index_file) as fp:
+                    self.states = {path: LogState.from_dict(state) for path, state in json.load(fp).items()}
+            except (ValueError, TypeError):
+                self.states = {}
+
+    @property
+    def columns_dir(self) -> Path | None:
+        if self.index_file is None:
+            return None
+        columns_dir = self.index_file.with_suffix("")
+        columns_dir.mkdir(parents=True, exist_ok=True)
+        return columns_dir
+
+    def get(self, path: str | Path) -> LogState:
+        """
+        Returns the state for path, or a fresh state that stores its columns alongside the index.
+        """
+        path = str(path)
+        if path not in self.states:
+            self.states[path] = new_log_state(path, self.columns_dir)
+        return self.states[path]
+
+    def update(self, states: dict[str, LogState]):
+        self.states.update(states)
+
+    def save(self):
+        if self.index_file is not None:
+            for state in self.states.values():
+                state.save_columns()
+            atomic_write(self.index_file, json.dumps({path: state.to_dict() for path, state in self.states.items()}))
@@ -0,0 +1,276 @@
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from .flops import cfg_flag, cfg_get
+from .memory import ParallelLayout
+
+REQUIRED_KEYS = [
+    "micro_batch_size",
+    "lr_decay_style",
+    "lr",
+    "num_layers",
+    "hidden_size",
+    "ffn_hidden_size",
+    "kv_channels",
+    "num_attention_heads",
+    "vocab_size",
+    "max_position_embeddings",
+    "tokenizer_type",
+    "tokenizer_model",
+]
+
+
+@dataclass
+class Violation:
+    rule: str
+    message: str
+    severity: str = "error"
+
+    def __str__(self):
+        return f"{self.severity.upper()} [{self.rule}] {self.message}"
+
+
+@dataclass
+class Rule:
+    """
+    A named check of a megatron config on a given world size. check returns the violation messages.
+    Warnings flag settings Megatron silently ignores or adjusts, errors fail the job.
+    """
+
+    name: str
+    description: str
+    check: Callable[[Any, int], list[str]]
+    severity: str = "error"
+
+
+RULES: list[Rule] = []
+
+
+def rule(description: str, severity: str = "error"):
+    """
+    Registers a check function, its name is the rule name.
+    A check may return None, a message or a list of messages.
+    """
+
+    def register(check: Callable[[Any, int], str | list[str] | None]):
+        def messages(cfg: Any, world_size: int) -> list[str]:
+            result = check(cfg, world_size)
+            if result is None:
+                return []
+            return [result] if isinstance(result, str) else list(result)
+
+        RULES.append(Rule(name=check.__name__, description=description, check=messages, severity=severity))
+        return check
+
+    return register
+
+
+def errors(violations: list[Violation]) -> list[Violation]:
+    return [violation for violation in violations if violation.severity == "error"]
+
+
+def format_violations(violations: list[Violation]) -> str:
+    return f"{len(violations)} config violation(s):\n" + "\n".join(f"  {violation}" for violation in violations)
+
+
+def validate_config(cfg: Any, world_size: int, rules: list[Rule] | None = None) -> list[Violation]:
+    """
+    Evaluates every rule on a megatron config (dataclass or dict) for a world size and returns all violations.
+    A rule that fails on an incomplete config is reported instead of aborting the validation.
+
+    >>> cfg = dict(num_layers=26, num_attention_heads=16, group_query_attention=True, num_query_groups=4,
+    ...            tensor_model_parallel_size=3, micro_batch_size=4, train_iters=10, global_batch_size=30)
+    >>> [violation.rule for violation in validate_config(cfg, world_size=8)]  # doctest: +NORMALIZE_WHITESPACE
+    ['required', 'world_size_divisibility', 'heads_divisible_by_tp', 'query_groups_divisible_by_tp',
+     'global_batch_divisibility']
+    """
+    violations = []
+    for checked_rule in RULES if rules is None else rules:
+        try:
+            messages = checked_rule.check(cfg, world_size)
+        except (TypeError, ValueError, ZeroDivisionError) as e:
+            messages = [f"could not be checked: {type(e).__name__}: {e}"]
+        violations += [Violation(checked_rule.name, message, checked_rule.severity) for message in messages]
+    return violations
+
+
+def _layout(cfg: Any, world_size: int) -> ParallelLayout:
+    return ParallelLayout.from_config(cfg, world_size)
+
+
+@rule("Arguments without a usable Megatron default must be set")
+def required(cfg: Any, world_size: int):
+    missing = [key for key in REQUIRED_KEYS if cfg_get(cfg, key) is None]
+    if cfg_get(cfg, "train_iters") is None and cfg_get(cfg, "train_samples") is None:
+        missing.append("train_iters (or train_samples)")
+    if missing:
+        return f"not set: {', '.join(missing)}"
+
+
+@rule("The world size must factor into TP x PP x CP x DP (and ETP x EP x PP x EDP for experts)")
+def world_size_divisibility(cfg: Any, world_size: int):
+    layout = _layout(cfg, world_size)
+    messages = []
+    if world_size % (layout.tp * layout.pp * layout.cp):
+        messages.append(f"world size {world_size} is not divisible by TP {layout.tp} x PP {layout.pp} x CP {layout.cp}")
+    if cfg_get(cfg, "num_experts") and world_size % (layout.etp * layout.ep * layout.pp):
+        messages.append(
+            f"world size {world_size} is not divisible by ETP {layout.etp} x EP {layout.ep} x PP {layout.pp}"
+        )
+    return messages
+
+
+@rule("Each pipeline stage needs the same number of layers")
+def layers_divisible_by_pp(cfg: Any, world_size: int):
+    pp = cfg_get(cfg, "pipeline_model_parallel_size", 1)
+    # uneven first/last stages are configured explicitly
+    if cfg_get(cfg, "decoder_first_pipeline_num_layers") or cfg_get(cfg, "decoder_last_pipeline_num_layers"):
+        return None
+    num_layers = cfg_get(cfg, "num_layers")
+    if num_layers is not None and num_layers % pp:
+        return f"num_layers {num_layers} is not divisible by pipeline_model_parallel_size {pp}"
+    layers_per_virtual_stage = cfg_get(cfg, "num_layers_per_virtual_pipeline_stage")
+    if num_layers is not None and layers_per_virtual_stage and (num_layers // pp) % layers_per_virtual_stage:
+        return (
+            f"layers per pipeline stage {num_layers // pp} are not divisible by "
+            f"num_layers_per_virtual_pipeline_stage {layers_per_virtual_stage}"
+        )
+
+
+@rule("Attention heads are split across tensor parallel ranks")
+def heads_divisible_by_tp(cfg: Any, world_size: int):
+    tp = cfg_get(cfg, "tensor_model_parallel_size", 1)
+    num_heads = cfg_get(cfg, "num_attention_heads")
+    if num_heads is not None and num_heads % tp:
+        return f"num_attention_heads {num_heads} is not divisible by tensor_model_parallel_size {tp}"
+
+
+@rule("Key/value heads (query groups) are split across tensor parallel ranks")
+def query_groups_divisible_by_tp(cfg: Any, world_size: int):
+    tp = cfg_get(cfg, "tensor_model_parallel_size", 1)
+    num_query_groups = cfg_get(cfg, "num_query_groups", 1)
+    if cfg_flag(cfg, "group_query_attention") and num_query_groups % tp:
+        return f"num_query_groups {num_query_groups} is not divisible by tensor_model_parallel_size {tp}"
+
+
+@rule("Without group query attention every head has its own key/value head", severity="warning")
+def query_groups_without_gqa(cfg: Any, world_size: int):
+    num_query_groups = cfg_get(cfg, "num_query_groups", 1)
+    num_heads = cfg_get(cfg, "num_attention_heads")
+    if not cfg_flag(cfg, "group_query_attention") and num_query_groups not in [1, num_heads]:
+        return f"num_query_groups {num_query_groups} is ignored without group_query_attention"
+
+
+@rule("The global batch must split into micro batches on every data parallel rank")
+def global_batch_divisibility(cfg: Any, world_size: int):
+    global_batch_size = cfg_get(cfg, "global_batch_size")
+    micro_batch_size = cfg_get(cfg, "micro_batch_size")
+    # without a global batch size Megatron uses micro_batch_size x DP
+    if global_batch_size is None or micro_batch_size is None:
+        return None
+    dp = _layout(cfg, world_size).dp
+    if global_batch_size % (micro_batch_size * dp):
+        return (
+            f"global_batch_size {global_batch_size} is not divisible by micro_batch_size {micro_batch_size} "
+            f"x data parallel size {dp}"
+        )
+
+
+@rule("Context parallelism splits each sequence into 2 x CP chunks (load balancing of causal attention)")
+def seq_length_divisible_by_cp(cfg: Any, world_size: int):
+    cp = cfg_get(cfg, "context_parallel_size", 1)
+    seq_length = cfg_get(cfg, "seq_length")
+    if cp > 1 and seq_length is not None and seq_length % (2 * cp):
+        return f"seq_length {seq_length} is not divisible by 2 x context_parallel_size {cp}"
+
+
+@rule("Learned absolute position embeddings must cover the sequence")
+def seq_length_within_positions(cfg: Any, world_size: int):
+    seq_length, max_positions = cfg_get(cfg, "seq_length"), cfg_get(cfg, "max_position_embeddings")
+    if cfg_get(cfg, "position_embedding_type", "learned_absolute") != "learned_absolute":
+        return None
+    if seq_length is not None and max_positions is not None and seq_length > max_positions:
+        return f"seq_length {seq_length} exceeds max_position_embeddings {max_positions}"
+
+
+@rule("Experts are distributed evenly across expert parallel ranks")
+def experts_divisible_by_ep(cfg: Any, world_size: int):
+    ep = cfg_get(cfg, "expert_model_parallel_size", 1)
+    num_experts = cfg_get(cfg, "num_experts")
+    if num_experts is None:
+        return f"expert_model_parallel_size {ep} without num_experts" if ep > 1 else None
+    if num_experts % ep:
+        return f"num_experts {num_experts} is not divisible by expert_model_parallel_size {ep}"
+
+
+@rule("Expert parallelism with tensor parallelism needs sequence parallelism")
+def moe_sequence_parallel(cfg: Any, world_size: int):
+    ep, tp = cfg_get(cfg, "expert_model_parallel_size", 1), cfg_get(cfg, "tensor_model_parallel_size", 1)
+    if ep > 1 and tp > 1 and not cfg_flag(cfg, "sequence_parallel"):
+        return "expert_model_parallel_size > 1 with tensor_model_parallel_size > 1 requires sequence_parallel"
+
+
+@rule("MoE layers do not support linear biases")
+def moe_without_bias(cfg: Any, world_size: int):
+    if cfg_get(cfg, "num_experts", 0) > 1 and cfg_flag(cfg, "add_bias_linear", True):
+        return "num_experts > 1 requires add_bias_linear to be disabled"
+
+
+@rule("Only one data parallel sharding implementation can be active")
+def exclusive_sharding(cfg: Any, world_size: int):
+    messages = []
+    if cfg_flag(cfg, "use_torch_fsdp2"):
+        if cfg_flag(cfg, "use_distributed_optimizer"):
+            messages.append("use_torch_fsdp2 and use_distributed_optimizer are exclusive")
+        if cfg_flag(cfg, "use_megatron_fsdp"):
+            messages.append("use_torch_fsdp2 and use_megatron_fsdp are exclusive")
+        if cfg_flag(cfg, "gradient_accumulation_fusion"):
+            messages.append("use_torch_fsdp2 does not support gradient_accumulation_fusion")
+    return messages
+
+
+@rule("FSDP implementations save checkpoints in their own format")
+def fsdp_checkpoint_format(cfg: Any, world_size: int):
+    ckpt_format = cfg_get(cfg, "ckpt_format", "torch_dist")
+    if cfg_flag(cfg, "use_megatron_fsdp") and ckpt_format != "fsdp_dtensor":
+        return f"use_megatron_fsdp requires ckpt_format fsdp_dtensor, not {ckpt_format}"
+    if cfg_flag(cfg, "use_torch_fsdp2") and ckpt_format != "torch_dist":
+        return f"use_torch_fsdp2 requires ckpt_format torch_dist, not {ckpt_format}"
+
+
+@rule("Gradient accumulation fusion needs unsharded gradients")
+def gradient_accumulation_fusion_sharding(cfg: Any, world_size: int):
+    strategy = cfg_get(cfg, "data_parallel_sharding_strategy", "no_shard")
+    if cfg_flag(cfg, "gradient_accumulation_fusion") and strategy not in ["no_shard", "optim"]:
+        return f"gradient_accumulation_fusion is not supported with data_parallel_sharding_strategy {strategy}"
+
+
+@rule("Overlapping the parameter all-gather needs a sharded optimizer and overlapped gradient reduction")
+def overlap_param_gather(cfg: Any, world_size: int):
+    if not cfg_flag(cfg, "overlap_param_gather"):
+        return None
+    messages = []
+    if not (cfg_flag(cfg, "use_distributed_optimizer") or cfg_flag(cfg, "use_megatron_fsdp")):
+        messages.append("overlap_param_gather requires use_distributed_optimizer or use_megatron_fsdp")
+    if not cfg_flag(cfg, "overlap_grad_reduce"):
+        messages.append("overlap_param_gather requires overlap_grad_reduce")
+    return messages
+
+
+@rule("Selective recomputation does not take a recompute method")
+def selective_recompute_method(cfg: Any, world_size: int):
+    if cfg_get(cfg, "recompute_granularity") == "selective" and cfg_get(cfg, "recompute_method") is not None:
+        return "recompute_method must not be set with recompute_granularity selective"
+
+
+@rule("Only one reduced precision format")
+def single_precision(cfg: Any, world_size: int):
+    if cfg_flag(cfg, "fp16") and cfg_flag(cfg, "bf16"):
+        return "fp16 and bf16 are exclusive"
+
+
+@rule("The learning rate warmup must fit into the training")
+def warmup_within_training(cfg: Any, world_size: int):
+    warmup, train_iters = cfg_get(cfg, "lr_warmup_iters", 0), cfg_get(cfg, "train_iters")
+    if train_iters is not None and warmup > train_iters:
+        return f"lr_warmup_iters {warmup} exceeds train_iters {train_iters}"
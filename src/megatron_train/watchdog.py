@@ -0,0 +1,236 @@
+import argparse
+import math
+import os
+import shlex
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# py-spy dumps of all training processes, one task per node of the job (py-spy is skipped where it is missing)
+DUMP_CMD = (
+    "srun --overlap --jobid {jobid} --ntasks-per-node=1 bash -c "
+    "'command -v py-spy >/dev/null || { echo py-spy not available on $(hostname); exit 0; }; "
+    'for pid in $(pgrep -f pretrain_gpt.py); do echo "== $(hostname) $pid"; py-spy dump --pid $pid; done\''
+)
+
+
+@dataclass
+class WatchdogSettings:
+    """
+    A job stalls if no new iteration line appears for stall_factor times the expected time between iteration lines
+    (logged iterations x iteration time, median over a window), but at least min_stall seconds. Until the first
+    iteration line, startup_grace seconds apply (measured from the start of the watch).
+    """
+
+    startup_grace: float = 1800.0
+    stall_factor: float = 10.0
+    min_stall: float = 600.0
+    window: int = 20
+    dump_cmd: str | None = DUMP_CMD
+    dump_timeout: float = 120.0
+    scancel_cmd: str = "scancel"
+    tail_lines: int = 200
+    diagnostics_dir: str | None = None
+    dry_run: bool = False
+
+
+@dataclass
+class Watchdog:
+    """
+    Stall detection of one job from its iteration progress. Times are monotonic seconds.
+
+    >>> watchdog = Watchdog(WatchdogSettings(startup_grace=100, stall_factor=3, min_stall=10), started=0.0)
+    >>> watchdog.check(50.0), watchdog.check(101.0)
+    (None, 'no iteration line within the startup grace of 100s')
+    >>> watchdog.update(60.0, 10, 2000.0); watchdog.update(80.0, 20, 2000.0)
+    >>> watchdog.threshold, watchdog.check(130.0), watchdog.check(141.0)
+    (60.0, None, 'no new iteration line for 61s (threshold 60s = 3 x 20s per logged interval)')
+    """
+
+    settings: WatchdogSettings
+    started: float
+    iteration: int | None = None
+    last_progress: float | None = None
+    intervals: deque = field(default_factory=deque)
+    triggered: bool = False
+
+    def update(self, now: float, iteration: int | None, itertime_ms: float):
+        """
+        Records the latest logged iteration and its iteration time.
+        """
+        if iteration is None or iteration == self.iteration:
+            return
+        if self.iteration is not None and iteration > self.iteration and not math.isnan(itertime_ms):
+            self.intervals.append((iteration - self.iteration) * itertime_ms / 1000)
+            while len(self.intervals) > self.settings.window:
+                self.intervals.popleft()
+        self.iteration, self.last_progress = iteration, now
+
+    @property
+    def expected_interval(self) -> float:
+        if not self.intervals:
+            return math.nan
+        ordered = sorted(self.intervals)
+        return ordered[len(ordered) // 2]
+
+    @property
+    def threshold(self) -> float:
+        # the first iteration line gives no interval yet, the startup grace applies until the second one
+        if math.isnan(self.expected_interval):
+            return self.settings.startup_grace
+        return max(self.settings.min_stall, self.settings.stall_factor * self.expected_interval)
+
+    def check(self, now: float) -> str | None:
+        """
+        Returns the reason if the job stalls.
+        """
+        if self.last_progress is None:
+            if now - self.started > self.settings.startup_grace:
+                return f"no iteration line within the startup grace of {self.settings.startup_grace:.0f}s"
+            return None
+        silent = now - self.last_progress
+        if silent > self.threshold:
+            if math.isnan(self.expected_interval):
+                return f"no second iteration line for {silent:.0f}s (startup grace {self.threshold:.0f}s)"
+            return (
+                f"no new iteration line for {silent:.0f}s (threshold {self.threshold:.0f}s = "
+                f"{self.settings.stall_factor:g} x {self.expected_interval:.0f}s per logged interval)"
+            )
+        return None
+
+
+def tail_lines(path: str | Path, num_lines: int, block_bytes: int = 2**16) -> list[str]:
+    """
+    Last num_lines lines of a file, read backwards in blocks.
+    """
+    with open(path, "rb") as fp:
+        fp.seek(0, os.SEEK_END)
+        position, data = fp.tell(), b""
+        while position > 0 and data.count(b"\n") <= num_lines:
+            step = min(block_bytes, position)
+            position -= step
+            fp.seek(position)
+            data = fp.read(step) + data
+    return [line.decode(errors="replace") for line in data.splitlines()[-num_lines:]]
+
+
+def capture_diagnostics(jobid: str, stdout: str | None, reason: str, settings: WatchdogSettings) -> Path:
+    """
+    Writes the reason, the last log lines and the py-spy dumps of a stalled job to
+    <diagnostics_dir or log dir>/hang_<jobid>_<time>/.
+    """
+    base = settings.diagnostics_dir or (os.path.dirname(stdout) if stdout else ".")
+    directory = Path(base) / f"hang_{jobid}_{time.strftime('%Y%m%d_%H%M%S')}"
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "reason.txt", "w") as fp:
+        fp.write(f"job {jobid}: {reason}\n")
+    if stdout:
+        try:
+            lines = tail_lines(stdout, settings.tail_lines)
+        except OSError as e:
+            lines = [f"log not readable: {e}"]
+        with open(directory / "log_tail.txt", "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+    if settings.dump_cmd:
+        with open(directory / "py_spy.txt", "w") as fp:
+            try:
+                subprocess.run(
+                    settings.dump_cmd.format(jobid=jobid),
+                    shell=True,
+                    stdout=fp,
+                    stderr=subprocess.STDOUT,
+                    timeout=settings.dump_timeout,
+                )
+            except subprocess.TimeoutExpired:
+                fp.write(f"\ndump timed out after {settings.dump_timeout:.0f}s\n")
+    return directory
+
+
+def handle_stall(jobid: str, stdout: str | None, reason: str, settings: WatchdogSettings) -> Path:
+    """
+    Captures the diagnostics of a stalled job, then cancels it (unless dry_run).
+    """
+    directory = capture_diagnostics(jobid, stdout, reason, settings)
+    print(f"Job {jobid} stalled: {reason}, diagnostics in {directory}")
+    if settings.dry_run:
+        print(f"Dry run, not cancelling job {jobid}")
+    else:
+        subprocess.run(shlex.split(settings.scancel_cmd) + [str(jobid)], check=False)
+    return directory
+
+
+def watchdog_script(cmd: str, log_pattern: str, settings: WatchdogSettings) -> tuple[str, str]:
+    """
+    Bash blocks before and after the launch: the first starts the watchdog as a sidecar of the batch script (%j of
+    the log pattern is the job id), the second stops it once srun returned, keeping the exit status of srun.
+
+    >>> print(watchdog_script("python watch_job.py", "/out/%j.out", WatchdogSettings(dump_cmd=None))[0].splitlines()[1])
+    python watch_job.py --jobid "$SLURM_JOB_ID" --log /out/"$SLURM_JOB_ID".out --slurm-interval 0 \
+--startup-grace 1800.0 --stall-factor 10.0 --min-stall 600.0 --tail-lines 200 --scancel scancel --dump-cmd '' &
+    """
+    log = '"$SLURM_JOB_ID"'.join(shlex.quote(part) if part else "" for part in log_pattern.split("%j"))
+    # the sidecar ends with srun, a failed job state query must not end it early
+    args = [
+        f'--jobid "$SLURM_JOB_ID" --log {log} --slurm-interval 0',
+        f"--startup-grace {settings.startup_grace} --stall-factor {settings.stall_factor}",
+        f"--min-stall {settings.min_stall} --tail-lines {settings.tail_lines}",
+        f"--scancel {shlex.quote(settings.scancel_cmd)}",
+    ]
+    # an empty --dump-cmd skips the dumps, without the flag the sidecar would use DUMP_CMD
+    args.append(f"--dump-cmd {shlex.quote(settings.dump_cmd or '')}")
+    if settings.diagnostics_dir:
+        args.append(f"--diagnostics-dir {shlex.quote(settings.diagnostics_dir)}")
+    setup = [
+        "# hang watchdog: cancels the job if it stops printing iteration lines",
+        f"{cmd} {' '.join(args)} &",
+        "WATCHDOG_PID=$!",
+    ]
+    after = [
+        "watchdog_status=$?",
+        'kill "$WATCHDOG_PID" 2>/dev/null',
+        "( exit $watchdog_status )",
+    ]
+    return "\n".join(setup) + "\n", "\n".join(after) + "\n"
+
+
+def add_watchdog_args(parser: argparse.ArgumentParser):
+    """
+    Arguments of the stall detection, shared by the sidecar and the submit-side follower.
+    """
+    parser.add_argument(
+        "--startup-grace", type=float, default=1800.0, help="Seconds until the first iteration line must appear"
+    )
+    parser.add_argument(
+        "--stall-factor",
+        type=float,
+        default=10.0,
+        help="Stall threshold in units of the expected time between iteration lines",
+    )
+    parser.add_argument("--min-stall", type=float, default=600.0, help="Minimal stall threshold in seconds")
+    parser.add_argument("--tail-lines", type=int, default=200, help="Log lines saved with the diagnostics")
+    parser.add_argument(
+        "--dump-cmd",
+        type=str,
+        default=DUMP_CMD,
+        help="Command capturing stack dumps, {jobid} is replaced (empty: no dumps)",
+    )
+    parser.add_argument("--scancel", type=str, default="scancel", help="scancel command")
+    parser.add_argument(
+        "--diagnostics-dir", type=str, default=None, help="Directory of the diagnostics (default: the log's dir)"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Capture diagnostics, but do not cancel")
+
+
+def watchdog_settings(args: argparse.Namespace) -> WatchdogSettings:
+    return WatchdogSettings(
+        startup_grace=args.startup_grace,
+        stall_factor=args.stall_factor,
+        min_stall=args.min_stall,
+        tail_lines=args.tail_lines,
+        dump_cmd=args.dump_cmd or None,
+        scancel_cmd=args.scancel,
+        diagnostics_dir=args.diagnostics_dir,
+        dry_run=args.dry_run,
+    )
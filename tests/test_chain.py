@@ -0,0 +1,157 @@
+import os
+import signal
+import stat
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+from megatron_train.chain import CHAIN_FILE, TRACKER_FILE, chain_script, chain_state, read_chain
+
+TRAIN_ITERS = 500
+
+# stand-in for the training step: checkpoints FAKE_ITER (or FAKE_SIGNAL_ITER when terminated) and exits
+FAKE_SRUN = """#!/bin/bash
+trap 'echo "$FAKE_SIGNAL_ITER" > "$SAVE_DIR/{tracker}"; kill $sleeper 2>/dev/null; exit 0' TERM
+if [ -n "$FAKE_SLEEP" ]; then
+    sleep "$FAKE_SLEEP" &
+    sleeper=$!
+    touch "$SAVE_DIR/running"
+    wait $sleeper
+fi
+[ -n "$FAKE_ITER" ] && echo "$FAKE_ITER" > "$SAVE_DIR/{tracker}"
+exit ${{FAKE_EXIT:-0}}
+""".format(tracker=TRACKER_FILE)
+
+# stand-ins for sbatch/scontrol: record their arguments
+RECORDER = """#!/bin/bash
+echo "$(basename "$0") $@" >> "$CALLS_FILE"
+"""
+
+
+def _executable(path: Path, content: str):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+
+@pytest.fixture
+def chain_env(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _executable(bin_dir / "srun", FAKE_SRUN)
+    _executable(bin_dir / "sbatch", RECORDER)
+    _executable(bin_dir / "scontrol", RECORDER)
+    save_dir = tmp_path / "ckpt"
+    save_dir.mkdir()
+    env = {
+        **os.environ,
+        "PATH": f"{bin_dir}:{os.environ['PATH']}",
+        "SAVE_DIR": str(save_dir),
+        "CALLS_FILE": str(tmp_path / "calls"),
+        "SLURM_JOB_ID": "1001",
+    }
+    return tmp_path, save_dir, env
+
+
+def _batch_script(tmp_path: Path, save_dir: Path, mode: str, max_segments: int = 20) -> Path:
+    setup, after = chain_script(
+        str(tmp_path / CHAIN_FILE),
+        str(save_dir),
+        TRAIN_ITERS,
+        mode,
+        max_segments,
+        "USR1",
+        str(tmp_path / "train_megatron.sbatch"),
+    )
+    script = tmp_path / "train_megatron.sbatch"
+    script.write_text(f"#!/bin/bash\n{setup}\nchain_run srun python pretrain_gpt.py\n{after}")
+    return script
+
+
+def _run(script: Path, env: dict[str, str], **extra: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["bash", str(script)], env={**env, **extra}, capture_output=True, text=True, timeout=60)
+
+
+def _calls(tmp_path: Path) -> list[str]:
+    calls = tmp_path / "calls"
+    return calls.read_text().splitlines() if calls.exists() else []
+
+
+def test_completed(chain_env):
+    tmp_path, save_dir, env = chain_env
+    result = _run(_batch_script(tmp_path, save_dir, "dependency"), env, FAKE_ITER=str(TRAIN_ITERS))
+    assert result.returncode == 0
+    events = read_chain(tmp_path)
+    assert [(event.event, event.segment, event.iteration) for event in events] == [
+        ("start", 0, -1),
+        ("completed", 0, TRAIN_ITERS),
+    ]
+    assert chain_state(events) == "completed"
+    assert _calls(tmp_path) == []
+
+
+def test_next_segment_dependency(chain_env):
+    tmp_path, save_dir, env = chain_env
+    script = _batch_script(tmp_path, save_dir, "dependency")
+    assert _run(script, env, FAKE_ITER="200").returncode == 0
+    assert [event.event for event in read_chain(tmp_path)] == ["start", "next"]
+    assert _calls(tmp_path) == [f"sbatch --dependency=afterany:1001 {script}"]
+
+    # the follow-up segment resumes from the checkpoint and completes
+    assert _run(script, env, FAKE_ITER=str(TRAIN_ITERS), SLURM_JOB_ID="1002").returncode == 0
+    events = read_chain(tmp_path)
+    assert [(event.event, event.segment, event.jobid) for event in events][2:] == [
+        ("start", 1, "1002"),
+        ("completed", 1, "1002"),
+    ]
+    assert events[2].iteration == 200
+
+
+def test_next_segment_requeue(chain_env):
+    tmp_path, save_dir, env = chain_env
+    assert _run(_batch_script(tmp_path, save_dir, "requeue"), env, FAKE_ITER="200").returncode == 0
+    assert chain_state(read_chain(tmp_path)) == "next"
+    assert _calls(tmp_path) == ["scontrol requeue 1001"]
+
+
+def test_stalled_keeps_exit_status(chain_env):
+    tmp_path, save_dir, env = chain_env
+    # a crash without a new checkpoint stops the chain
+    (save_dir / TRACKER_FILE).write_text("200\n")
+    result = _run(_batch_script(tmp_path, save_dir, "dependency"), env, FAKE_EXIT="3")
+    assert result.returncode == 3
+    assert [(event.event, event.iteration) for event in read_chain(tmp_path)] == [("start", 200), ("stalled", 200)]
+    assert _calls(tmp_path) == []
+
+
+def test_segment_limit(chain_env):
+    tmp_path, save_dir, env = chain_env
+    (tmp_path / CHAIN_FILE).write_text(
+        "CHAIN start 0 1000 -1 1.0\nCHAIN next 0 1000 100 2.0\nCHAIN start 1 1001 100 3.0\nCHAIN next 1 1001 200 4.0\n"
+    )
+    assert _run(_batch_script(tmp_path, save_dir, "dependency", max_segments=3), env, FAKE_ITER="300").returncode == 0
+    events = read_chain(tmp_path)
+    assert [(event.event, event.segment) for event in events[4:]] == [("start", 2), ("limit", 2)]
+    assert _calls(tmp_path) == []
+
+
+def test_signal_saves_and_continues(chain_env):
+    tmp_path, save_dir, env = chain_env
+    script = _batch_script(tmp_path, save_dir, "dependency")
+    proc = subprocess.Popen(
+        ["bash", str(script)], env={**env, "FAKE_SLEEP": "30", "FAKE_SIGNAL_ITER": "300"}, stdout=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while not (save_dir / "running").exists():
+        assert time.monotonic() < deadline, "training stand-in did not start"
+        time.sleep(0.05)
+    # slurm's --signal=B:USR1@N, forwarded as SIGTERM to the training
+    proc.send_signal(signal.SIGUSR1)
+    assert proc.wait(timeout=20) == 0
+    assert [(event.event, event.iteration) for event in read_chain(tmp_path)] == [
+        ("start", -1),
+        ("signal", -1),
+        ("next", 300),
+    ]
+    assert _calls(tmp_path) == [f"sbatch --dependency=afterany:1001 {script}"]
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from megatron_train.extract_hydra import run_hydra, split_overrides
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / "config"
+
+OVERLAY = "megatron: {train_iters: 7, lr: 0.002}"
+
+
+def _compose(config_name: str, overrides: list[str], mode: str) -> dict:
+    return yaml.safe_load(
+        run_hydra(
+            config_path=str(CONFIG_DIR),
+            config_name=config_name,
+            cmdline_opts=overrides,
+            config_yaml=OVERLAY,
+            use_cache=False,
+            config_yaml_mode=mode,
+        )
+    )
+
+
+def test_split_overrides():
+    group, value = split_overrides(
+        ["+experiments@_global_=speed_test", "slurm=juwels", "slurm.nodes=2", "~megatron.lr", "hydra.job.chdir=true"],
+        str(CONFIG_DIR),
+    )
+    assert group == ["+experiments@_global_=speed_test", "slurm=juwels", "hydra.job.chdir=true"]
+    assert [override.input_line for override in value] == ["slurm.nodes=2", "~megatron.lr"]
+
+
+@pytest.mark.parametrize("mode", ["merge", "overrides"])
+def test_overlay_over_group_added_on_command_line(mode):
+    # speed_test sets train_iters 500, the overlay is merged after it
+    cfg = _compose("base", ["+experiments@_global_=speed_test"], mode)
+    assert cfg["megatron"]["train_iters"] == 7
+    assert cfg["megatron"]["split"] == "989,10,1"
+
+
+@pytest.mark.parametrize("mode", ["merge", "overrides"])
+def test_command_line_values_over_overlay(mode):
+    cfg = _compose("base", ["+experiments@_global_=speed_test", "megatron.train_iters=9", "~megatron.lr"], mode)
+    assert cfg["megatron"]["train_iters"] == 9
+    assert "lr" not in cfg["megatron"]
+
+
+def test_merge_matches_overrides():
+    for config_name, overrides in [("experiments/juwels", []), ("base", ["+experiments@_global_=speed_test"])]:
+        assert _compose(config_name, overrides, "merge") == _compose(config_name, overrides, "overrides")
@@ -0,0 +1,115 @@
+import os
+import re
+import stat
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from megatron_train.staging import cleanup_script, staging_plan, staging_script
+
+# stand-in for srun as node_cmd: records the command and runs it once (a single node)
+FAKE_SRUN = """#!/bin/bash
+while [[ $1 == -* ]]; do shift; done
+echo "srun $@" >> "$CALLS_FILE"
+exec "$@"
+"""
+
+# stand-in for a copy command that corrupts the .bin files
+CORRUPTING_COPY = """#!/bin/bash
+cp "$1" "$2"
+[[ $2 == *.bin ]] && echo corrupted >> "$2"
+exit 0
+"""
+
+# stand-in for the launch: reads the staged copies, then fails
+FAILING_LAUNCH = (
+    """bash -c 'cmp "$STAGE_DIR/data/1/merged.bin" "{shared}/b/merged.bin" && ls "$STAGE_DIR"/data/*/merged.idx; """
+    """exit 3'"""
+)
+
+
+def _executable(path: Path, content: str):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+
+@pytest.fixture
+def staging_env(tmp_path):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _executable(bin_dir / "srun", FAKE_SRUN)
+    _executable(bin_dir / "corrupting_copy", CORRUPTING_COPY)
+    # a shared filesystem path with a space, shards with equal file names
+    shared = tmp_path / "shared data"
+    for shard in ["a/merged", "b/merged"]:
+        (shared / shard).parent.mkdir(parents=True)
+        for suffix in [".idx", ".bin"]:
+            (shared / f"{shard}{suffix}").write_bytes(os.urandom(1000) + shard.encode() + suffix.encode())
+    (shared / "image.sif").write_bytes(os.urandom(5000))
+    (tmp_path / "out").mkdir()
+    env = {
+        **os.environ,
+        "PATH": f"{bin_dir}:{os.environ['PATH']}",
+        "CALLS_FILE": str(tmp_path / "calls"),
+        "SLURM_JOB_ID": "1001",
+    }
+    return tmp_path, shared, env
+
+
+def _batch_script(tmp_path: Path, shared: Path, launch: str, copy_cmd: str, node_cmd: str) -> Path:
+    image_file, data_files, _ = staging_plan(
+        "$STAGE_DIR", str(shared / "image.sif"), [str(shared / "a/merged"), str(shared / "b/merged")]
+    )
+    staging = staging_script(
+        str(tmp_path / "stage"), image_file, data_files, copy_cmd, node_cmd, "sha256sum", str(tmp_path / "out")
+    )
+    script = tmp_path / "train_megatron.sbatch"
+    script.write_text(f"#!/bin/bash\n{staging}\n{launch}\n{cleanup_script(node_cmd)}")
+    return script
+
+
+def _run(script: Path, env: dict[str, str]) -> subprocess.CompletedProcess:
+    return subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True, timeout=60)
+
+
+def _phases(stdout: str) -> list[str]:
+    return re.findall(r"^STAGING (\w+) \d+\.\d\ds$", stdout, flags=re.MULTILINE)
+
+
+@pytest.mark.parametrize("node_cmd", ["", "srun --ntasks-per-node=1"])
+def test_staging_keeps_launch_status(staging_env, node_cmd):
+    tmp_path, shared, env = staging_env
+    result = _run(
+        _batch_script(tmp_path, shared, FAILING_LAUNCH.format(shared=shared), "cp {src} {dst}", node_cmd), env
+    )
+    assert result.returncode == 3, result.stdout + result.stderr
+    phases = ["mkdir", "image_copy", "image_checksum", "data_copy", "data_checksum", "cleanup"]
+    assert _phases(result.stdout) == phases
+    assert result.stdout.count("merged.idx") == 2
+    assert not (tmp_path / "stage").exists()
+    # one checksum list per phase, with the staged names
+    data_list = (tmp_path / "out" / "staging_data_1001.sha256sum").read_text().splitlines()
+    assert [line.split("  ", 1)[1] for line in data_list] == [
+        f"{tmp_path}/stage/data/{n}/merged{suffix}" for n in range(2) for suffix in [".idx", ".bin"]
+    ]
+    calls = (tmp_path / "calls").read_text().splitlines() if node_cmd else []
+    assert [call.split()[1] for call in calls] == (["mkdir", "sha256sum", "sha256sum", "rm"] if node_cmd else [])
+
+
+def test_staging_checksum_mismatch(staging_env):
+    tmp_path, shared, env = staging_env
+    result = _run(_batch_script(tmp_path, shared, "echo launched", "corrupting_copy {src} {dst}", ""), env)
+    assert result.returncode == 1
+    assert _phases(result.stdout) == ["mkdir", "image_copy", "image_checksum", "data_copy"]
+    assert "STAGING data_checksum failed" in result.stdout
+    assert "launched" not in result.stdout
+
+
+def test_staging_copy_failure(staging_env):
+    tmp_path, shared, env = staging_env
+    (shared / "b/merged.idx").unlink()
+    result = _run(_batch_script(tmp_path, shared, "echo launched", "cp {src} {dst}", ""), env)
+    assert result.returncode == 1
+    assert "STAGING data_copy failed" in result.stdout
+    assert "launched" not in result.stdout
@@ -0,0 +1,127 @@
+import argparse
+import enum
+import os
+import pickle
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from megatron_train.config import MegatronArgSchema
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# stand-in for megatron.training.arguments: the arguments of config/megatron/base_empty.yaml, with an Enum default
+# and a lambda type as in Megatron's --attention-backend
+FAKE_ARGUMENTS = """
+import enum
+
+import yaml
+
+
+class AttnBackend(enum.Enum):
+    flash = 1
+    fused = 2
+    unfused = 3
+    local = 4
+    auto = 5
+
+
+INTS = {{"micro_batch_size", "global_batch_size", "train_iters", "num_layers", "hidden_size", "ffn_hidden_size",
+        "kv_channels", "num_attention_heads", "num_query_groups", "seq_length", "max_position_embeddings",
+        "num_experts", "moe_router_topk", "exit_duration_in_mins", "exit_interval", "save_interval", "log_interval",
+        "virtual_pipeline_model_parallel_size", "num_layers_per_virtual_pipeline_stage", "vocab_size", "seed",
+        "eval_iters", "eval_interval", "lr_warmup_iters", "recompute_num_layers", "expert_tensor_parallel_size",
+        "decoder_first_pipeline_num_layers", "decoder_last_pipeline_num_layers", "padded_vocab_size"}}
+
+
+def add_megatron_arguments(parser):
+    with open({base_empty!r}) as fp:
+        defaults = yaml.safe_load(fp)
+    for key, value in defaults.items():
+        option = "--" + key.replace("_", "-")
+        if key == "attention_backend":
+            parser.add_argument(
+                option, type=lambda x: AttnBackend[x], default=AttnBackend.auto, choices=list(AttnBackend)
+            )
+        elif isinstance(value, bool):
+            if value:
+                parser.add_argument("--no-" + key.replace("_", "-"), dest=key, action="store_false")
+            else:
+                parser.add_argument(option, action="store_true")
+        elif isinstance(value, list):
+            parser.add_argument(option, nargs="*", default=value, type=type(value[0]) if value else str)
+        elif key.endswith("data_path"):
+            parser.add_argument(option, nargs="*", default=value)
+        elif value is None:
+            parser.add_argument(option, default=None, type=int if key in INTS else float if "lr" in key else str)
+        else:
+            parser.add_argument(option, type=type(value), default=value)
+    return parser
+"""
+
+# the start method is set before run_megatron is imported, the workers import it from script/
+SPAWN_MAIN = """
+import multiprocessing
+import sys
+
+sys.path.insert(0, "script")
+multiprocessing.set_start_method("spawn")
+import run_megatron
+
+sys.argv = ["run_megatron.py"] + sys.argv[1:]
+run_megatron.main()
+"""
+
+
+class Backend(enum.Enum):
+    flash = 1
+    auto = 5
+
+
+@pytest.fixture
+def fake_megatron(tmp_path):
+    package = tmp_path / "fake_megatron" / "megatron" / "training"
+    package.mkdir(parents=True)
+    (package.parent / "__init__.py").touch()
+    (package / "__init__.py").touch()
+    (package / "arguments.py").write_text(
+        FAKE_ARGUMENTS.format(base_empty=str(ROOT_DIR / "config" / "megatron" / "base_empty.yaml"))
+    )
+    return tmp_path / "fake_megatron"
+
+
+def test_schema_pickles():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attention-backend", type=lambda x: Backend[x], default=Backend.auto)
+    parser.add_argument("--num-layers", type=int, default=2)
+    schema = MegatronArgSchema.from_parser(parser, key="k")
+    restored = pickle.loads(pickle.dumps(schema))
+    assert restored.to_json() == schema.to_json()
+    # the decoded Enum is recreated, its members pickle as well and keep repr() / str()
+    backend = restored.defaults["attention_backend"]
+    assert repr(backend) == "<Backend.auto: 5>" and str(backend) == "Backend.auto"
+    assert pickle.loads(pickle.dumps(backend)) is backend
+    assert pickle.loads(pickle.dumps(restored)).defaults["attention_backend"] is backend
+
+
+def test_sweep_spawn(tmp_path, fake_megatron):
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(ROOT_DIR / "src"), str(fake_megatron)]),
+        "MEGATRON_TRAIN_CACHE_DIR": str(tmp_path / "cache"),
+        "OUTPUT_DIR": str(tmp_path / "out"),
+        "SLURM_ACCOUNT": "account",
+        "SLURM_PARTITION": "booster",
+        "SUBMIT_TIMESTAMP": "20250101_000000",
+    }
+    cmd = [sys.executable, "-c", SPAWN_MAIN, "--sweep", "--debug", "--sweep-workers", "2"]
+    cmd += ["--config-name", "experiments/speed_test_jupiter", "slurm.nodes=1,2"]
+    # cold and warm schema cache
+    for _ in range(2):
+        result = subprocess.run(cmd, cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=300)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.count("SLURM_SCRIPT:") == 2
+        assert "#SBATCH --nodes=1\n" in result.stdout and "#SBATCH --nodes=2\n" in result.stdout
+        assert result.stdout.count("--attention-backend auto") == 2
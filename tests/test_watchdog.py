@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import os
+import shlex
+import stat
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from megatron_train.job_log import watch_job
+from megatron_train.watchdog import DUMP_CMD, WatchdogSettings, add_watchdog_args, watchdog_script, watchdog_settings
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# stand-in for scancel: records its arguments and ends the hanging training, if there is one
+FAKE_SCANCEL = """#!/bin/bash
+echo "scancel $@" >> "$CALLS_FILE"
+[ -f "$SRUN_PID_FILE" ] && kill "$(cat "$SRUN_PID_FILE")"
+exit 0
+"""
+
+# stand-in for the training step: logs a few iterations (slow enough for the watchdog to see each), then hangs
+FAKE_SRUN = """#!/bin/bash
+echo $$ > "$SRUN_PID_FILE"
+for i in 1 2 3 4 5 6 7 8; do
+    sleep 0.3
+    echo " iteration $i/ 100 | elapsed time per iteration (ms): 300.0 | global batch size: 64 |" >> "$LOG"
+done
+exec sleep 60
+"""
+
+
+def _executable(path: Path, content: str):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+
+
+def _iteration_line(iteration: int, train_iters: int = 100) -> str:
+    return f" iteration {iteration}/ {train_iters} | elapsed time per iteration (ms): 50.0 | global batch size: 64 |\n"
+
+
+@pytest.fixture
+def scancel(tmp_path, monkeypatch):
+    monkeypatch.setenv("CALLS_FILE", str(tmp_path / "calls"))
+    monkeypatch.setenv("SRUN_PID_FILE", str(tmp_path / "srun.pid"))
+    _executable(tmp_path / "scancel", FAKE_SCANCEL)
+    return tmp_path / "scancel"
+
+
+def _calls(tmp_path: Path) -> list[str]:
+    calls = tmp_path / "calls"
+    return calls.read_text().splitlines() if calls.exists() else []
+
+
+def _settings(scancel: Path, **kwargs) -> WatchdogSettings:
+    return WatchdogSettings(
+        **{"startup_grace": 5.0, "stall_factor": 3.0, "min_stall": 0.5, "dump_cmd": "echo dump {jobid}", **kwargs},
+        scancel_cmd=str(scancel),
+    )
+
+
+async def _write_then_stop(log: Path, iterations: int, interval: float) -> float:
+    for iteration in range(1, iterations + 1):
+        await asyncio.sleep(interval)
+        with open(log, "a") as fp:
+            fp.write(_iteration_line(iteration))
+    return time.monotonic()
+
+
+async def _watch_writer(log: Path, settings: WatchdogSettings) -> tuple[str | None, float, float]:
+    watch = asyncio.create_task(watch_job("42", settings, stdout=str(log), interval=0.05, slurm_interval=None))
+    stopped = await _write_then_stop(log, 10, 0.05)
+    reason = await asyncio.wait_for(watch, timeout=30)
+    return reason, stopped, time.monotonic()
+
+
+def _diagnostics(tmp_path: Path) -> Path:
+    (directory,) = tmp_path.glob("hang_42_*")
+    return directory
+
+
+def test_stall_cancels_and_captures(tmp_path, scancel):
+    log = tmp_path / "42.out"
+    log.touch()
+    reason, stopped, detected = asyncio.run(_watch_writer(log, _settings(scancel)))
+    assert reason.startswith("no new iteration line")
+    # the threshold is min_stall, 3 x 50ms per logged interval is below
+    assert detected - stopped >= 0.5
+    assert _calls(tmp_path) == ["scancel 42"]
+    directory = _diagnostics(tmp_path)
+    assert sorted(path.name for path in directory.iterdir()) == ["log_tail.txt", "py_spy.txt", "reason.txt"]
+    assert (directory / "reason.txt").read_text() == f"job 42: {reason}\n"
+    assert (directory / "log_tail.txt").read_text().splitlines()[-1] == _iteration_line(10).rstrip("\n")
+    assert (directory / "py_spy.txt").read_text() == "dump 42\n"
+
+
+def test_dry_run_does_not_cancel(tmp_path, scancel):
+    log = tmp_path / "42.out"
+    log.touch()
+    reason, _, _ = asyncio.run(
+        _watch_writer(log, _settings(scancel, dry_run=True, diagnostics_dir=str(tmp_path / "d")))
+    )
+    assert reason.startswith("no new iteration line")
+    assert _calls(tmp_path) == []
+    assert (_diagnostics(tmp_path / "d") / "reason.txt").exists()
+
+
+def test_startup_grace(tmp_path, scancel):
+    log = tmp_path / "42.out"
+    log.touch()
+    settings = _settings(scancel, startup_grace=0.3, dump_cmd=None)
+    reason = asyncio.run(watch_job("42", settings, stdout=str(log), interval=0.05, slurm_interval=None))
+    assert reason == "no iteration line within the startup grace of 0s"
+    assert _calls(tmp_path) == ["scancel 42"]
+    assert sorted(path.name for path in _diagnostics(tmp_path).iterdir()) == ["log_tail.txt", "reason.txt"]
+
+
+@pytest.mark.parametrize("dump_cmd", ["echo dump {jobid}", None, DUMP_CMD])
+def test_sidecar_dump_cmd(dump_cmd):
+    setup, _ = watchdog_script("python watch_job.py", "/out/%j.out", WatchdogSettings(dump_cmd=dump_cmd))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobid")
+    parser.add_argument("--log")
+    parser.add_argument("--slurm-interval", type=float)
+    add_watchdog_args(parser)
+    args = parser.parse_args(shlex.split(setup.splitlines()[1].removesuffix(" &"))[2:])
+    assert watchdog_settings(args).dump_cmd == dump_cmd
+
+
+@pytest.mark.parametrize("dump_cmd", ["echo dump {jobid}", None])
+def test_sidecar_cancels_hanging_srun(tmp_path, scancel, dump_cmd):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _executable(bin_dir / "srun", FAKE_SRUN)
+    cmd = f"PYTHONPATH={ROOT_DIR / 'src'} {sys.executable} {ROOT_DIR / 'script' / 'watch_job.py'} --interval 0.1"
+    setup, after = watchdog_script(cmd, str(tmp_path / "%j.out"), _settings(scancel, dump_cmd=dump_cmd))
+    script = tmp_path / "train_megatron.sbatch"
+    script.write_text(f"#!/bin/bash\n{setup}\nsrun python pretrain_gpt.py\n{after}")
+    env = {
+        **os.environ,
+        "PATH": f"{bin_dir}:{os.environ['PATH']}",
+        "SLURM_JOB_ID": "42",
+        "LOG": str(tmp_path / "42.out"),
+        "PYTHONUNBUFFERED": "1",
+    }
+    result = subprocess.run(["bash", str(script)], env=env, capture_output=True, text=True, timeout=60)
+    # srun was killed by the stand-in scancel, its exit status is kept
+    assert result.returncode == 128 + 15
+    assert _calls(tmp_path) == ["scancel 42"]
+    assert "Job 42 stalled: no new iteration line" in result.stdout
+    py_spy = _diagnostics(tmp_path) / "py_spy.txt"
+    if dump_cmd:
+        assert py_spy.read_text() == "dump 42\n"
+    else:
+        assert not py_spy.exists()